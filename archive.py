@@ -0,0 +1,199 @@
+"""
+Compressed campaign archives.
+
+An archive is a zip file holding every store of a campaign (the JSON and
+JSON Lines files and the tables folder), each one compressed on its own
+with deflate (gzip's algorithm) or, with --codec lzma, LZMA, plus an
+index.json listing each store's size and SHA-256. Because every store is
+its own member, one store can be read without touching the others, and it
+is decompressed as it is read rather than unpacked to disk first.
+
+    python archive.py pack [data folder] campaign.zip [--codec gzip|lzma]
+    python archive.py list campaign.zip
+    python archive.py unpack campaign.zip [data folder] [--only characters.json ...]
+
+Files are stored byte for byte, so unpacking gives back exactly what was
+packed; unpacking checks every file against the index before replacing
+anything in the data folder. Deflate decodes about twice as fast as LZMA for
+much the same size on campaign JSON, so it is the default; LZMA squeezes
+out a little more for copying big campaigns around.
+"""
+import argparse
+import contextlib
+import hashlib
+import io
+import json
+import os
+import sys
+import time
+import zipfile
+
+ARCHIVE_VERSION = 1
+INDEX_NAME = "index.json"
+CODECS = {"gzip": zipfile.ZIP_DEFLATED, "lzma": zipfile.ZIP_LZMA}
+CHUNK_SIZE = 1 << 20
+
+
+def campaign_files(folder):
+    """Relative paths (with / separators) of the data files in folder, sorted."""
+    names = [name for name in os.listdir(folder)
+             if name.endswith((".json", ".jsonl")) and os.path.isfile(os.path.join(folder, name))]
+    tables = os.path.join(folder, "tables")
+    if os.path.isdir(tables):
+        for root, _, files in os.walk(tables):
+            for name in files:
+                names.append(os.path.relpath(os.path.join(root, name), folder).replace(os.sep, "/"))
+    return sorted(names)
+
+
+def pack(folder, path, codec="gzip"):
+    """
+    Pack every data file in folder into the archive at path, streaming each file through the compressor.
+
+    Returns:
+    dict: The archive index.
+    """
+    if codec not in CODECS:
+        raise ValueError(f"unknown codec '{codec}' (use {' or '.join(CODECS)})")
+    index = {"version": ARCHIVE_VERSION, "codec": codec, "created": time.strftime("%Y-%m-%dT%H:%M:%S"), "stores": {}}
+    temporary = path + ".tmp"
+    with zipfile.ZipFile(temporary, "w", compression=CODECS[codec]) as bundle:
+        for name in campaign_files(folder):
+            digest, size = hashlib.sha256(), 0
+            with open(os.path.join(folder, name), "rb") as source, bundle.open(name, "w") as member:
+                for chunk in iter(lambda: source.read(CHUNK_SIZE), b""):
+                    digest.update(chunk)
+                    size += len(chunk)
+                    member.write(chunk)
+            index["stores"][name] = {"size": size, "sha256": digest.hexdigest()}
+        bundle.writestr(INDEX_NAME, json.dumps(index, indent=4))
+    os.replace(temporary, path)
+    return index
+
+
+def read_index(path):
+    try:
+        with zipfile.ZipFile(path) as bundle:
+            index = json.loads(bundle.read(INDEX_NAME))
+    except (zipfile.BadZipFile, KeyError, json.JSONDecodeError) as e:
+        raise ValueError(f"{path} is not a campaign archive ({e})")
+    if index.get("version") != ARCHIVE_VERSION:
+        raise ValueError(f"{path} is archive version {index.get('version')}, expected {ARCHIVE_VERSION}")
+    return index
+
+
+@contextlib.contextmanager
+def open_store(path, name):
+    """A text stream over one store, decompressed as it is read."""
+    try:
+        bundle = zipfile.ZipFile(path)
+    except zipfile.BadZipFile as e:
+        raise ValueError(f"{path} is not a campaign archive ({e})")
+    with bundle:
+        try:
+            member = bundle.open(name)
+        except KeyError:
+            raise ValueError(f"{path} has no store named {name}")
+        with io.TextIOWrapper(member, encoding="utf-8") as stream:
+            yield stream
+
+
+def load_store(path, name):
+    """One store's data: the parsed JSON, or a list of records for a JSON Lines file."""
+    with open_store(path, name) as stream:
+        if name.endswith(".jsonl"):
+            return [json.loads(line) for line in stream if line.strip()]
+        return json.load(stream)
+
+
+def unpack(path, folder, names=None):
+    """
+    Write the stores of the archive (or just names) into folder.
+
+    Every file is decompressed to a temporary file and checked against the
+    index first; nothing in folder is replaced unless all of them match.
+
+    Returns:
+    list: The names written.
+    """
+    index = read_index(path)
+    names = list(index["stores"]) if names is None else names
+    for name in names:
+        if name not in index["stores"]:
+            raise ValueError(f"{path} has no store named {name}")
+        if os.path.isabs(name) or ".." in name.split("/"):
+            raise ValueError(f"refusing to unpack {name} outside {folder}")
+    written = []
+    try:
+        with zipfile.ZipFile(path) as bundle:
+            for name in names:
+                target = os.path.join(folder, *name.split("/"))
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                digest = hashlib.sha256()
+                with bundle.open(name) as member, open(target + ".tmp", "wb") as out:
+                    written.append(name)
+                    for chunk in iter(lambda: member.read(CHUNK_SIZE), b""):
+                        digest.update(chunk)
+                        out.write(chunk)
+                if digest.hexdigest() != index["stores"][name]["sha256"]:
+                    raise ValueError(f"{name} in {path} doesn't match its checksum")
+        for name in written:
+            target = os.path.join(folder, *name.split("/"))
+            os.replace(target + ".tmp", target)
+        return written
+    finally:
+        for name in written:
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(os.path.join(folder, *name.split("/")) + ".tmp")
+
+
+def describe(path):
+    """Lines listing each store with its size before and after compression."""
+    index = read_index(path)
+    with zipfile.ZipFile(path) as bundle:
+        compressed = {info.filename: info.compress_size for info in bundle.infolist()}
+    lines = [f"{path}: {len(index['stores'])} store(s), {index['codec']}, packed {index['created']}"]
+    total, packed = 0, 0
+    for name, entry in index["stores"].items():
+        total, packed = total + entry["size"], packed + compressed[name]
+        lines.append(f"  {name:<32}{entry['size']:>12,} -> {compressed[name]:>10,} bytes")
+    if total:
+        lines.append(f"  {'total':<32}{total:>12,} -> {packed:>10,} bytes ({packed / total:.0%})")
+    return lines
+
+
+def main(argv=None):
+    default_folder = os.environ.get("PLAYASSIST_DATA_DIR", os.path.dirname(os.path.abspath(__file__)))
+    parser = argparse.ArgumentParser(description="Pack, list and unpack compressed campaign archives.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    pack_parser = commands.add_parser("pack", help="pack a data folder into an archive")
+    pack_parser.add_argument("paths", nargs="+", metavar="[folder] archive")
+    pack_parser.add_argument("--codec", choices=list(CODECS), default="gzip")
+    list_parser = commands.add_parser("list", help="list the stores in an archive")
+    list_parser.add_argument("archive")
+    unpack_parser = commands.add_parser("unpack", help="unpack an archive into a data folder")
+    unpack_parser.add_argument("archive")
+    unpack_parser.add_argument("folder", nargs="?", default=default_folder)
+    unpack_parser.add_argument("--only", nargs="+", help="unpack just these stores")
+    args = parser.parse_args(argv)
+
+    try:
+        if args.command == "pack":
+            if len(args.paths) > 2:
+                parser.error("pack takes at most a folder and an archive")
+            folder, path = args.paths if len(args.paths) == 2 else (default_folder, args.paths[0])
+            pack(folder, path, args.codec)
+            print("\n".join(describe(path)))
+        elif args.command == "list":
+            print("\n".join(describe(args.archive)))
+        else:
+            written = unpack(args.archive, args.folder, args.only)
+            print(f"Unpacked {len(written)} store(s) into {args.folder}.")
+    except (ValueError, OSError) as e:
+        print(f"Error: {e}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
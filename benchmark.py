@@ -0,0 +1,302 @@
+"""
+Benchmarks for playAssist.
+
+Generates a synthetic campaign (characters, spells, weapons, NPCs, guilds,
+the bag and a wild magic table) in the same JSON layout the real files use,
+points playAssist at it and times the real entry points. Results are
+written as JSON so runs from different versions can be compared.
+
+    python benchmark.py
+    python benchmark.py --scale 10 1000 100000 --output bench_results.json
+
+It also times a one-off `playassist "perception check"` from a fresh
+interpreter, start to finish, and exits with status 1 if that goes over the
+start-up budget at the smallest scale (--startup-budget-ms), so a change
+that makes the CLI slow to start is caught.
+"""
+import argparse
+import contextlib
+import importlib
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+
+ABILITIES = ["strength", "dexterity", "constitution", "intelligence", "wisdom", "charisma"]
+SKILLS = [
+    "athletics", "acrobatics", "sleight of hand", "stealth", "arcana", "history", "investigation",
+    "nature", "religion", "animal handling", "insight", "medicine", "perception", "survival",
+    "deception", "intimidation", "performance", "persuasion"
+]
+CLASSES = ["Fighter", "Rogue", "Wizard", "Cleric", "Paladin", "Druid", "Bard", "Monk", "Paladin/Barbarian", "Fighter/Bard"]
+RACES = ["Human", "Elf", "Dwarf", "Half-Elf", "Tiefling", "Goliath", "Dragonborn"]
+TIMES = ["action", "Action", "bonus action", "reaction", "1 action", "1 bonus action", "1 reaction", "Instant", "1 minute"]
+DAMAGE_TYPES = ["slashing", "piercing", "bludgeoning", "fire", "cold", "radiant"]
+WORDS = ("the target must succeed on a saving throw or take damage and be pushed away "
+         "from you while bright light fills the area until the spell ends").split()
+
+
+def sentence(rng, length=24):
+    return " ".join(rng.choice(WORDS) for _ in range(length)).capitalize() + "."
+
+
+def make_spell(rng, index):
+    damage = rng.random() < 0.5
+    return {
+        "spell_class": rng.choice(CLASSES),
+        "spell_save": rng.choice(ABILITIES) if damage else None,
+        "spell_save_dc": rng.randint(10, 18) if damage else None,
+        "level": rng.randint(0, 9),
+        "spell_name": f"Spell {index}",
+        "description": sentence(rng, 60),
+        "casting_time": rng.choice(TIMES),
+        "range": rng.choice(["Self", "Touch", "30 feet", "60 feet", "120 feet"]),
+        "components": rng.choice(["V", "V, S", "V, S, M"]),
+        "duration": rng.choice(["Instantaneous", "1 minute", "Concentration, up to 1 minute", "1 hour"]),
+        "damage_dice": f"{rng.randint(1, 8)}d{rng.choice([4, 6, 8, 10, 12])}" if damage else None,
+        "spell_type": "Damage" if damage else "Other"
+    }
+
+
+def make_weapon(rng, index):
+    return {
+        "name": f"Weapon {index}",
+        "attack_bonus": rng.randint(2, 10),
+        "damage": f"{rng.randint(1, 2)}d{rng.choice([4, 6, 8, 10, 12])}+{rng.randint(0, 5)}",
+        "damage_type": rng.choice(DAMAGE_TYPES),
+        "notes": rng.choice(["", "none", "3 charges per LR", "+1 (magic)"])
+    }
+
+
+def make_abilities(rng, prefix, count):
+    return {
+        f"{prefix} {i}": {"time": rng.choice(TIMES), "description": sentence(rng)}
+        for i in range(count)
+    }
+
+
+def make_character(rng, index, spell_list, weapon_count):
+    spells = []
+    for spell in rng.sample(spell_list, min(len(spell_list), 4)):
+        spells.append({
+            "level": spell["level"],
+            "name": spell["spell_name"],
+            "casting_time": spell["casting_time"],
+            "description": spell["description"],
+            "range": spell["range"],
+            "components": spell["components"],
+            "duration": spell["duration"]
+        })
+    return {
+        "name": f"Character {index}",
+        "race": rng.choice(RACES),
+        "sub_race": "",
+        "char_class": rng.choice(CLASSES),
+        "level": rng.randint(1, 20),
+        "sub_class": "",
+        "ability_modifiers": {ability: rng.randint(-1, 5) for ability in ABILITIES},
+        "proficiencies": rng.sample(SKILLS, 4),
+        "god": "",
+        "proficiency_bonus": rng.randint(2, 6),
+        "saving_throws": rng.sample(ABILITIES, 2),
+        "notes": "\n".join(sentence(rng, 10) for _ in range(rng.randint(0, 3))),
+        "weapons": [f"weapon {rng.randrange(weapon_count)}" for _ in range(2)],
+        "race_abilities": make_abilities(rng, "Race Ability", 1),
+        "class_abilities": make_abilities(rng, "Class Ability", 3),
+        "spells": spells
+    }
+
+
+def make_guild(rng, index, npc_count, guild_count):
+    return {
+        "name": f"Guild {index}",
+        "town": f"Town {rng.randrange(max(1, guild_count // 10))}",
+        "headquarters": f"Hall {index}",
+        "leader": f"NPC {rng.randrange(npc_count)}",
+        "members": [f"NPC {rng.randrange(npc_count)}" for _ in range(5)],
+        "symbols": "A crossed pair of keys",
+        "colors": "Red and gold",
+        "allies": [f"Guild {rng.randrange(guild_count)}" for _ in range(2)],
+        "enemies": [f"Guild {rng.randrange(guild_count)}" for _ in range(2)]
+    }
+
+
+def generate_campaign(directory, scale, seed=0):
+    """Write a synthetic campaign with `scale` records in every store into `directory`."""
+    rng = random.Random(seed)
+    spell_list = [make_spell(rng, i) for i in range(scale)]
+    stores = {
+        "spells.json": spell_list,
+        "weapons.json": [make_weapon(rng, i) for i in range(scale)],
+        "characters.json": [make_character(rng, i, spell_list, scale) for i in range(scale)],
+        "npcs.json": [{"name": f"NPC {i}", "notes": sentence(rng)} for i in range(scale)],
+        "guilds.json": [make_guild(rng, i, scale, scale) for i in range(scale)],
+        "bag_of_holding.json": {"items": [f"Item {i}" for i in range(scale)]},
+        "wild_magic_table.json": {str(i): sentence(rng, 12) for i in range(1, 101)}
+    }
+    for filename, data in stores.items():
+        with open(os.path.join(directory, filename), "w") as f:
+            json.dump(data, f, indent=4)
+
+
+def measure(func, repeat):
+    """Run func `repeat` times and return timing statistics in milliseconds."""
+    samples = []
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        for _ in range(repeat):
+            start = time.perf_counter()
+            func()
+            samples.append((time.perf_counter() - start) * 1000)
+    return {
+        "runs": repeat,
+        "min_ms": min(samples),
+        "median_ms": statistics.median(samples),
+        "mean_ms": statistics.fmean(samples),
+        "max_ms": max(samples)
+    }
+
+
+def measure_import(directory, repeat, use_snapshot=False):
+    """
+    Time `import playAssist` in a fresh interpreter, which includes loading every store.
+
+    With use_snapshot the snapshot cache is written by an untimed first run
+    and then read by the timed ones; otherwise every run parses the JSON.
+    """
+    code = (
+        "import time; start = time.perf_counter(); import playAssist; "
+        "print((time.perf_counter() - start) * 1000)"
+    )
+    env = dict(os.environ, PLAYASSIST_DATA_DIR=directory, PLAYASSIST_SNAPSHOT="1" if use_snapshot else "0")
+    if use_snapshot:
+        subprocess.run([sys.executable, "-c", code], cwd=REPO_DIR, env=env, capture_output=True, check=True)
+    samples = []
+    for _ in range(repeat):
+        output = subprocess.run([sys.executable, "-c", code], cwd=REPO_DIR, env=env,
+                                capture_output=True, text=True, check=True).stdout
+        samples.append(float(output.strip().splitlines()[-1]))
+    return {
+        "runs": repeat,
+        "min_ms": min(samples),
+        "median_ms": statistics.median(samples),
+        "mean_ms": statistics.fmean(samples),
+        "max_ms": max(samples)
+    }
+
+
+def measure_startup(directory, repeat, command="perception check"):
+    """Wall time of running one command through the playassist entry point, interpreter start-up included."""
+    env = dict(os.environ, PLAYASSIST_DATA_DIR=directory, PLAYASSIST_SNAPSHOT="1")
+    args = [sys.executable, os.path.join(REPO_DIR, "playassist"), command]
+    # The first run writes the snapshot and the bytecode cache, as the first run after an edit would.
+    subprocess.run(args, cwd=directory, env=env, capture_output=True, check=True)
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run(args, cwd=directory, env=env, capture_output=True, check=True)
+        samples.append((time.perf_counter() - start) * 1000)
+    return {
+        "runs": repeat,
+        "min_ms": min(samples),
+        "median_ms": statistics.median(samples),
+        "mean_ms": statistics.fmean(samples),
+        "max_ms": max(samples)
+    }
+
+
+def load_module(directory):
+    os.environ["PLAYASSIST_DATA_DIR"] = directory
+    if REPO_DIR not in sys.path:
+        sys.path.insert(0, REPO_DIR)
+    sys.modules.pop("playAssist", None)
+    return importlib.import_module("playAssist")
+
+
+def run_scale(scale, seed, import_runs):
+    with tempfile.TemporaryDirectory(prefix="playassist-bench-") as directory:
+        generate_campaign(directory, scale, seed)
+        results = {
+            "import": measure_import(directory, import_runs),
+            "import_snapshot": measure_import(directory, import_runs, use_snapshot=True),
+            "startup_check": measure_startup(directory, import_runs)
+        }
+
+        import archive
+        bundle = os.path.join(directory, "campaign.zip")
+        archive.pack(directory, bundle)
+
+        os.environ["PLAYASSIST_SNAPSHOT"] = "0"
+        module = load_module(directory)
+        repeat = max(3, min(50, 20000 // scale))
+        name = module.characters[-1].name
+        cases = {
+            "load_characters": module.load_characters,
+            "load_spells": module.load_spells,
+            "archive_load_characters": lambda: archive.load_store(bundle, "characters.json"),
+            "find_character_by_name": lambda: module.find_character_by_name(name),
+            "get_best_character_for_stat": lambda: module.get_best_character_for_stat("perception"),
+            "handle_player_turn_command": lambda: module.handle_player_turn_command(name.split() + ["turn"]),
+            "handle_info_command": lambda: module.handle_info_command(name),
+            "save_to_file": lambda: module.save_to_file(module.characters, "characters.json")
+        }
+        for case, func in cases.items():
+            results[case] = measure(func, repeat)
+        sys.modules.pop("playAssist", None)
+    return results
+
+
+def git_version():
+    try:
+        return subprocess.run(["git", "describe", "--always", "--dirty"], cwd=REPO_DIR,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark playAssist against synthetic campaigns.")
+    parser.add_argument("--scale", type=int, nargs="+", default=[10, 1000],
+                        help="number of records per store (default: 10 1000)")
+    parser.add_argument("--seed", type=int, default=0, help="seed for the campaign generator")
+    parser.add_argument("--import-runs", type=int, default=3, help="fresh interpreters per import timing")
+    parser.add_argument("--output", default="bench_results.json", help="where to write the JSON results")
+    parser.add_argument("--startup-budget-ms", type=float, default=200,
+                        help="fail if 'playassist \"perception check\"' takes longer than this at the smallest scale")
+    args = parser.parse_args(argv)
+
+    report = {
+        "version": git_version(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "seed": args.seed,
+        "results": {}
+    }
+    for scale in args.scale:
+        print(f"Benchmarking {scale} records per store...")
+        results = run_scale(scale, args.seed, args.import_runs)
+        report["results"][str(scale)] = results
+        for case, stats in results.items():
+            print(f"  {case:<28} median {stats['median_ms']:10.3f} ms  (min {stats['min_ms']:.3f}, {stats['runs']} runs)")
+
+    startup = report["results"][str(min(args.scale))]["startup_check"]["median_ms"]
+    report["startup_budget_ms"] = args.startup_budget_ms
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=4)
+    print(f"Results written to {args.output}")
+    if startup > args.startup_budget_ms:
+        print(f"Start-up over budget: 'playassist \"perception check\"' took {startup:.1f} ms "
+              f"at {min(args.scale)} records (budget {args.startup_budget_ms:.0f} ms).")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,159 @@
+"""
+Tab completion for the command prompt.
+
+Names live in a prefix trie that is kept up to date as things are added,
+renamed, imported or undone, so completing a name only walks the letters
+typed so far plus the matches it returns, however many names there are.
+readline is optional: without it (e.g. on Windows without pyreadline)
+the prompt works exactly as before, just without completion.
+"""
+MAX_MATCHES = 100
+
+
+class TrieNode:
+    __slots__ = ("children", "names")
+
+    def __init__(self):
+        self.children = {}
+        # Display name -> how many things carry it, so duplicates can be removed one at a time.
+        self.names = None
+
+
+class Trie:
+    """Case-insensitive prefix trie of display names."""
+
+    def __init__(self, names=()):
+        self.root = TrieNode()
+        for name in names:
+            self.insert(name)
+
+    def insert(self, name):
+        if not name:
+            return
+        node = self.root
+        for char in name.lower():
+            node = node.children.setdefault(char, TrieNode())
+        if node.names is None:
+            node.names = {}
+        node.names[name] = node.names.get(name, 0) + 1
+
+    def remove(self, name):
+        if not name:
+            return
+        path = [self.root]
+        for char in name.lower():
+            node = path[-1].children.get(char)
+            if node is None:
+                return
+            path.append(node)
+        node = path[-1]
+        if not node.names or name not in node.names:
+            return
+        node.names[name] -= 1
+        if not node.names[name]:
+            del node.names[name]
+        if not node.names:
+            node.names = None
+        # Prune the branch back to the last node that still leads somewhere.
+        for char, (parent, child) in zip(reversed(name.lower()), zip(reversed(path[:-1]), reversed(path[1:]))):
+            if child.children or child.names:
+                break
+            del parent.children[char]
+
+    def find_node(self, prefix):
+        node = self.root
+        for char in prefix.lower():
+            node = node.children.get(char)
+            if node is None:
+                return None
+        return node
+
+    def complete(self, prefix, limit=MAX_MATCHES):
+        """Names starting with prefix, shortest first, at most `limit` of them."""
+        start = self.find_node(prefix)
+        if start is None:
+            return []
+        matches, level = [], [start]
+        while level and len(matches) < limit:
+            next_level = []
+            for node in level:
+                if node.names:
+                    matches.extend(sorted(node.names))
+                next_level.extend(node.children[char] for char in sorted(node.children))
+            level = next_level
+        return matches[:limit]
+
+    def names_prefixing(self, text):
+        """(name, length) for every name that text starts with, followed by a space."""
+        node, found = self.root, []
+        lowered = text.lower()
+        for position, char in enumerate(lowered):
+            if char == " " and node.names:
+                found.extend((name, position) for name in node.names)
+            node = node.children.get(char)
+            if node is None:
+                break
+        return found
+
+
+class LineCompleter:
+    """
+    Completes the whole input line: command keywords, names, the suffix
+    after a name ("Velza tu" -> "Velza turn") and the name after commands
+    that take one ("who reacts to Sil" -> "who reacts to Silver Hand").
+    """
+
+    def __init__(self, commands, suffixes, name_commands, get_trie):
+        """get_trie is called on every completion, so the trie can be built on the first Tab press."""
+        self.commands = sorted(commands)
+        self.suffixes = sorted(suffixes)
+        self.name_commands = sorted(name_commands, key=len, reverse=True)
+        self.get_trie = get_trie
+        self.matches = []
+
+    def complete_names(self, before, text):
+        # Keep what was typed before the name exactly as it was.
+        return [before + name for name in self.get_trie().complete(text)]
+
+    def candidates(self, line):
+        lowered = line.lower()
+        trie = self.get_trie()
+        matches = [command for command in self.commands if command.startswith(lowered)]
+        for command in self.name_commands:
+            if lowered.startswith(command + " "):
+                rest = line[len(command) + 1:]
+                for name, length in trie.names_prefixing(rest):
+                    if rest[length:].lower().startswith(" to "):
+                        before = line[:len(command) + 1 + length + 4]
+                        return self.complete_names(before, line[len(before):])
+                return matches + self.complete_names(line[:len(command) + 1], rest)
+        matches += self.complete_names("", line)
+        for name, length in trie.names_prefixing(line):
+            partial = lowered[length + 1:]
+            matches += [line[:length + 1] + suffix for suffix in self.suffixes if suffix.startswith(partial)]
+        return list(dict.fromkeys(matches))[:MAX_MATCHES]
+
+    def complete(self, text, state):
+        """The readline completer protocol: called with state 0, 1, 2... until it returns None."""
+        if state == 0:
+            try:
+                self.matches = self.candidates(text)
+            except Exception:
+                # An exception inside a readline completer is swallowed silently; just offer nothing.
+                self.matches = []
+        return self.matches[state] if state < len(self.matches) else None
+
+
+def install(completer):
+    """Hook completer up to readline. Returns False if readline isn't available."""
+    try:
+        import readline
+    except ImportError:
+        return False
+    readline.set_completer_delims("")
+    if "libedit" in (readline.__doc__ or ""):
+        readline.parse_and_bind("bind ^I rl_complete")
+    else:
+        readline.parse_and_bind("tab: complete")
+    readline.set_completer(completer.complete)
+    return True
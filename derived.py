@@ -0,0 +1,73 @@
+"""
+Derived stats: ability modifiers from ability scores and proficiency bonus
+from character level, computed for the whole roster in one pass.
+
+    modifier = floor((score - 10) / 2)
+    proficiency bonus = 2 + (level - 1) // 4
+
+Scores come in as one row of six per character and levels as one number
+per character. For big rosters NumPy does the arithmetic on the whole table
+at once when it is installed; otherwise, and for a normal party, the same
+formulas run over plain lists, so loading the campaign never has to import
+NumPy.
+"""
+import re
+
+CLASS_SEPARATORS = r"[/,&+]"
+# Below this many characters importing NumPy costs more than it saves.
+NUMPY_MIN_ROWS = 1000
+
+
+def parse_class_levels(char_class, level):
+    """
+    Per-class levels from a class field.
+
+    "Paladin 5/Barbarian 2" -> {"paladin": 5, "barbarian": 2}
+    "Cleric" at level 3     -> {"cleric": 3}
+    "Paladin/Barbarian 7"   -> None, since the split between the classes isn't given.
+    """
+    levels, missing = {}, False
+    parts = [part for part in re.split(CLASS_SEPARATORS, char_class or "") if part.strip()]
+    for part in parts:
+        match = re.match(r"^\s*(.*?)\s*(\d+)?\s*$", part)
+        name = " ".join(match.group(1).split()).lower()
+        if not name:
+            continue
+        if match.group(2):
+            levels[name] = levels.get(name, 0) + int(match.group(2))
+        else:
+            missing = True
+            levels.setdefault(name, 0)
+    if not levels:
+        return None
+    if missing:
+        return {next(iter(levels)): level} if len(levels) == 1 else None
+    return levels
+
+
+def format_class_levels(levels):
+    return "/".join(f"{name.title()} {level}" for name, level in levels.items())
+
+
+def proficiency_bonus(level):
+    return 2 + (max(level, 1) - 1) // 4
+
+
+def derive(score_rows, levels):
+    """
+    Args:
+    score_rows (list): Six ability scores per character (strength to charisma).
+    levels (list): Total character level per character.
+
+    Returns:
+    tuple: (modifier rows, proficiency bonuses), in the same order.
+    """
+    np = None
+    if len(levels) >= NUMPY_MIN_ROWS:
+        from party import load_numpy
+        np = load_numpy()
+    if np is not None:
+        scores = np.array(score_rows, dtype=int).reshape(len(levels), 6)
+        total_levels = np.maximum(np.array(levels, dtype=int), 1)
+        return np.floor_divide(scores - 10, 2).tolist(), (2 + (total_levels - 1) // 4).tolist()
+    return [[(score - 10) // 2 for score in row] for row in score_rows], [proficiency_bonus(level) for level in levels]
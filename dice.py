@@ -0,0 +1,54 @@
+"""
+Exact odds for d20 checks.
+
+The d20 is a distribution over 1-20 (advantage and disadvantage take the
+higher or lower of two), extra dice like Guidance or Bardic Inspiration are
+convolved into one bonus distribution, and the chance of success is summed
+from the two in closed form. Results are cached per (modifier, DC, mode,
+extra dice), so ranking a whole party costs one lookup per distinct modifier.
+"""
+import functools
+
+MODES = ("normal", "advantage", "disadvantage")
+
+
+@functools.lru_cache(maxsize=None)
+def d20_distribution(mode="normal"):
+    """P(roll = k) for k = 1..20, as a tuple indexed from 0."""
+    if mode == "advantage":
+        return tuple((2 * k - 1) / 400 for k in range(1, 21))
+    if mode == "disadvantage":
+        return tuple((41 - 2 * k) / 400 for k in range(1, 21))
+    return (1 / 20,) * 20
+
+
+def convolve(a, b):
+    """Distributions as {total: probability}; returns the distribution of their sum."""
+    result = {}
+    for x, p in a.items():
+        for y, q in b.items():
+            result[x + y] = result.get(x + y, 0) + p * q
+    return result
+
+
+@functools.lru_cache(maxsize=None)
+def dice_distribution(dice):
+    """Distribution of the sum of dice given as a sorted tuple of side counts, e.g. (4, 6) for d4 + d6."""
+    distribution = {0: 1.0}
+    for sides in dice:
+        distribution = convolve(distribution, {face: 1 / sides for face in range(1, sides + 1)})
+    return distribution
+
+
+@functools.lru_cache(maxsize=4096)
+def success_probability(modifier, dc, mode="normal", dice=()):
+    """Chance that d20 + modifier + the extra dice meets or beats dc. Ability checks have no automatic 1s or 20s."""
+    d20 = d20_distribution(mode)
+    total = 0.0
+    for bonus, p_bonus in dice_distribution(tuple(sorted(dice))).items():
+        needed = dc - modifier - bonus
+        if needed <= 1:
+            total += p_bonus
+        elif needed <= 20:
+            total += p_bonus * sum(d20[needed - 1:])
+    return min(total, 1.0)
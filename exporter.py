@@ -0,0 +1,291 @@
+"""
+Export campaign data to Markdown or self-contained HTML pages for the wiki.
+
+Every character, NPC, guild and spell becomes one file. Pages are written
+through a small streaming writer straight to disk and skipped when the
+content hash recorded in the output folder's manifest says nothing changed
+since the last export; pages for entities that are gone are deleted.
+Rendering is pure Python and holds the GIL, so threads don't help: a big
+export is split across worker processes, a small one is rendered in this
+process, where starting workers would cost more than it saves.
+
+Entities are passed in as plain dicts (the same shape as `to_dict()`) so
+this module doesn't need to import playAssist.
+"""
+import hashlib
+import html
+import json
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+
+MANIFEST = ".export-manifest.json"
+RENDER_VERSION = 1
+# Below this many pages to render, worker processes cost more to start than they save.
+PARALLEL_MIN_PAGES = 500
+FOLDERS = {"character": "characters", "npc": "npcs", "guild": "guilds", "spell": "spells"}
+
+HTML_STYLE = """
+body { font-family: Georgia, serif; max-width: 50em; margin: 2em auto; padding: 0 1em; color: #222; }
+h1 { border-bottom: 2px solid #7a1f1f; } h2 { color: #7a1f1f; margin-top: 1.5em; }
+dt { font-weight: bold; float: left; clear: left; width: 11em; } dd { margin: 0 0 0.3em 11em; }
+.note { white-space: pre-wrap; }
+"""
+
+
+class MarkdownWriter:
+    def __init__(self, stream):
+        self.stream = stream
+
+    def begin(self, title):
+        self.stream.write(f"# {title}\n\n")
+
+    def heading(self, text):
+        self.stream.write(f"\n## {text}\n\n")
+
+    def field(self, label, value):
+        self.stream.write(f"- **{label}:** {value}\n")
+
+    def item(self, text, detail=""):
+        self.stream.write(f"- **{text}**" + (f": {detail}" if detail else "") + "\n")
+
+    def paragraph(self, text):
+        self.stream.write(f"{text}\n\n")
+
+    def link(self, text, target):
+        self.stream.write(f"- [{text}]({target})\n")
+
+    def end(self):
+        pass
+
+
+class HtmlWriter:
+    def __init__(self, stream):
+        self.stream = stream
+        self.open_list = None
+
+    def close_list(self):
+        if self.open_list:
+            self.stream.write(f"</{self.open_list}>\n")
+            self.open_list = None
+
+    def start_list(self, tag):
+        if self.open_list != tag:
+            self.close_list()
+            self.stream.write(f"<{tag}>\n")
+            self.open_list = tag
+
+    def begin(self, title):
+        title = html.escape(title)
+        self.stream.write(
+            f"<!DOCTYPE html>\n<html><head><meta charset=\"utf-8\"><title>{title}</title>"
+            f"<style>{HTML_STYLE}</style></head><body>\n<h1>{title}</h1>\n"
+        )
+
+    def heading(self, text):
+        self.close_list()
+        self.stream.write(f"<h2>{html.escape(text)}</h2>\n")
+
+    def field(self, label, value):
+        self.start_list("dl")
+        self.stream.write(f"<dt>{html.escape(label)}</dt><dd>{html.escape(str(value))}</dd>\n")
+
+    def item(self, text, detail=""):
+        self.start_list("ul")
+        detail = f": {html.escape(detail)}" if detail else ""
+        self.stream.write(f"<li><strong>{html.escape(text)}</strong>{detail}</li>\n")
+
+    def paragraph(self, text):
+        self.close_list()
+        self.stream.write(f"<p class=\"note\">{html.escape(text)}</p>\n")
+
+    def link(self, text, target):
+        self.start_list("ul")
+        self.stream.write(f"<li><a href=\"{html.escape(target)}\">{html.escape(text)}</a></li>\n")
+
+    def end(self):
+        self.close_list()
+        self.stream.write("</body></html>\n")
+
+
+WRITERS = {"markdown": (MarkdownWriter, ".md"), "html": (HtmlWriter, ".html")}
+
+
+def render_character(w, data):
+    w.begin(data["name"])
+    for label, key in (("Race", "race"), ("Sub-Race", "sub_race"), ("Class", "char_class"), ("Level", "level"),
+                       ("Subclass", "sub_class"), ("God", "god"), ("Proficiency Bonus", "proficiency_bonus")):
+        if data.get(key) not in (None, ""):
+            w.field(label, data[key])
+    w.heading("Ability Modifiers")
+    for ability, value in data.get("ability_modifiers", {}).items():
+        w.field(ability.capitalize(), value)
+    w.heading("Proficiencies")
+    w.field("Skills", ", ".join(data.get("proficiencies", [])) or "None")
+    w.field("Saving Throws", ", ".join(data.get("saving_throws", [])) or "None")
+    if data.get("weapons"):
+        w.heading("Weapons")
+        for weapon in data["weapons"]:
+            if isinstance(weapon, dict):
+                w.item(weapon["name"], f"+{weapon['attack_bonus']} to hit, {weapon['damage']} {weapon['damage_type']}")
+            else:
+                w.item(weapon)
+    for title, key in (("Race Abilities", "race_abilities"), ("Class Abilities", "class_abilities")):
+        if data.get(key):
+            w.heading(title)
+            for name, details in data[key].items():
+                w.item(f"{name} ({details.get('time', '')})", details.get("description", ""))
+    if data.get("spells"):
+        w.heading("Spells")
+        for spell in sorted(data["spells"], key=lambda spell: (spell.get("level", 0), spell["name"])):
+            w.item(f"{spell['name']} (Level {spell.get('level', '?')}, {spell.get('casting_time', '')})",
+                   spell.get("description", ""))
+    if data.get("notes"):
+        w.heading("Notes")
+        w.paragraph(data["notes"])
+    w.end()
+
+
+def render_npc(w, data):
+    w.begin(data["name"])
+    w.paragraph(data.get("notes", ""))
+    w.end()
+
+
+def render_guild(w, data):
+    w.begin(data["name"])
+    for label, key in (("Town", "town"), ("Headquarters", "headquarters"), ("Leader", "leader"),
+                       ("Symbols", "symbols"), ("Colors", "colors")):
+        w.field(label, data.get(key, ""))
+    for label, key in (("Members", "members"), ("Allies", "allies"), ("Enemies", "enemies")):
+        w.field(label, ", ".join(name for name in data.get(key, []) if name) or "None")
+    w.end()
+
+
+def render_spell(w, data):
+    w.begin(data["spell_name"])
+    for label, key in (("Level", "level"), ("Class", "spell_class"), ("Casting Time", "casting_time"),
+                       ("Range", "range"), ("Components", "components"), ("Duration", "duration"),
+                       ("Spell Save", "spell_save"), ("Spell Save DC", "spell_save_dc"),
+                       ("Damage Dice", "damage_dice"), ("Spell Type", "spell_type")):
+        w.field(label, data.get(key) if data.get(key) not in (None, "") else "N/A")
+    w.paragraph(data.get("description", ""))
+    w.end()
+
+
+RENDERERS = {"character": render_character, "npc": render_npc, "guild": render_guild, "spell": render_spell}
+
+
+def slugify(name):
+    return re.sub(r"[^a-z0-9]+", "-", str(name).lower()).strip("-") or "unnamed"
+
+
+def content_hash(kind, data, fmt):
+    payload = json.dumps({"kind": kind, "format": fmt, "version": RENDER_VERSION, "data": data},
+                         sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def plan_pages(entities, fmt):
+    """Give every (kind, name, data) entity a unique relative path and a content hash."""
+    extension = WRITERS[fmt][1]
+    used = set()
+    for kind, name, data in entities:
+        base = f"{FOLDERS[kind]}/{slugify(name)}"
+        path, n = base + extension, 2
+        while path in used:
+            path, n = f"{base}-{n}{extension}", n + 1
+        used.add(path)
+        yield kind, name, data, path, content_hash(kind, data, fmt)
+
+
+def write_page(folder, fmt, kind, data, path):
+    full_path = os.path.join(folder, path)
+    os.makedirs(os.path.dirname(full_path), exist_ok=True)
+    writer_cls = WRITERS[fmt][0]
+    with open(full_path, "w", encoding="utf-8") as stream:
+        RENDERERS[kind](writer_cls(stream), data)
+
+
+def write_pages(folder, fmt, jobs):
+    """Render a batch of (kind, data, path) jobs; runs in a worker process for big exports."""
+    for kind, data, path in jobs:
+        write_page(folder, fmt, kind, data, path)
+
+
+def remove_stale_pages(folder, manifest, new_manifest):
+    """Delete the pages the last export wrote for entities that no longer exist, and any folders left empty."""
+    removed = 0
+    for path in manifest:
+        parts = path.split("/")
+        # Only ever delete pages inside the folders this module writes.
+        if path in new_manifest or parts[0] not in FOLDERS.values() or ".." in parts:
+            continue
+        try:
+            os.remove(os.path.join(folder, *parts))
+            removed += 1
+        except FileNotFoundError:
+            pass
+    for folder_name in FOLDERS.values():
+        pages_folder = os.path.join(folder, folder_name)
+        if os.path.isdir(pages_folder) and not os.listdir(pages_folder):
+            os.rmdir(pages_folder)
+    return removed
+
+
+def write_index(folder, fmt, pages):
+    writer_cls, extension = WRITERS[fmt]
+    with open(os.path.join(folder, "index" + extension), "w", encoding="utf-8") as stream:
+        w = writer_cls(stream)
+        w.begin("Campaign")
+        for kind, folder_name in FOLDERS.items():
+            entries = [(name, path) for page_kind, name, path in pages if page_kind == kind]
+            if entries:
+                w.heading(folder_name.capitalize())
+                for name, path in entries:
+                    w.link(name, path)
+        w.end()
+
+
+def export_campaign(entities, folder, fmt="markdown", workers=None):
+    """
+    Render (kind, name, data) entities to `folder` as Markdown or HTML.
+
+    workers caps the number of worker processes; 1 renders everything in this process.
+
+    Returns:
+    tuple: (pages written, pages skipped because they were unchanged, stale pages removed)
+    """
+    if fmt not in WRITERS:
+        raise ValueError(f"unknown export format '{fmt}' (use {', '.join(WRITERS)})")
+    os.makedirs(folder, exist_ok=True)
+    manifest_path = os.path.join(folder, MANIFEST)
+    try:
+        with open(manifest_path, "r") as f:
+            manifest = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        manifest = {}
+
+    new_manifest, pages, jobs = {}, [], []
+    for kind, name, data, path, digest in plan_pages(entities, fmt):
+        new_manifest[path] = digest
+        pages.append((kind, name, path))
+        if manifest.get(path) != digest or not os.path.exists(os.path.join(folder, path)):
+            jobs.append((kind, data, path))
+
+    workers = workers or os.cpu_count() or 1
+    if workers > 1 and len(jobs) >= PARALLEL_MIN_PAGES:
+        # A few big batches per worker, so each one pickles its share of the data once.
+        size = -(-len(jobs) // (workers * 4))
+        batches = [jobs[i:i + size] for i in range(0, len(jobs), size)]
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            for future in [pool.submit(write_pages, folder, fmt, batch) for batch in batches]:
+                future.result()
+    else:
+        write_pages(folder, fmt, jobs)
+
+    removed = remove_stale_pages(folder, manifest, new_manifest)
+    write_index(folder, fmt, pages)
+    with open(manifest_path, "w") as f:
+        json.dump(new_manifest, f, indent=1, sort_keys=True)
+    return len(jobs), len(pages) - len(jobs), removed
@@ -0,0 +1,177 @@
+"""
+Content-addressed version history of campaign records.
+
+Every record a store saves is written once as a blob named by the SHA-256
+of its canonical JSON, so an unchanged character costs nothing however
+often the file is saved, and a record that goes back to an earlier state
+reuses the old blob. Each run of playAssist that changes something is a
+session, and its manifest lists only the records whose hash changed since
+the previous session (None when a record was removed):
+
+    history/objects/3f/a4c1...json
+    history/sessions/session-3.json
+        {"session": 3, "started": "...", "saved": "...",
+         "stores": {"characters.json": {"bob": "3fa4c1...", "old guy": null}}}
+
+The state of a store at session N is the manifests 1..N applied in order.
+The first session also records every record of every store as a baseline.
+Records are keyed by lower-case name, so a rename shows up as one record
+removed and another added.
+"""
+import hashlib
+import json
+import os
+import re
+import time
+
+SESSION_FILE = re.compile(r"^session-(\d+)\.json$")
+
+
+def canonical(record):
+    return json.dumps(record, sort_keys=True, separators=(",", ":"))
+
+
+def record_hash(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def write_atomic(path, text):
+    with open(path + ".tmp", "w") as f:
+        f.write(text)
+    os.replace(path + ".tmp", path)
+
+
+def parse_session(token):
+    """'session-3' or '3' -> 3, anything else -> None."""
+    match = re.match(r"^(?:session-)?(\d+)$", token.lower())
+    return int(match.group(1)) if match else None
+
+
+def flatten(value, prefix=""):
+    """Nested dicts as {"a.b": leaf}; lists and scalars are leaves, empty dicts vanish."""
+    if isinstance(value, dict):
+        items = {}
+        for key, inner in value.items():
+            items.update(flatten(inner, f"{prefix}.{key}" if prefix else str(key)))
+        return items
+    return {prefix: value}
+
+
+def diff_records(old, new):
+    """(field, old value, new value) for every field that differs; a missing record counts as {}."""
+    before, after = flatten(old or {}), flatten(new or {})
+    return [(field, before.get(field), after.get(field))
+            for field in sorted(set(before) | set(after)) if before.get(field) != after.get(field)]
+
+
+class History:
+    def __init__(self, folder):
+        self.folder = folder
+        self.objects = os.path.join(folder, "objects")
+        self.session_folder = os.path.join(folder, "sessions")
+        self.manifests = {}
+        self.loaded = False
+        # The state every earlier session left, and this run's session once it changes something.
+        self.base = None
+        self.number = None
+        self.started = None
+        self.changes = {}
+
+    def load(self):
+        if self.loaded:
+            return
+        self.loaded = True
+        if not os.path.isdir(self.session_folder):
+            return
+        for name in os.listdir(self.session_folder):
+            match = SESSION_FILE.match(name)
+            if match:
+                with open(os.path.join(self.session_folder, name), "r") as f:
+                    self.manifests[int(match.group(1))] = json.load(f)
+
+    def sessions(self):
+        self.load()
+        return sorted(self.manifests)
+
+    def state_at(self, session=None):
+        """{store: {key: hash}} as of the end of session (default: the latest)."""
+        state = {}
+        for number in self.sessions():
+            if session is not None and number > session:
+                break
+            for store, changes in self.manifests[number]["stores"].items():
+                records = state.setdefault(store, {})
+                for key, digest in changes.items():
+                    if digest is None:
+                        records.pop(key, None)
+                    else:
+                        records[key] = digest
+        return state
+
+    def blob_path(self, digest):
+        return os.path.join(self.objects, digest[:2], digest[2:] + ".json")
+
+    def read_blob(self, digest):
+        with open(self.blob_path(digest), "r") as f:
+            return json.load(f)
+
+    def write_blob(self, digest, text):
+        path = self.blob_path(digest)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            write_atomic(path, text)
+
+    def is_empty(self):
+        return not self.sessions() and self.number is None
+
+    def commit(self, store, records):
+        """
+        Record the saved contents of a store (a list of dicts with a "name").
+
+        Returns:
+        int: This run's session number, or None if nothing has changed yet.
+        """
+        if self.base is None:
+            self.base = self.state_at()
+        texts = {str(record.get("name", "")).lower(): canonical(record) for record in records}
+        current = {key: record_hash(text) for key, text in texts.items()}
+        previous = self.base.get(store, {})
+        changes = {key: digest for key, digest in current.items() if previous.get(key) != digest}
+        changes.update({key: None for key in previous if key not in current})
+        if not changes and store not in self.changes:
+            return self.number
+        for key, digest in changes.items():
+            if digest is not None:
+                self.write_blob(digest, texts[key])
+        self.changes[store] = changes
+        if self.number is None:
+            self.number = (self.sessions() or [0])[-1] + 1
+            self.started = time.strftime("%Y-%m-%dT%H:%M:%S")
+        manifest = {"session": self.number, "started": self.started,
+                    "saved": time.strftime("%Y-%m-%dT%H:%M:%S"), "stores": self.changes}
+        os.makedirs(self.session_folder, exist_ok=True)
+        write_atomic(os.path.join(self.session_folder, f"session-{self.number}.json"), json.dumps(manifest, indent=4))
+        self.manifests[self.number] = manifest
+        return self.number
+
+    def stores_with(self, key):
+        """The stores that have ever held a record under key."""
+        key = key.lower()
+        return sorted({store for number in self.sessions() for store, changes in self.manifests[number]["stores"].items()
+                       if key in changes})
+
+    def versions(self, store, key):
+        """(session, saved time, hash or None) for every session that changed the record."""
+        key = key.lower()
+        return [(number, self.manifests[number]["saved"], self.manifests[number]["stores"][store][key])
+                for number in self.sessions()
+                if key in self.manifests[number]["stores"].get(store, {})]
+
+    def record_at(self, store, key, session=None):
+        """The record as it stood at the end of session (default: the latest), or None."""
+        digest = None
+        for number, _, version in self.versions(store, key):
+            if session is not None and number > session:
+                break
+            digest = version
+        return self.read_blob(digest) if digest else None
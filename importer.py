@@ -0,0 +1,175 @@
+"""
+Stream spells, weapons, NPCs and characters from JSON Lines or CSV content packs.
+
+Records are read one at a time, so memory only grows with what is kept,
+never with the size of the file. Each record is mapped onto the matching
+`from_dict` constructor, dropped if its name already exists, and handed
+to the caller in batches.
+
+CSV cells are strings, so numbers are converted here. List and dict fields
+(ability_modifiers, spells, ...) can be given as JSON in the cell; plain
+lists can also be comma separated.
+"""
+import csv
+import json
+
+KINDS = ("spell", "weapon", "npc", "character")
+KIND_ALIASES = {
+    "spell": "spell", "spells": "spell",
+    "weapon": "weapon", "weapons": "weapon",
+    "npc": "npc", "npcs": "npc",
+    "character": "character", "characters": "character",
+}
+NAME_FIELDS = {"spell": "spell_name", "weapon": "name", "npc": "name", "character": "name"}
+INT_FIELDS = {
+    "spell": ("level",),
+    "weapon": ("attack_bonus",),
+    "character": ("level", "proficiency_bonus"),
+}
+OPTIONAL_INT_FIELDS = {"spell": ("spell_save_dc",)}
+OPTIONAL_FIELDS = {"spell": ("spell_save", "spell_save_dc", "damage_dice")}
+STRUCTURED_FIELDS = {
+    "character": ("ability_modifiers", "proficiencies", "saving_throws", "weapons",
+                  "race_abilities", "class_abilities", "spells", "ability_scores", "class_levels"),
+}
+LIST_FIELDS = ("proficiencies", "saving_throws", "weapons")
+
+
+class ImportAborted(ValueError):
+    """The file itself couldn't be read to the end (bad encoding, broken CSV); errors lists what was reported."""
+
+    def __init__(self, errors):
+        super().__init__(errors[-1])
+        self.errors = errors
+
+
+class ImportTarget:
+    """Where records of one kind go: a constructor, the names already present, and a batch commit callback."""
+
+    def __init__(self, from_dict, existing_names, commit):
+        self.from_dict = from_dict
+        self.names = {name.lower() for name in existing_names}
+        self.commit = commit
+        self.pending = []
+        self.added = 0
+        self.duplicates = 0
+
+    def flush(self):
+        if self.pending:
+            self.commit(self.pending)
+            self.added += len(self.pending)
+            self.pending = []
+
+
+def read_records(path):
+    """
+    Yield (position, record) from a .jsonl/.ndjson or .csv file, one record at a time.
+
+    JSON Lines records come back as the raw line (bytes, decoded with the record) so a bad
+    line, including one that isn't UTF-8, only skips that record.
+    """
+    if path.lower().endswith(".csv"):
+        with open(path, "r", newline="", encoding="utf-8-sig") as f:
+            for row_no, record in enumerate(csv.DictReader(f), 2):
+                yield f"row {row_no}", record
+        return
+    with open(path, "rb") as f:
+        for line_no, line in enumerate(f, 1):
+            line = line.strip()
+            if line:
+                yield f"line {line_no}", line
+
+
+def detect_kind(record):
+    if "kind" in record and str(record["kind"]).lower() in KIND_ALIASES:
+        return KIND_ALIASES[str(record["kind"]).lower()]
+    if "spell_name" in record:
+        return "spell"
+    if "attack_bonus" in record:
+        return "weapon"
+    if "char_class" in record:
+        return "character"
+    if "name" in record:
+        return "npc"
+    return None
+
+
+def coerce(kind, record):
+    """Turn CSV strings into the types the from_dict constructors expect."""
+    record = {key: value for key, value in record.items() if key is not None and key != "kind"}
+    for field in OPTIONAL_FIELDS.get(kind, ()):
+        if record.get(field) == "":
+            record[field] = None
+    for field in INT_FIELDS.get(kind, ()) + OPTIONAL_INT_FIELDS.get(kind, ()):
+        if isinstance(record.get(field), str):
+            record[field] = int(record[field])
+    for field in STRUCTURED_FIELDS.get(kind, ()):
+        value = record.get(field)
+        if not isinstance(value, str):
+            continue
+        value = value.strip()
+        if value.startswith(("[", "{")):
+            record[field] = json.loads(value)
+        elif field in LIST_FIELDS:
+            record[field] = [item.strip() for item in value.split(",") if item.strip()]
+        else:
+            record.pop(field)
+    return record
+
+
+def import_file(path, targets, kind=None, batch_size=500, max_errors=10):
+    """
+    Stream records from `path` into `targets` (a dict of kind -> ImportTarget).
+
+    Returns:
+    list: Error messages for records that were skipped, at most `max_errors` of them.
+
+    Raises:
+    ImportAborted: If the file stops being readable part way (not UTF-8, malformed CSV).
+    Records still pending are dropped; batches already committed are the caller's to roll back.
+    """
+    errors = []
+    error_count = 0
+    records = read_records(path)
+    where = "the start of the file"
+    try:
+        while True:
+            try:
+                where, record = next(records)
+            except StopIteration:
+                break
+            except (UnicodeDecodeError, csv.Error) as e:
+                for target in targets.values():
+                    target.pending = []
+                errors.append(f"after {where}: {type(e).__name__}: {e}")
+                raise ImportAborted(errors)
+            try:
+                if isinstance(record, bytes):
+                    record = json.loads(record.decode("utf-8"))
+                record_kind = kind or detect_kind(record)
+                if record_kind not in targets:
+                    raise ValueError("can't tell whether this is a spell, weapon, NPC or character")
+                record = coerce(record_kind, record)
+                target = targets[record_kind]
+                name = str(record.get(NAME_FIELDS[record_kind], "")).strip()
+                if not name:
+                    raise ValueError(f"missing {NAME_FIELDS[record_kind]}")
+                if name.lower() in target.names:
+                    target.duplicates += 1
+                    continue
+                item = target.from_dict(record)
+            except (KeyError, ValueError, TypeError, AttributeError) as e:
+                error_count += 1
+                if len(errors) < max_errors:
+                    errors.append(f"{where}: {type(e).__name__}: {e}")
+                continue
+            target.names.add(name.lower())
+            target.pending.append(item)
+            if len(target.pending) >= batch_size:
+                target.flush()
+    finally:
+        for target in targets.values():
+            target.flush()
+    if error_count > len(errors):
+        errors.append(f"... and {error_count - len(errors)} more")
+    return errors
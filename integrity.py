@@ -0,0 +1,136 @@
+"""
+Referential-integrity check for campaign data.
+
+Every name each store refers to (character weapons and spells, guild
+leaders, members, allies and enemies) is checked against the names the
+other stores define, one set difference per record, so the whole campaign
+is checked in a single pass. It also reports names defined twice and names
+that differ only in case, which the case-insensitive lookups can't tell
+apart.
+
+Stores are plain dicts in the JSON layout, so this works on what
+playAssist has loaded (the `check data` command) or straight from the
+files, which makes it usable as a pre-commit style gate:
+
+    python integrity.py [data folder]
+
+exits with status 1 if anything is wrong, including files that don't parse.
+"""
+import json
+import os
+import sys
+from collections import defaultdict
+
+STORE_FILES = {
+    "characters": "characters.json",
+    "spells": "spells.json",
+    "weapons": "weapons.json",
+    "npcs": "npcs.json",
+    "guilds": "guilds.json",
+}
+NAME_FIELDS = {"characters": "name", "spells": "spell_name", "weapons": "name", "npcs": "name", "guilds": "name"}
+# Stores whose names share one namespace in the info command and guild membership.
+SHARED_NAMESPACE = ("characters", "npcs", "weapons", "guilds")
+PROBLEM_KINDS = ("unreadable", "dangling", "duplicate", "case collision", "ambiguous")
+
+
+def names_of(records, field):
+    return [str(record.get(field, "")) for record in records if record.get(field)]
+
+
+def check_campaign(stores):
+    """
+    Args:
+    stores (dict): "characters", "spells", "weapons", "npcs", "guilds" -> lists of dicts (missing stores count as empty).
+
+    Returns:
+    list: (problem kind, file, message) tuples.
+    """
+    problems = []
+    names = {kind: names_of(stores.get(kind, []), NAME_FIELDS[kind]) for kind in STORE_FILES}
+    known = {kind: {name.lower() for name in kind_names} for kind, kind_names in names.items()}
+    people = known["characters"] | known["npcs"]
+
+    for character in stores.get("characters", []):
+        owner = character.get("name", "?")
+        for weapon in sorted({str(name).lower() for name in character.get("weapons", []) if name} - known["weapons"]):
+            problems.append(("dangling", STORE_FILES["characters"], f"{owner}: weapon '{weapon}' isn't in weapons.json"))
+        # A spell carrying its own description stands alone; a bare name has to resolve against spells.json.
+        bare = {str(spell.get("name", "")).lower() for spell in character.get("spells", [])
+                if isinstance(spell, dict) and "description" not in spell}
+        for spell in sorted(bare - known["spells"]):
+            problems.append(("dangling", STORE_FILES["characters"], f"{owner}: spell '{spell}' isn't in spells.json"))
+
+    for guild in stores.get("guilds", []):
+        owner = guild.get("name", "?")
+        for field, targets, label in (("leader", people, "character or NPC"), ("members", people, "character or NPC"),
+                                      ("allies", known["guilds"], "guild"), ("enemies", known["guilds"], "guild")):
+            value = guild.get(field) or []
+            referenced = {str(name).lower(): name for name in ([value] if isinstance(value, str) else value) if name}
+            for missing in sorted(set(referenced) - targets):
+                problems.append(("dangling", STORE_FILES["guilds"], f"{owner}: {field} '{referenced[missing]}' isn't a known {label}"))
+
+    for kind, kind_names in names.items():
+        spellings = defaultdict(lambda: defaultdict(int))
+        for name in kind_names:
+            spellings[name.lower()][name] += 1
+        for variants in spellings.values():
+            for name, count in variants.items():
+                if count > 1:
+                    problems.append(("duplicate", STORE_FILES[kind], f"'{name}' is defined {count} times"))
+            if len(variants) > 1:
+                listed = ", ".join(f"'{name}'" for name in sorted(variants))
+                problems.append(("case collision", STORE_FILES[kind], f"{listed} differ only in case"))
+
+    owners = defaultdict(list)
+    for kind in SHARED_NAMESPACE:
+        for name in known[kind]:
+            owners[name].append(kind)
+    for name, kinds in sorted(owners.items()):
+        if len(kinds) > 1:
+            problems.append(("ambiguous", ", ".join(STORE_FILES[kind] for kind in kinds),
+                             f"'{name}' names more than one thing ({', '.join(kinds)})"))
+    return problems
+
+
+def load_stores(folder):
+    """Read every store from folder. Returns (stores, problems) where problems lists files that don't parse."""
+    stores, problems = {}, []
+    for kind, filename in STORE_FILES.items():
+        path = os.path.join(folder, filename)
+        try:
+            with open(path, "r") as f:
+                stores[kind] = json.load(f)
+        except FileNotFoundError:
+            stores[kind] = []
+        except (json.JSONDecodeError, UnicodeDecodeError) as e:
+            stores[kind] = []
+            problems.append(("unreadable", filename, str(e)))
+    return stores, problems
+
+
+def format_report(problems, counts):
+    """Lines of a report grouped by problem kind; counts is a dict of store -> number of records checked."""
+    lines = ["Checked " + ", ".join(f"{count} {kind}" for kind, count in counts.items()) + "."]
+    if not problems:
+        lines.append("No problems found.")
+        return lines
+    for kind in PROBLEM_KINDS:
+        found = [problem for problem in problems if problem[0] == kind]
+        if found:
+            lines.append(f"{kind.capitalize()} ({len(found)}):")
+            lines.extend(f"  {filename}: {message}" for _, filename, message in found)
+    return lines
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    folder = argv[0] if argv else os.environ.get("PLAYASSIST_DATA_DIR", os.path.dirname(os.path.abspath(__file__)))
+    stores, problems = load_stores(folder)
+    problems += check_campaign(stores)
+    print("\n".join(format_report(problems, {kind: len(records) for kind, records in stores.items()})))
+    return 1 if problems else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
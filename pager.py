@@ -0,0 +1,88 @@
+"""
+A small built-in pager for long listings.
+
+Listings are passed in as iterables of lines (usually generators), and the
+pager pulls only as many as fit on the screen before asking whether to go
+on, so a huge spellbook starts showing at once and is never built up as
+one string. Lines keep their ANSI styling: escape codes take no width when
+wrapping and are never split from the word they style. Wrapped text is
+cached by content and width, so showing the same entity again doesn't
+re-wrap it.
+
+When output isn't a terminal (piped, redirected or under a test harness)
+everything is written straight through without pausing.
+"""
+import functools
+import re
+import shutil
+import sys
+
+ANSI_ESCAPE = re.compile(r"\x1b\[[0-9;]*m")
+PROMPT = "-- More -- (Enter: next page, a: show all, q: stop) "
+
+
+def visible_length(text):
+    return len(ANSI_ESCAPE.sub("", text))
+
+
+@functools.lru_cache(maxsize=4096)
+def wrap(text, width):
+    """
+    Wrap text to width visible columns, keeping existing line breaks and
+    leading indentation. Returns a tuple of lines.
+    """
+    lines = []
+    for paragraph in text.split("\n"):
+        indent = paragraph[:len(paragraph) - len(paragraph.lstrip(" "))]
+        words = paragraph.split()
+        if not words:
+            lines.append(paragraph.rstrip())
+            continue
+        line, length = indent + words[0], len(indent) + visible_length(words[0])
+        for word in words[1:]:
+            word_length = visible_length(word)
+            if length + 1 + word_length > width:
+                lines.append(line)
+                line, length = indent + word, len(indent) + word_length
+            else:
+                line, length = f"{line} {word}", length + 1 + word_length
+        lines.append(line)
+    return tuple(lines)
+
+
+def terminal_size():
+    size = shutil.get_terminal_size((80, 24))
+    return size.columns, size.lines
+
+
+def is_interactive(stream):
+    return stream.isatty() and sys.stdin.isatty()
+
+
+def page(lines, stream=None, ask=input, paged=True):
+    """
+    Show lines a screenful at a time. Each item may hold embedded newlines and
+    is wrapped to the terminal width. Returns False if the reader stopped early.
+    ask reads the answer at the prompt; with paged=False everything is written straight through.
+    """
+    stream = stream or sys.stdout
+    if not paged or not is_interactive(stream):
+        for line in lines:
+            stream.write(line + "\n")
+        return True
+    columns, rows = terminal_size()
+    # Leave a row for the prompt.
+    remaining = rows - 1
+    show_all = False
+    for line in lines:
+        for row in wrap(line, columns - 1):
+            if remaining == 0 and not show_all:
+                stream.flush()
+                answer = ask(PROMPT).strip().lower()
+                if answer == "q":
+                    return False
+                show_all = answer == "a"
+                remaining = rows - 1
+            stream.write(row + "\n")
+            remaining -= 1
+    return True
@@ -0,0 +1,139 @@
+"""
+Party coverage analytics over the whole roster at once.
+
+The roster becomes three arrays: ability modifiers (characters x abilities),
+proficiency flags (characters x stats, where a stat is a saving throw or a
+skill) and proficiency bonuses. Every character's modifier for every stat is
+then one gather plus a masked bonus, giving the same numbers as
+Character.get_stat without asking each character for each stat. NumPy does
+the array work when it is installed; otherwise the same operations run on
+plain lists.
+"""
+ABILITIES = ("strength", "dexterity", "constitution", "intelligence", "wisdom", "charisma")
+# A best modifier below this counts as a weak spot even if somebody is proficient.
+WEAK_MODIFIER = 3
+
+
+def load_numpy():
+    try:
+        import numpy
+    except ImportError:
+        return None
+    return numpy
+
+
+def stat_label(stat):
+    return f"{stat.capitalize()} save" if stat in ABILITIES else stat.capitalize()
+
+
+class PartyMatrix:
+    def __init__(self, names, ability_modifiers, proficiencies, saving_throws, proficiency_bonuses, skill_abilities):
+        """
+        Args:
+        names (list): Character names, one per row.
+        ability_modifiers (list): A dict of ability -> modifier per character.
+        proficiencies (list): The skills each character is proficient in.
+        saving_throws (list): The saving throws each character is proficient in.
+        proficiency_bonuses (list): Each character's proficiency bonus.
+        skill_abilities (dict): skill -> the ability it uses.
+        """
+        self.names = list(names)
+        self.stats = list(ABILITIES) + list(skill_abilities)
+        self.columns = {stat: j for j, stat in enumerate(self.stats)}
+        self.stat_ability = list(range(len(ABILITIES))) + [ABILITIES.index(skill_abilities[s]) for s in skill_abilities]
+        ability_rows = [[modifiers.get(ability, 0) for ability in ABILITIES] for modifiers in ability_modifiers]
+        flag_rows = []
+        for skills, saves in zip(proficiencies, saving_throws):
+            skills = {skill.lower() for skill in skills}
+            saves = {save.lower() for save in saves}
+            flag_rows.append([stat in saves for stat in ABILITIES] + [stat in skills for stat in skill_abilities])
+        self.np = load_numpy()
+        if self.np is not None:
+            np = self.np
+            rows, columns = len(self.names), len(self.stats)
+            abilities = np.array(ability_rows, dtype=int).reshape(rows, len(ABILITIES))
+            self.proficient = np.array(flag_rows, dtype=bool).reshape(rows, columns)
+            self.bonuses = np.array(proficiency_bonuses, dtype=int)
+            self.totals = abilities[:, self.stat_ability] + self.proficient * self.bonuses[:, None]
+        else:
+            self.proficient = flag_rows
+            self.bonuses = list(proficiency_bonuses)
+            self.totals = [
+                [row[a] + (bonus if flag else 0) for a, flag in zip(self.stat_ability, flags)]
+                for row, flags, bonus in zip(ability_rows, flag_rows, self.bonuses)
+            ]
+
+    def column(self, matrix, j):
+        return matrix[:, j].tolist() if self.np is not None else [row[j] for row in matrix]
+
+    def column_summary(self):
+        """
+        Per stat: the best modifier, how many are proficient, and the best
+        modifier the party could reach by making one more character proficient.
+        """
+        if not self.names:
+            return [], [], []
+        if self.np is not None:
+            potential = self.totals + ~self.proficient * self.bonuses[:, None]
+            return (self.totals.max(axis=0).tolist(), self.proficient.sum(axis=0).tolist(),
+                    potential.max(axis=0).tolist())
+        best = [max(column) for column in zip(*self.totals)]
+        counts = [sum(column) for column in zip(*self.proficient)]
+        potential = [
+            max(total + (0 if flag else bonus) for total, flag, bonus in zip(totals, flags, self.bonuses))
+            for totals, flags in zip(zip(*self.totals), zip(*self.proficient))
+        ]
+        return best, counts, potential
+
+    def holders(self, j, value):
+        return [name for name, total in zip(self.names, self.column(self.totals, j)) if total == value]
+
+    def proficient_names(self, j):
+        return [name for name, flag in zip(self.names, self.column(self.proficient, j)) if flag]
+
+    def best_pick(self, j):
+        """The non-proficient character whose proficiency would raise this stat the most, with their new modifier."""
+        candidates = [
+            (total + bonus, name)
+            for name, total, flag, bonus in zip(self.names, self.column(self.totals, j),
+                                                 self.column(self.proficient, j), list(self.bonuses))
+            if not flag
+        ]
+        if not candidates:
+            return None, None
+        value, name = max(candidates, key=lambda candidate: candidate[0])
+        return name, value
+
+    def report(self):
+        """
+        Returns:
+        list: (stat, best modifier, best characters, proficient characters, is a gap, best pick, pick's modifier)
+        per stat, saving throws first.
+        """
+        best, counts, potential = self.column_summary()
+        rows = []
+        for j, stat in enumerate(self.stats):
+            gap = counts[j] == 0 or best[j] < WEAK_MODIFIER
+            pick, pick_value = self.best_pick(j) if gap and potential[j] > best[j] else (None, None)
+            rows.append((stat, best[j], self.holders(j, best[j]), self.proficient_names(j), gap, pick, pick_value))
+        return rows
+
+    def what_if(self, name, stat, gain=True):
+        """
+        How the party's best modifier and proficiency count for a stat would change
+        if one character gained (or lost) proficiency in it.
+
+        Returns:
+        tuple: (best before, best after, best characters after, proficient before, proficient after)
+        """
+        i = next(i for i, row_name in enumerate(self.names) if row_name.lower() == name.lower())
+        j = self.columns[stat]
+        totals = self.column(self.totals, j)
+        flags = self.column(self.proficient, j)
+        before_best, before_count = max(totals), sum(flags)
+        if flags[i] != gain:
+            totals[i] += self.bonuses[i] if gain else -self.bonuses[i]
+            flags[i] = gain
+        after_best = max(totals)
+        holders = [row_name for row_name, total in zip(self.names, totals) if total == after_best]
+        return before_best, after_best, holders, before_count, sum(flags)
@@ -1,31 +1,128 @@
+import collections
 import json
 import os
 import sys
-import textwrap
+import math
 import random
+import re
+import shlex
+import time
 
 
 def resource_path(relative_path):
     """ Get the absolute path to a resource, works for dev and for PyInstaller """
-    base_path = getattr(sys, '_MEIPASS', os.path.dirname(os.path.abspath(__file__)))
+    base_path = os.environ.get("PLAYASSIST_DATA_DIR") or getattr(sys, '_MEIPASS', os.path.dirname(os.path.abspath(__file__)))
     return os.path.join(base_path, relative_path)
 
-def load_wild_magic_table():
-    with open(resource_path("wild_magic_table.json"), "r") as file:
-        return json.load(file)
-
-wild_magic_table = load_wild_magic_table()
-
-def resource_path(relative_path):
-    """ Get the absolute path to a resource, works for dev and for PyInstaller """
-    base_path = getattr(sys, '_MEIPASS', os.path.dirname(os.path.abspath(__file__)))
-    return os.path.join(base_path, relative_path)
-
-
+class LatencyHistogram:
+    """
+    Latency histogram with logarithmic buckets (8 per doubling, about 9%
+    resolution), so it stays the same size no matter how many samples it sees.
+    """
+    BUCKETS_PER_DOUBLING = 8
 
+    def __init__(self):
+        self.buckets = {}
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, seconds):
+        bucket = math.floor(math.log2(max(seconds, 1e-7)) * self.BUCKETS_PER_DOUBLING)
+        self.buckets[bucket] = self.buckets.get(bucket, 0) + 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def percentile(self, percent):
+        """Return the upper bound, in seconds, of the bucket holding the given percentile."""
+        if not self.count:
+            return 0.0
+        target = self.count * percent / 100
+        seen = 0
+        for bucket in sorted(self.buckets):
+            seen += self.buckets[bucket]
+            if seen >= target:
+                return min(2 ** ((bucket + 1) / self.BUCKETS_PER_DOUBLING), self.max)
+        return self.max
+
+
+MAX_LATENCY_LABELS = 100
+latency_stats = {}
+
+def record_latency(label, seconds):
+    histogram = latency_stats.get(label)
+    if histogram is None:
+        if len(latency_stats) >= MAX_LATENCY_LABELS:
+            label = "other"
+        histogram = latency_stats.setdefault(label, LatencyHistogram())
+    histogram.record(seconds)
+
+# One seedable generator for every random draw, so a session can be reproduced.
+rng = random.Random(os.environ.get("PLAYASSIST_SEED"))
+# The session log being written by the 'record' command, if any.
+session_recorder = None
+
+def ask(prompt):
+    """Prompt for input; every answer goes into the session log while recording."""
+    answer = input(prompt)
+    if session_recorder is not None:
+        session_recorder.input(answer)
+    return answer
+
+# session.py turns this off while replaying.
+paging = True
+
+def show_paged(lines):
+    """
+    Page lines through pager, prompting with ask(). Nothing is paged while a
+    session is recorded or replayed: where the pages break depends on the
+    terminal size, so the prompts couldn't be replayed as they were answered.
+    """
+    import pager
+    return pager.page(lines, ask=ask, paged=paging and session_recorder is None)
+random_tables = None
+
+def get_random_tables():
+    """The wild magic table plus every table in the tables folder, loaded on first use."""
+    global random_tables
+    if random_tables is None:
+        import tables
+        random_tables = tables.load_tables(resource_path("tables"), [("wild magic", resource_path("wild_magic_table.json"))])
+        for problem in random_tables.problems:
+            print(f"Skipped table {problem}")
+    return random_tables
+
+SKILL_TO_ABILITY = {
+    "athletics": "strength",
+    "acrobatics": "dexterity",
+    "sleight of hand": "dexterity",
+    "stealth": "dexterity",
+    "arcana": "intelligence",
+    "history": "intelligence",
+    "investigation": "intelligence",
+    "nature": "intelligence",
+    "religion": "intelligence",
+    "animal handling": "wisdom",
+    "insight": "wisdom",
+    "medicine": "wisdom",
+    "perception": "wisdom",
+    "survival": "wisdom",
+    "deception": "charisma",
+    "intimidation": "charisma",
+    "performance": "charisma",
+    "persuasion": "charisma",
+    "social interaction": "charisma"
+}
+
+def section_header(title):
+    yield "----------------------------------------"
+    yield title
+    yield "----------------------------------------"
 
 class Character:
-    def __init__(self, name, race, sub_race, char_class, level, sub_class, ability_modifiers, proficiencies, god, proficiency_bonus, saving_throws, notes, weapons, race_abilities, class_abilities, spells):
+    def __init__(self, name, race, sub_race, char_class, level, sub_class, ability_modifiers, proficiencies, god, proficiency_bonus, saving_throws, notes, weapons, race_abilities, class_abilities, spells, resources=None, ability_scores=None, class_levels=None):
         self.name = name
         self.race = race
         self.sub_race = sub_race
@@ -42,30 +139,21 @@ class Character:
         self.race_abilities = race_abilities
         self.class_abilities = class_abilities
         self.spells = spells
+        self.resources = resources or {}
+        # Optional raw inputs; when present, modifiers and proficiency bonus are derived from them.
+        self.ability_scores = ability_scores or {}
+        self.class_levels = class_levels or {}
+        self.actions = None
+        self.resource_limits = None
+        self.best_actions = {}
+
+    def invalidate(self):
+        """Drop everything derived from this character's data so it is rebuilt on next use."""
+        self.actions = None
+        self.resource_limits = None
+        self.best_actions = {}
 
     def get_stat(self, stat):
-        skill_to_ability = {
-            "athletics": "strength",
-            "acrobatics": "dexterity",
-            "sleight of hand": "dexterity",
-            "stealth": "dexterity",
-            "arcana": "intelligence",
-            "history": "intelligence",
-            "investigation": "intelligence",
-            "nature": "intelligence",
-            "religion": "intelligence",
-            "animal handling": "wisdom",
-            "insight": "wisdom",
-            "medicine": "wisdom",
-            "perception": "wisdom",
-            "survival": "wisdom",
-            "deception": "charisma",
-            "intimidation": "charisma",
-            "performance": "charisma",
-            "persuasion": "charisma",
-            "social interaction": "charisma"
-        }
-
         stat = stat.lower()
 
         if stat in self.ability_modifiers:
@@ -74,7 +162,7 @@ class Character:
                 total_modifier += self.proficiency_bonus
             return total_modifier
 
-        ability = skill_to_ability.get(stat, None)
+        ability = SKILL_TO_ABILITY.get(stat, None)
         if not ability:
             return None
 
@@ -103,7 +191,10 @@ class Character:
             "weapons": self.weapons,
             "race_abilities": self.race_abilities,
             "class_abilities": self.class_abilities,
-            "spells": self.spells
+            "spells": self.spells,
+            "resources": self.resources,
+            "ability_scores": self.ability_scores,
+            "class_levels": self.class_levels
         }
 
     @classmethod
@@ -115,78 +206,68 @@ class Character:
             data["char_class"],
             data["level"],
             data["sub_class"],
-            data["ability_modifiers"],
+            data.get("ability_modifiers", {}),
             data["proficiencies"],
             data.get("god", ""),
-            data["proficiency_bonus"],
+            data.get("proficiency_bonus", 2),
             data.get("saving_throws", []),
             data.get("notes", ""),
             data.get("weapons", []),
             data.get("race_abilities", {}),
             data.get("class_abilities", {}),
-            data.get("spells", [])
+            [make_spell_ref(spell) for spell in data.get("spells", [])],
+            data.get("resources", {}),
+            data.get("ability_scores", {}),
+            data.get("class_levels", {})
         )
 
-    def display_info(self):
-        weapon_info = ""
+    def info_lines(self, notes=None):
+        """
+        Yield the character sheet a section at a time so it can be paged.
+        notes replaces the notes field; the notes log passes the character's latest entries.
+        """
+        yield "========================================"
+        yield "Character Information"
+        yield "========================================"
+        yield f"Name:                {self.name}"
+        yield f"Race:                {self.race}"
+        yield f"Sub-Race:            {self.sub_race}"
+        yield f"Class:               {self.char_class}"
+        yield f"Level:               {self.level}"
+        yield f"Subclass:            {self.sub_class}"
+        yield ""
+        yield from section_header("Ability Modifiers")
+        for ability in ("strength", "dexterity", "constitution", "intelligence", "wisdom", "charisma"):
+            yield f"  {ability.capitalize() + ':':<19}{self.ability_modifiers.get(ability, 0)}"
+        yield ""
+        yield "----------------------------------------"
+        yield f"Proficiencies:       {', '.join(self.proficiencies)}"
+        yield f"Saving Throws:       {', '.join(self.saving_throws)}"
+        yield ""
+        yield from section_header("Weapons")
         for weapon_name in self.weapons:
             weapon = next((w for w in weapons if w.name.lower() == weapon_name.lower()), None)
             if weapon:
-                weapon_info += weapon.display_info() + "\n"
-
-        race_abilities_info = "\n".join([f"  {name} ({details['time']}): {details['description']}" for name, details in self.race_abilities.items()])
-        class_abilities_info = "\n".join([f"  {name} ({details['time']}): {details['description']}" for name, details in self.class_abilities.items()])
-
-        info = f"""
-========================================
-Character Information
-========================================
-Name:                {self.name}
-Race:                {self.race}
-Sub-Race:            {self.sub_race}
-Class:               {self.char_class}
-Level:               {self.level}
-Subclass:            {self.sub_class}
-
-----------------------------------------
-Ability Modifiers
-----------------------------------------
-  Strength:          {self.ability_modifiers.get("strength", 0)}
-  Dexterity:         {self.ability_modifiers.get("dexterity", 0)}
-  Constitution:      {self.ability_modifiers.get("constitution", 0)}
-  Intelligence:      {self.ability_modifiers.get("intelligence", 0)}
-  Wisdom:            {self.ability_modifiers.get("wisdom", 0)}
-  Charisma:          {self.ability_modifiers.get("charisma", 0)}
-
-----------------------------------------
-Proficiencies:       {', '.join(self.proficiencies)}
-Saving Throws:       {', '.join(self.saving_throws)}
-
-----------------------------------------
-Weapons
-----------------------------------------
-{weapon_info}
-----------------------------------------
-Race Abilities
-----------------------------------------
-{race_abilities_info}
-
-----------------------------------------
-Class Abilities
-----------------------------------------
-{class_abilities_info}
-
-----------------------------------------
-God:                 {self.god}
-Proficiency Bonus:   {self.proficiency_bonus}
-
-----------------------------------------
-Notes
-----------------------------------------
-{self.notes}
-========================================
-        """
-        return info.strip()
+                yield weapon.display_info()
+        yield ""
+        yield from section_header("Race Abilities")
+        for name, details in self.race_abilities.items():
+            yield f"  {name} ({details['time']}): {details['description']}"
+        yield ""
+        yield from section_header("Class Abilities")
+        for name, details in self.class_abilities.items():
+            yield f"  {name} ({details['time']}): {details['description']}"
+        yield ""
+        yield "----------------------------------------"
+        yield f"God:                 {self.god}"
+        yield f"Proficiency Bonus:   {self.proficiency_bonus}"
+        yield ""
+        yield from section_header("Notes")
+        yield self.notes if notes is None else notes
+        yield "========================================"
+
+    def display_info(self, notes=None):
+        return "\n".join(self.info_lines(notes))
 
 
 class Spell:
@@ -260,6 +341,62 @@ Spell Type: {self.spell_type}
         return info.strip()
 
 
+# Character spell lists store references into the spell registry: the
+# spell's name plus only the fields this character has different from
+# spells.json. Keys are the ones character files have always used.
+SPELL_REF_FIELDS = {
+    "level": "level",
+    "casting_time": "casting_time",
+    "description": "description",
+    "range": "range",
+    "components": "components",
+    "duration": "duration",
+    "damage_dice": "damage_dice"
+}
+
+spell_index = {}
+
+def index_spells(spells):
+    spell_index.clear()
+    for spell in spells:
+        spell_index[spell.spell_name.lower()] = spell
+
+def find_spell_by_name(name):
+    return spell_index.get((name or "").lower())
+
+def same_spell_value(a, b):
+    if isinstance(a, str) and isinstance(b, str):
+        return " ".join(a.split()).lower() == " ".join(b.split()).lower()
+    return a == b
+
+def make_spell_ref(entry):
+    """
+    Turn a character's spell entry into a reference into the spell registry.
+
+    Fields that only repeat spells.json are dropped, so old character
+    files with fully embedded spells migrate on load. Spells that are not
+    in the registry keep all their data.
+    """
+    spell = find_spell_by_name(entry.get("name"))
+    if not spell:
+        return dict(entry)
+    ref = {"name": entry["name"]}
+    for key, value in entry.items():
+        if key in SPELL_REF_FIELDS and same_spell_value(value, getattr(spell, SPELL_REF_FIELDS[key])):
+            continue
+        ref[key] = value
+    return ref
+
+def resolve_spell(ref):
+    """Return the full spell entry for a reference: registry values with the character's overrides on top."""
+    spell = find_spell_by_name(ref.get("name"))
+    if not spell:
+        return ref
+    resolved = {key: getattr(spell, attr) for key, attr in SPELL_REF_FIELDS.items()}
+    resolved.update(ref)
+    return resolved
+
+
 class Weapon:
     def __init__(self, name, attack_bonus, damage, damage_type, notes):
         self.name = name
@@ -335,21 +472,66 @@ Bag of Holding Items:
         return info.strip()
 
 def save_to_file(data, filename):
+    start = time.perf_counter()
+    records = [item.to_dict() for item in data]
     with open(resource_path(filename), "w") as f:
-        json.dump([item.to_dict() for item in data], f, indent=4)
+        json.dump(records, f, indent=4)
+    record_latency(f"save {filename}", time.perf_counter() - start)
+    if filename in HISTORY_STORES:
+        record_history(filename, records)
+
+HISTORY_FOLDER = "history"
+# Stores whose records get a session-by-session history.
+HISTORY_STORES = ("characters.json", "npcs.json", "guilds.json")
+history_store = None
+
+def get_history():
+    global history_store
+    if history_store is None:
+        import history
+        history_store = history.History(resource_path(HISTORY_FOLDER))
+    return history_store
+
+def history_sources():
+    """store file -> (loaded records, class, what to run after changing them)."""
+    return {
+        "characters.json": (characters, Character, after_characters_change),
+        "npcs.json": (npcs, NPC, lambda: save_npcs(npcs)),
+        "guilds.json": (guilds, Guild, lambda: save_guilds(guilds)),
+    }
+
+def record_history(filename, records):
+    """Add the saved records to this session's history; the first session also takes a baseline of the other stores."""
+    start = time.perf_counter()
+    past = get_history()
+    try:
+        if past.is_empty():
+            for other, (store, _, _) in history_sources().items():
+                if other != filename:
+                    past.commit(other, [item.to_dict() for item in store])
+        past.commit(filename, records)
+    except OSError as e:
+        print(f"Could not record history for {filename}: {e}")
+    record_latency("record history", time.perf_counter() - start)
 
 def load_from_file(filename, cls):
+    start = time.perf_counter()
     try:
         with open(resource_path(filename), "r") as f:
             data = json.load(f)
             return [cls.from_dict(item) for item in data]
     except FileNotFoundError:
         return []
+    finally:
+        record_latency(f"load {filename}", time.perf_counter() - start)
 
 def load_characters():
     return load_from_file("characters.json", Character)
 
 def save_characters(characters):
+    global party_matrix, guild_graph
+    party_matrix = None
+    guild_graph = None
     save_to_file(characters, "characters.json")
 
 def load_spells():
@@ -367,7 +549,8 @@ def save_weapons(weapons):
 def load_bag_of_holding():
     default_items = ["Potion of Healing", "Rope (50 feet)", "Torch", "Rations (5 days)", "Dagger"]
     file_path = resource_path("bag_of_holding.json")
-    
+    start = time.perf_counter()
+
     try:
         if os.path.exists(file_path):
             if os.path.getsize(file_path) > 0:
@@ -385,94 +568,365 @@ def load_bag_of_holding():
             bag_of_holding.add_item(item)
         save_bag_of_holding(bag_of_holding)
         return bag_of_holding
+    finally:
+        record_latency("load bag_of_holding.json", time.perf_counter() - start)
 
 def save_bag_of_holding(bag_of_holding):
+    start = time.perf_counter()
     with open(resource_path("bag_of_holding.json"), "w") as f:
         json.dump(bag_of_holding.to_dict(), f, indent=4)
+    record_latency("save bag_of_holding.json", time.perf_counter() - start)
 
-class BagOfHolding:
-    def __init__(self):
-        self.items = []
-
-    def add_item(self, item):
-        self.items.append(item)
-
-    def remove_item(self, item):
-        if item in self.items:
-            self.items.remove(item)
+class UndoHistory:
+    """
+    Undo/redo stack for the commands that change campaign data.
 
-    def list_items(self):
-        return "\n".join(self.items)
+    Each step keeps a small inverse operation (the items that were added,
+    the fields that changed with their old values) instead of a copy of
+    the data, so a long history costs little and each undo or redo only
+    touches what that step changed.
+    """
+    def __init__(self, limit=500):
+        self.undo_steps = collections.deque(maxlen=limit)
+        self.redo_steps = []
 
-    def to_dict(self):
-        return {
-            "items": self.items
-        }
+    def record(self, description, undo, redo):
+        self.undo_steps.append((description, undo, redo))
+        self.redo_steps.clear()
 
-    @classmethod
-    def from_dict(cls, data):
-        bag = cls()
-        bag.items = data["items"]
-        return bag
+    def undo(self):
+        if not self.undo_steps:
+            return None
+        step = self.undo_steps.pop()
+        step[1]()
+        self.redo_steps.append(step)
+        return step[0]
 
-    def display_info(self):
-        items_list = "\n".join(self.items)
-        info = f"""
-------------------------
-Bag of Holding Items:
-{items_list}
-------------------------
-        """
-        return info.strip()
+    def redo(self):
+        if not self.redo_steps:
+            return None
+        step = self.redo_steps.pop()
+        step[2]()
+        self.undo_steps.append(step)
+        return step[0]
+
+undo_history = UndoHistory()
+
+name_trie = None
+
+def entity_name(item):
+    """The name an item goes by, or None for things without one (bag items are plain strings)."""
+    return getattr(item, "spell_name", None) or getattr(item, "name", None)
+
+def get_name_trie():
+    """Every character, NPC, weapon, spell and guild name, for tab completion. Built on first use, then kept current."""
+    global name_trie
+    if name_trie is None:
+        import completion
+        name_trie = completion.Trie(entity_name(item) for store in (characters, npcs, weapons, spells, guilds) for item in store)
+    return name_trie
+
+def names_added(items):
+    if name_trie is not None:
+        for item in items:
+            name_trie.insert(entity_name(item))
+
+def names_removed(items):
+    if name_trie is not None:
+        for item in items:
+            name_trie.remove(entity_name(item))
+
+def name_changed(obj, old, new):
+    if isinstance(obj, Character):
+        log_notes_change({"rename": old, "to": new})
+        rename_resource_usage(old, new)
+    if name_trie is not None and isinstance(old, str):
+        name_trie.remove(old)
+        name_trie.insert(new)
+
+def remove_items(store, items):
+    """Remove these exact objects from store, popping them off the end when that's where they are."""
+    count = len(items)
+    if count and len(store) >= count and all(a is b for a, b in zip(store[-count:], items)):
+        del store[-count:]
+        return
+    ids = {id(item) for item in items}
+    store[:] = [item for item in store if id(item) not in ids]
 
+def record_added(description, store, items, after, notes=()):
+    """
+    Record that items were appended to store. after() saves and re-indexes the store.
+    notes are log entries that came in with the items (migrated notes): undo deletes them too.
+    """
+    items = list(items)
+    notes = list(notes)
+    names_added(items)
+
+    def undo():
+        remove_items(store, items)
+        names_removed(items)
+        remove_notes(notes)
+        after()
+
+    def redo():
+        store.extend(items)
+        names_added(items)
+        restore_notes(notes)
+        after()
+
+    undo_history.record(description, undo, redo)
+
+def record_changes(description, obj, old_values, after):
+    """Record that obj's attributes changed from old_values to their current values."""
+    changes = {field: (old, getattr(obj, field)) for field, old in old_values.items() if old != getattr(obj, field)}
+    if not changes:
+        return
+    renamed = [values for field, values in changes.items() if field in ("name", "spell_name")]
+    for old, new in renamed:
+        name_changed(obj, old, new)
+
+    def apply(position):
+        for field, values in changes.items():
+            setattr(obj, field, values[position])
+        for values in renamed:
+            name_changed(obj, values[1 - position], values[position])
+        after()
+
+    undo_history.record(description, lambda: apply(0), lambda: apply(1))
+
+def after_characters_change():
+    recompute_derived_stats()
+    invalidate_action_indexes()
+    save_characters(characters)
 
+def after_spells_change():
+    global spell_query_index
+    index_spells(spells)
+    spell_query_index = None
+    invalidate_action_indexes()
+    save_spells(spells)
+
+def after_weapons_change():
+    invalidate_action_indexes()
+    save_weapons(weapons)
+
+def handle_undo_command(redo=False):
+    description = undo_history.redo() if redo else undo_history.undo()
+    if description is None:
+        print(f"Nothing to {'redo' if redo else 'undo'}.")
+    else:
+        print(f"{'Redid' if redo else 'Undid'}: {description}")
+
+
+NOTES_LOG = "notes.jsonl"
+NOTES_PAGE_SIZE = 10
+# Character name (lowercase) -> that character's note entries, oldest first.
+notes_log = {}
+notes_next_id = 1
+
+def append_notes_log(entry):
+    with open(resource_path(NOTES_LOG), "a") as f:
+        f.write(json.dumps(entry) + "\n")
+
+def apply_notes_entry(entry):
+    global notes_next_id
+    if "rename" in entry:
+        entries = notes_log.pop(entry["rename"].lower(), [])
+        notes_log.setdefault(entry["to"].lower(), []).extend(entries)
+    elif "delete" in entry:
+        entries = notes_log.get(entry["character"].lower(), [])
+        entries[:] = [note for note in entries if note["id"] != entry["delete"]]
+    else:
+        entries = notes_log.setdefault(entry["character"].lower(), [])
+        entries.append(entry)
+        # Restoring an undone note puts it back in time order.
+        if len(entries) > 1 and entries[-2]["id"] > entry["id"]:
+            entries.sort(key=lambda note: note["id"])
+        notes_next_id = max(notes_next_id, entry["id"] + 1)
+
+def load_notes_log():
+    global notes_next_id
+    notes_log.clear()
+    notes_next_id = 1
+    try:
+        with open(resource_path(NOTES_LOG), "r") as f:
+            for line in f:
+                if line.strip():
+                    apply_notes_entry(json.loads(line))
+    except FileNotFoundError:
+        pass
+
+def log_note(character_name, text, tags=(), timestamp=""):
+    """Append one note to the log; timestamp "" means now and None means undated (migrated notes)."""
+    entry = {
+        "id": notes_next_id,
+        "character": character_name,
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S") if timestamp == "" else timestamp,
+        "tags": sorted({tag.lower() for tag in tags}),
+        "text": text
+    }
+    log_notes_change(entry)
+    return entry
+
+def log_notes_change(entry):
+    append_notes_log(entry)
+    apply_notes_entry(entry)
+
+def migrate_string_notes(characters):
+    """
+    Move notes still kept as one string on the character into the log, one
+    entry per line, and clear the string. Returns True if anything moved.
 
-characters = load_characters()
-spells = load_spells()
-weapons = load_weapons()
-bag_of_holding = load_bag_of_holding()
+    A line already in the log as a migrated note of that character is not
+    logged again, so an older characters.json that comes back (checked out
+    again, or restored from history) doesn't duplicate its notes.
+    """
+    moved = False
+    for character in characters:
+        if isinstance(character.notes, str) and character.notes.strip():
+            migrated = {entry["text"] for entry in notes_log.get(character.name.lower(), []) if "migrated" in entry["tags"]}
+            for line in character.notes.splitlines():
+                # "None" is how the sheets say there's nothing to note.
+                if line.strip() and line.strip().lower() != "none" and line.strip() not in migrated:
+                    log_note(character.name, line.strip(), ["migrated"], timestamp=None)
+            character.notes = ""
+            moved = True
+    return moved
+
+def notes_logged_since(characters, first_id):
+    """The note entries of these characters with an id of at least first_id, e.g. the ones migrate_string_notes just logged."""
+    return [entry for character in characters for entry in notes_log.get(character.name.lower(), [])
+            if entry["id"] >= first_id]
+
+def remove_notes(entries):
+    for entry in entries:
+        log_notes_change({"character": entry["character"], "delete": entry["id"]})
+
+def restore_notes(entries):
+    for entry in entries:
+        log_notes_change(dict(entry))
+
+def format_note(entry):
+    tags = f" [{', '.join(entry['tags'])}]" if entry["tags"] else ""
+    when = entry["time"].replace("T", " ")[:16] if entry["time"] else "undated"
+    return f"{when}{tags}  {entry['text']}"
+
+def recent_notes_text(character, count=3):
+    entries = notes_log.get(character.name.lower(), [])
+    if not entries:
+        return "None"
+    lines = [format_note(entry) for entry in entries[-count:]]
+    if len(entries) > count:
+        lines.append(f"({len(entries) - count} older; see '{character.name} notes')")
+    return "\n".join(lines)
 
 def handle_add_note_command():
-    name = input("Enter character's name: ")
+    name = ask("Enter character's name: ")
     character = find_character_by_name(name)
     if character:
-        note = input("Enter the note: ")
-        character.notes += "\n" + note
-        save_characters(characters)
+        note = ask("Enter the note: ").strip()
+        if not note:
+            print("Nothing to add.")
+            return
+        tags = [tag.strip() for tag in ask("Enter tags (comma separated, optional): ").split(",") if tag.strip()]
+        entry = log_note(character.name, note, tags)
+        undo_history.record(
+            f"add note to {character.name}",
+            lambda: log_notes_change({"character": character.name, "delete": entry["id"]}),
+            lambda: log_notes_change(dict(entry, character=character.name))
+        )
         print(f"Note added to {name} successfully.")
     else:
         print(f"No character named {name} found.")
 
+def parse_notes_options(words):
+    """'page 2 tag loot since 2024-05-01 until 2024-06-01' -> dict; dates may be any prefix of YYYY-MM-DD."""
+    if len(words) % 2:
+        raise ValueError(f"'{words[-1]}' needs a value")
+    options = {"page": 1, "tag": None, "since": None, "until": None}
+    for key, value in zip(words[::2], words[1::2]):
+        if key not in options:
+            raise ValueError(f"unknown option '{key}'")
+        options[key] = int(value) if key == "page" else value.lower()
+    return options
+
+def note_matches(entry, options):
+    if options["tag"] and options["tag"] not in entry["tags"]:
+        return False
+    if options["since"] or options["until"]:
+        if not entry["time"]:
+            return False
+        # ISO timestamps compare correctly as strings; "until 2024-05" includes all of May.
+        if options["since"] and entry["time"] < options["since"]:
+            return False
+        if options["until"] and entry["time"][:len(options["until"])] > options["until"]:
+            return False
+    return True
+
+def handle_player_notes_command(parts):
+    """[name] notes [page N] [tag T] [since DATE] [until DATE], newest first."""
+    split = parts.index("notes", 1)
+    character_name = " ".join(parts[:split])
+    character = find_character_by_name(character_name)
+    if not character:
+        print(f"No character named {character_name} found.")
+        return
+    try:
+        options = parse_notes_options(parts[split + 1:])
+    except ValueError as e:
+        print(f"Error: {e}. Usage: [name] notes [page N] [tag T] [since YYYY-MM-DD] [until YYYY-MM-DD]")
+        return
+    entries = [entry for entry in reversed(notes_log.get(character.name.lower(), [])) if note_matches(entry, options)]
+    if not entries:
+        filtered = any(options[key] for key in ("tag", "since", "until"))
+        print(f"No notes for {character.name}{' match that filter' if filtered else ''}.")
+        return
+    pages = (len(entries) + NOTES_PAGE_SIZE - 1) // NOTES_PAGE_SIZE
+    page = min(max(options["page"], 1), pages)
+    print(f"Notes for {character.name} (page {page} of {pages}, {len(entries)} note{'s' if len(entries) != 1 else ''}, newest first):")
+    for entry in entries[(page - 1) * NOTES_PAGE_SIZE:page * NOTES_PAGE_SIZE]:
+        print(f"  {format_note(entry)}")
+    if page < pages:
+        print(f"  ... '{character.name} notes page {page + 1}' for older notes")
+
 def handle_add_spell_command():
     try:
-        spell_class = input("Enter the spell's class: ")
-        spell_save_dc = int(input("Enter the spell's save DC: "))
-        level = int(input("Enter the spell's level: "))
-        spell_name = input("Enter the spell's name: ")
-        description = input("Enter the spell's description: ")
-        casting_time = input("Enter the casting time: ")
-        range = input("Enter the range: ")
-        components = input("Enter the components: ")
-        duration = input("Enter the duration: ")
-
-        new_spell = Spell(spell_class, spell_save_dc, level, spell_name, description, casting_time, range, components, duration)
+        spell_class = ask("Enter the spell's class: ")
+        spell_save = ask("Enter the spell's saving throw (leave blank if none): ").strip() or None
+        spell_save_dc = int(ask("Enter the spell's save DC: "))
+        level = int(ask("Enter the spell's level: "))
+        spell_name = ask("Enter the spell's name: ")
+        description = ask("Enter the spell's description: ")
+        casting_time = ask("Enter the casting time: ")
+        range = ask("Enter the range: ")
+        components = ask("Enter the components: ")
+        duration = ask("Enter the duration: ")
+
+        new_spell = Spell(spell_class, spell_save, spell_save_dc, level, spell_name, description, casting_time, range, components, duration)
         spells.append(new_spell)
+        spell_index[new_spell.spell_name.lower()] = new_spell
+        if spell_query_index is not None:
+            spell_query_index.add(new_spell)
         save_spells(spells)
+        invalidate_action_indexes()
+        record_added(f"add spell {spell_name}", spells, [new_spell], after_spells_change)
         print(f"Spell {spell_name} has been added successfully.")
     except ValueError as e:
         print(f"Error: {e}. Please try again.")
 
 def handle_add_weapon_command():
     try:
-        name = input("Enter weapon's name: ")
-        attack_bonus = int(input("Enter the weapon's attack bonus: "))
-        damage = input("Enter the weapon's damage: ")
-        damage_type = input("Enter the weapon's damage type: ")
-        notes = input("Enter any additional notes: ")
+        name = ask("Enter weapon's name: ")
+        attack_bonus = int(ask("Enter the weapon's attack bonus: "))
+        damage = ask("Enter the weapon's damage: ")
+        damage_type = ask("Enter the weapon's damage type: ")
+        notes = ask("Enter any additional notes: ")
 
         new_weapon = Weapon(name, attack_bonus, damage, damage_type, notes)
         weapons.append(new_weapon)
         save_weapons(weapons)
+        invalidate_action_indexes()
+        record_added(f"add weapon {name}", weapons, [new_weapon], after_weapons_change)
         print(f"Weapon {name} has been added successfully.")
     except ValueError as e:
         print(f"Error: {e}. Please try again.")
@@ -486,20 +940,35 @@ def handle_weapon_info_command(parts):
         print(f"No weapon named {weapon_name} found.")
 
 def handle_add_item_to_bag_command():
-    item = input("Enter the item to add to the Bag of Holding: ")
+    item = ask("Enter the item to add to the Bag of Holding: ")
     bag_of_holding.add_item(item)
     save_bag_of_holding(bag_of_holding)
+    record_added(f"add {item} to the bag", bag_of_holding.items, [item], lambda: save_bag_of_holding(bag_of_holding))
     print(f"Item '{item}' added to the Bag of Holding successfully.")
 
 def handle_remove_item_from_bag_command():
-    item = input("Enter the item to remove from the Bag of Holding: ")
+    item = ask("Enter the item to remove from the Bag of Holding: ")
+    if item not in bag_of_holding.items:
+        print(f"Item '{item}' is not in the Bag of Holding.")
+        return
+    position = bag_of_holding.items.index(item)
     bag_of_holding.remove_item(item)
     save_bag_of_holding(bag_of_holding)
+
+    def undo():
+        bag_of_holding.items.insert(position, item)
+        save_bag_of_holding(bag_of_holding)
+
+    def redo():
+        del bag_of_holding.items[position]
+        save_bag_of_holding(bag_of_holding)
+
+    undo_history.record(f"remove {item} from the bag", undo, redo)
     print(f"Item '{item}' removed from the Bag of Holding successfully.")
 
 def handle_list_bag_items_command():
     print("Items in the Bag of Holding:")
-    print(bag_of_holding.list_items())
+    show_paged(iter(bag_of_holding.items))
 
 def get_best_character_for_stat(skill):
     best_character = None
@@ -512,10 +981,176 @@ def get_best_character_for_stat(skill):
     return best_character
 
 def find_character_by_name(name):
+    """
+    Find a character by name.
+
+    Args:
+    name (str): The name of the character.
+
+    Returns:
+    Character: The character object if found, None otherwise.
+    """
     return next((char for char in characters if char.name.lower() == name.lower()), None)
 
+party_matrix = None
+
+def get_party_matrix():
+    """The roster's stat matrix, rebuilt after any character change is saved."""
+    global party_matrix
+    if party_matrix is None:
+        import party
+        party_matrix = party.PartyMatrix(
+            [character.name for character in characters],
+            [character.ability_modifiers for character in characters],
+            [character.proficiencies for character in characters],
+            [character.saving_throws for character in characters],
+            [character.proficiency_bonus for character in characters],
+            # "social interaction" is only a catch-all for checks, not a skill anyone is proficient in.
+            {skill: ability for skill, ability in SKILL_TO_ABILITY.items() if skill != "social interaction"}
+        )
+    return party_matrix
+
+def format_modifier(value):
+    return f"{value:+d}"
+
+def handle_party_report_command():
+    import party
+    matrix = get_party_matrix()
+    if not matrix.names:
+        print("There are no characters in the party.")
+        return
+    rows = matrix.report()
+    print(f"Party coverage ({len(matrix.names)} characters):")
+    print(f"{'Stat':<22}{'Best':>5}  {'Who':<24}Proficient")
+    for stat, best, holders, proficient, _, _, _ in rows:
+        print(f"{party.stat_label(stat):<22}{format_modifier(best):>5}  {', '.join(holders):<24}{', '.join(proficient) or '-'}")
+    gaps = [row for row in rows if row[4]]
+    if not gaps:
+        print("\nNo gaps: someone is proficient in everything and no best modifier is below "
+              f"{format_modifier(party.WEAK_MODIFIER)}.")
+        return
+    print("\nGaps:")
+    for stat, best, holders, proficient, _, pick, pick_value in gaps:
+        reason = "nobody is proficient" if not proficient else "proficient but weak"
+        line = f"  {party.stat_label(stat)}: {reason}, best is {format_modifier(best)} ({', '.join(holders)})."
+        if pick:
+            line += f" Making {pick} proficient raises it to {format_modifier(pick_value)}."
+        print(line)
+
+def parse_party_stat(text):
+    """'stealth', 'dex save' or 'dexterity save' -> the matrix's stat name."""
+    text = text.lower().strip()
+    if text.endswith(" save"):
+        text = text[:-len(" save")]
+        return next((ability for ability in ABILITY_NAMES if ability.startswith(text[:3])), None)
+    return text if text in get_party_matrix().columns else None
+
+def handle_party_what_if_command(parts):
+    """party what if [character] gains|loses [skill or save]"""
+    import party
+    verb = next((word for word in parts[3:] if word in ("gains", "loses")), None)
+    if not verb:
+        print("Usage: party what if [character] gains|loses [skill or save] (e.g. party what if Ash gains stealth).")
+        return
+    split = parts.index(verb)
+    name, stat = " ".join(parts[3:split]), parse_party_stat(" ".join(parts[split + 1:]))
+    character = find_character_by_name(name)
+    if not character:
+        print(f"No character named {name} found.")
+        return
+    if not stat:
+        print(f"Unknown skill or save '{' '.join(parts[split + 1:])}'.")
+        return
+    before, after, holders, before_count, after_count = get_party_matrix().what_if(character.name, stat, verb == "gains")
+    change = after - before
+    print(f"{party.stat_label(stat)}: best {format_modifier(before)} -> {format_modifier(after)} ({', '.join(holders)}), "
+          f"proficient {before_count} -> {after_count}.")
+    if change > 0:
+        print(f"The party's best {party.stat_label(stat)} improves by {change}.")
+    elif change < 0:
+        print(f"The party's best {party.stat_label(stat)} drops by {-change}.")
+    else:
+        print("The party's best modifier doesn't change.")
+
+def handle_check_data_command():
+    """Check every cross-reference in the loaded campaign. Returns the number of problems found."""
+    import integrity
+    stores = {
+        "characters": [character.to_dict() for character in characters],
+        "spells": [spell.to_dict() for spell in spells],
+        "weapons": [weapon.to_dict() for weapon in weapons],
+        "npcs": [npc.to_dict() for npc in npcs],
+        "guilds": [guild.to_dict() for guild in guilds],
+    }
+    problems = integrity.check_campaign(stores)
+    print("\n".join(integrity.format_report(problems, {kind: len(records) for kind, records in stores.items()})))
+    return len(problems)
+
+CHECK_MODES = {"adv": "advantage", "advantage": "advantage", "dis": "disadvantage", "disadvantage": "disadvantage"}
+# Named features that add a die to an ability check.
+CHECK_FEATURE_DICE = {"guidance": 4, "bardic": 6, "inspiration": 6}
+
+def parse_check_options(words):
+    """
+    'dc 15 adv guidance bardic d8' -> (15, "advantage", (4, 8)).
+    Extra dice can be named features (a die right after one sets its size) or plain d4/+1d6 terms.
+    """
+    dc, mode, dice = None, "normal", []
+    words = [word.lower() for word in words]
+    i = 0
+    while i < len(words):
+        word = words[i]
+        match = re.fullmatch(r"\+?(\d*)d(\d+)", word)
+        if word == "dc":
+            if i + 1 == len(words):
+                raise ValueError("'dc' needs a number")
+            dc = int(words[i + 1])
+            i += 1
+        elif word in CHECK_MODES:
+            mode = CHECK_MODES[word]
+        elif word in CHECK_FEATURE_DICE:
+            sides = CHECK_FEATURE_DICE[word]
+            size = re.fullmatch(r"d(\d+)", words[i + 1]) if i + 1 < len(words) else None
+            if size:
+                sides = int(size.group(1))
+                i += 1
+            dice.append(sides)
+        elif match:
+            dice.extend([int(match.group(2))] * int(match.group(1) or 1))
+        else:
+            raise ValueError(f"don't know what '{word}' means here")
+        i += 1
+    if dc is None:
+        raise ValueError("missing 'dc N'")
+    return dc, mode, tuple(sorted(dice))
+
+def handle_check_probability_command(skill, words):
+    """[skill] check dc N [adv|dis] [guidance] [bardic dN] [dN...]: rank everyone by their exact chance to succeed."""
+    import dice
+    try:
+        dc, mode, extra_dice = parse_check_options(words)
+    except ValueError as e:
+        print(f"Error: {e}. Usage: [skill] check dc 15 [adv|dis] [guidance] [bardic d6]")
+        return
+    ranked = []
+    for character in characters:
+        modifier = character.get_stat(skill)
+        if modifier is not None:
+            ranked.append((dice.success_probability(modifier, dc, mode, extra_dice), modifier, character.name))
+    if not ranked:
+        print(f"No character has a stat for {skill}.")
+        return
+    ranked.sort(key=lambda entry: (-entry[0], entry[2].lower()))
+    extras = " + ".join(f"d{sides}" for sides in extra_dice)
+    print(f"{skill.capitalize()} check, DC {dc}" + (f" with {mode}" if mode != "normal" else "") + (f", adding {extras}" if extras else "") + ":")
+    for rank, (probability, modifier, name) in enumerate(ranked, 1):
+        print(f"{rank:>3}. {name:<20}{modifier:+3d}  {probability:6.1%}")
+
 def handle_check_command(parts):
-    if len(parts) >= 2:
+    if "check" in parts and parts.index("check") + 1 < len(parts):
+        split = parts.index("check")
+        handle_check_probability_command(" ".join(parts[:split]), parts[split + 1:])
+    elif len(parts) >= 2:
         skill_to_check = " ".join(parts[:-1])
         best_character = get_best_character_for_stat(skill_to_check)
         if best_character:
@@ -527,138 +1162,787 @@ def handle_check_command(parts):
 
 def handle_add_character_command():
     try:
-        name = input("Enter character's name: ")
-        race = input("Enter character's race: ")
-        sub_race = input("Enter character's sub-race (if any): ")
-        char_class = input("Enter character's class: ")
-        level = int(input("Enter character's level: "))
-        sub_class = input("Enter character's subclass: ")
+        name = ask("Enter character's name: ")
+        race = ask("Enter character's race: ")
+        sub_race = ask("Enter character's sub-race (if any): ")
+        char_class = ask("Enter character's class: ")
+        level = int(ask("Enter character's level: "))
+        sub_class = ask("Enter character's subclass: ")
         abilities = {}
         for ability in ["strength", "dexterity", "constitution", "intelligence", "wisdom", "charisma"]:
-            abilities[ability] = int(input(f"Enter {name}'s {ability} modifier: "))
-        proficiencies = input(f"Enter {name}'s proficiencies (comma separated): ").lower().split(", ")
-        saving_throws = input(f"Enter {name}'s saving throw proficiencies (comma separated): ").lower().split(", ")
-        god = input(f"Enter the god {name} worships: ")
-        proficiency_bonus = int(input(f"Enter the proficiency bonus for {name}: "))
-        notes = input(f"Enter any additional notes for {name}: ")
-
-        weapons = input(f"Enter {name}'s weapons (comma separated): ").lower().split(", ")
+            abilities[ability] = int(ask(f"Enter {name}'s {ability} modifier: "))
+        proficiencies = ask(f"Enter {name}'s proficiencies (comma separated): ").lower().split(", ")
+        saving_throws = ask(f"Enter {name}'s saving throw proficiencies (comma separated): ").lower().split(", ")
+        god = ask(f"Enter the god {name} worships: ")
+        proficiency_bonus = int(ask(f"Enter the proficiency bonus for {name}: "))
+        notes = ask(f"Enter any additional notes for {name}: ")
+
+        weapons = ask(f"Enter {name}'s weapons (comma separated): ").lower().split(", ")
         race_abilities = {}
         while True:
-            add_race_ability = input("Add a race ability? (y/n): ").lower()
+            add_race_ability = ask("Add a race ability? (y/n): ").lower()
             if add_race_ability == 'n':
                 break
-            ability_name = input("Enter race ability name: ")
-            ability_time = input("Enter the time it takes to complete (action, bonus action, reaction): ")
-            ability_description = input("Enter the ability description: ")
+            ability_name = ask("Enter race ability name: ")
+            ability_time = ask("Enter the time it takes to complete (action, bonus action, reaction): ")
+            ability_description = ask("Enter the ability description: ")
             race_abilities[ability_name] = {"time": ability_time, "description": ability_description}
 
         class_abilities = {}
         while True:
-            add_class_ability = input("Add a class ability? (y/n): ").lower()
+            add_class_ability = ask("Add a class ability? (y/n): ").lower()
             if add_class_ability == 'n':
                 break
-            ability_name = input("Enter class ability name: ")
-            ability_time = input("Enter the time it takes to complete (action, bonus action, reaction): ")
-            ability_description = input("Enter the ability description: ")
+            ability_name = ask("Enter class ability name: ")
+            ability_time = ask("Enter the time it takes to complete (action, bonus action, reaction): ")
+            ability_description = ask("Enter the ability description: ")
             class_abilities[ability_name] = {"time": ability_time, "description": ability_description}
 
         spells = []
         while True:
-            add_spell = input("Add a spell? (y/n): ").lower()
+            add_spell = ask("Add a spell? (y/n): ").lower()
             if add_spell == 'n':
                 break
-            level = int(input("Enter spell level: "))
-            name = input("Enter spell name: ")
-            casting_time = input("Enter casting time: ")
-            description = input("Enter spell description: ")
-            range = input("Enter spell range: ")
-            components = input("Enter spell components: ")
-            duration = input("Enter spell duration: ")
-            spells.append({"level": level, "name": name, "casting_time": casting_time, "description": description, "range": range, "components": components, "duration": duration})
+            spell_name = ask("Enter spell name: ")
+            if find_spell_by_name(spell_name):
+                spells.append({"name": spell_name})
+                continue
+            spell_level = int(ask("Enter spell level: "))
+            casting_time = ask("Enter casting time: ")
+            description = ask("Enter spell description: ")
+            range = ask("Enter spell range: ")
+            components = ask("Enter spell components: ")
+            duration = ask("Enter spell duration: ")
+            spells.append({"level": spell_level, "name": spell_name, "casting_time": casting_time, "description": description, "range": range, "components": components, "duration": duration})
 
         new_character = Character(
             name, race, sub_race, char_class, level, sub_class, abilities, proficiencies, god, proficiency_bonus,
             saving_throws, notes, weapons, race_abilities, class_abilities, spells)
+        first_note_id = notes_next_id
+        migrate_string_notes([new_character])
         characters.append(new_character)
         save_characters(characters)
+        record_added(f"add character {name}", characters, [new_character], after_characters_change,
+                     notes_logged_since([new_character], first_note_id))
         print(f"{name} has been added successfully.")
     except ValueError as e:
         print(f"Error: {e}. Please try again.")
 
-def handle_player_turn_command(parts):
+ACTION_CATEGORIES = ("action", "bonus", "reaction", "free")
+
+CLASS_BONUS_ACTIONS = {
+    "fighter": ("Second Wind", "Regain hit points equal to 1d10 + your fighter level as a bonus action."),
+    "rogue": ("Cunning Action", "Dash, Disengage, or Hide as a bonus action."),
+}
+
+
+def normalize_action_time(time_text):
+    """
+    Map a free-form casting or activation time onto the action economy.
+
+    "Action", "1 action" and "Instant" all count as an action, anything
+    mentioning a bonus action or a reaction goes to those slots, and
+    triggered abilities ("when hitting with a melee weapon attack") are free.
+
+    Returns:
+    str: One of ACTION_CATEGORIES, or None for things that take longer than a turn.
+    """
+    text = " ".join(str(time_text or "").lower().split())
+    if not text:
+        return None
+    if "bonus" in text:
+        return "bonus"
+    if "reaction" in text:
+        return "reaction"
+    if "action" in text or text in ("instant", "instantaneous"):
+        return "action"
+    if text.startswith(("when ", "free", "no action", "passive")):
+        return "free"
+    return None
+
+
+def parse_classes(char_class):
+    """Split a class field like "Paladin/Barbarian 7" into a set of lowercase class names."""
+    classes = set()
+    for part in re.split(r"[/,&+]", char_class or ""):
+        name = " ".join(re.sub(r"\d+", " ", part).split()).lower()
+        if name:
+            classes.add(name)
+    return classes
+
+
+def format_spell_entry(spell, spell_obj):
+    info = (
+        f"\033[3m{spell['name']}\033[0m (Level {spell.get('level', '?')}): {spell.get('description', '')}\n"
+        f"Casting Time: {spell.get('casting_time', 'N/A')}\n"
+        f"Range: {spell.get('range', 'N/A')}\n"
+        f"Damage Dice: {spell.get('damage_dice') or 'N/A'}"
+    )
+    if spell_obj:
+        info += (
+            f"\nSpell Type: {spell_obj.spell_type}\n"
+            f"Spell Save: {spell_obj.spell_save if spell_obj.spell_save else 'N/A'}\n"
+            f"Spell Save DC: {spell_obj.spell_save_dc if spell_obj.spell_save_dc else 'N/A'}"
+        )
+    return info
+
+
+def index_weapons_by_name():
+    return {weapon.name.lower(): weapon for weapon in weapons}
+
+def build_action_index(character, weapons_by_name=None):
+    """
+    Sort every weapon, ability and spell a character has into action,
+    bonus action, reaction and free slots.
+
+    Each slot holds (kind, name, text) tuples with the text already
+    formatted for the turn sheet, so showing a turn is just a join.
+    weapons_by_name (from index_weapons_by_name) saves building the lookup per character.
+    """
+    if weapons_by_name is None:
+        weapons_by_name = index_weapons_by_name()
+    index = {category: [] for category in ACTION_CATEGORIES}
+    seen = set()
+
+    def add(category, kind, name, text):
+        key = (category, name.lower())
+        if key not in seen:
+            seen.add(key)
+            index[category].append((kind, name, text))
+
+    for weapon_name in character.weapons:
+        weapon = weapons_by_name.get(weapon_name.lower())
+        if weapon:
+            add("action", "attack", weapon.name, f"\033[3m{weapon.name}\033[0m (Attack Bonus: {weapon.attack_bonus}, Damage: {weapon.damage} {weapon.damage_type})")
+
+    for kind, abilities in (("class", character.class_abilities), ("race", character.race_abilities)):
+        for name, details in abilities.items():
+            category = normalize_action_time(details.get("time"))
+            if category:
+                add(category, kind, name, f"\033[3m{name}\033[0m: {details.get('description', '')}")
+
+    for name, description in (CLASS_BONUS_ACTIONS[c] for c in parse_classes(character.char_class) if c in CLASS_BONUS_ACTIONS):
+        add("bonus", "feature", name, f"\033[3m{name}\033[0m: {description}")
+    if "two-weapon fighting" in character.proficiencies:
+        add("bonus", "feature", "Two-Weapon Fighting", "\033[3mTwo-Weapon Fighting\033[0m: Use a bonus action to attack with a different light melee weapon that you're holding in the other hand.")
+
+    for ref in character.spells:
+        spell = resolve_spell(ref)
+        category = normalize_action_time(spell.get("casting_time"))
+        if category:
+            add(category, "spell", spell["name"], format_spell_entry(spell, find_spell_by_name(spell["name"])))
+
+    return index
+
+
+def get_action_index(character):
+    """Return the character's cached action index, building it if needed."""
+    if character.actions is None:
+        character.actions = build_action_index(character)
+    return character.actions
+
+
+def index_actions(characters):
+    weapons_by_name = index_weapons_by_name()
+    for character in characters:
+        character.actions = build_action_index(character, weapons_by_name)
+
+
+def invalidate_action_indexes():
+    for character in characters:
+        character.invalidate()
+
+
+FULL_CASTERS = {"bard", "cleric", "druid", "sorcerer", "wizard"}
+HALF_CASTERS = {"paladin", "ranger"}
+
+# Spell slots per spell level for a given (multiclass) spellcaster level.
+SPELL_SLOTS = [
+    [],
+    [2], [3], [4, 2], [4, 3], [4, 3, 2],
+    [4, 3, 3], [4, 3, 3, 1], [4, 3, 3, 2], [4, 3, 3, 3, 1], [4, 3, 3, 3, 2],
+    [4, 3, 3, 3, 2, 1], [4, 3, 3, 3, 2, 1], [4, 3, 3, 3, 2, 1, 1], [4, 3, 3, 3, 2, 1, 1], [4, 3, 3, 3, 2, 1, 1, 1],
+    [4, 3, 3, 3, 2, 1, 1, 1], [4, 3, 3, 3, 2, 1, 1, 1, 1], [4, 3, 3, 3, 3, 1, 1, 1, 1], [4, 3, 3, 3, 3, 2, 1, 1, 1],
+    [4, 3, 3, 3, 3, 2, 2, 1, 1],
+]
+
+COUNT_WORDS = {"once": 1, "one": 1, "twice": 2, "two": 2, "thrice": 3, "three": 3}
+REST_WORDS = {"short or long rest": "short", "short rest": "short", "rest": "short", "sr": "short",
+              "long rest": "long", "lr": "long", "day": "long"}
+USES_PER_REST = re.compile(r"\b(\d+|once|one|twice|two|thrice|three)\b(?: (?:charges?|times?|uses?))? (?:per|each) (short or long rest|short rest|long rest|rest|sr|lr|day)\b")
+UNTIL_REST = re.compile(r"until (?:after )?you (?:take|finish) a (short or long rest|short rest|long rest)")
+
+def parse_rest_limit(text):
+    """
+    Read a usage limit out of prose like "3 charges per LR", "twice per long rest"
+    or "until after you take a Short or Long Rest".
+
+    Returns:
+    tuple: (uses, "short" or "long"), or None if the text has no limit in it.
+    """
+    text = " ".join(str(text or "").lower().split())
+    match = USES_PER_REST.search(text)
+    if match:
+        count = match.group(1)
+        return int(count) if count.isdigit() else COUNT_WORDS[count], REST_WORDS[match.group(2)]
+    match = UNTIL_REST.search(text)
+    if match:
+        return 1, REST_WORDS[match.group(1)]
+    return None
+
+def class_levels(character):
+    """
+    Levels per class: the stored split if there is one, else whatever the class
+    field gives ("Paladin 5/Barbarian 2", or a single class). None if unknown.
+    """
+    if character.class_levels:
+        return {name.lower(): level for name, level in character.class_levels.items()}
+    import derived
+    return derived.parse_class_levels(character.char_class, character.level)
+
+def spell_slots(character):
+    levels = class_levels(character)
+    if not levels:
+        return []
+    full = sum(level for name, level in levels.items() if name in FULL_CASTERS)
+    half = [level for name, level in levels.items() if name in HALF_CASTERS]
+    if len(levels) == 1 and half:
+        caster_level = math.ceil(half[0] / 2) if half[0] >= 2 else 0
+    else:
+        # Multiclassing halves each half-caster class on its own, rounding down.
+        caster_level = full + sum(level // 2 for level in half)
+    return SPELL_SLOTS[min(caster_level, 20)]
+
+def build_resource_limits(character, weapons_by_name=None):
+    """
+    Work out every limited resource a character has.
+
+    Spell slots come from class and level, charges and per-rest uses are
+    read from weapon notes and ability descriptions, and anything in the
+    character's own "resources" entry wins over both.
+
+    Returns:
+    dict: lowercase resource name -> (display name, maximum uses, "short"/"long")
+    """
+    if weapons_by_name is None:
+        weapons_by_name = index_weapons_by_name()
+    limits = {}
+    for slot_level, count in enumerate(spell_slots(character), 1):
+        limits[f"slot {slot_level}"] = (f"slot {slot_level}", count, "long")
+    for weapon_name in character.weapons:
+        weapon = weapons_by_name.get(weapon_name.lower())
+        limit = parse_rest_limit(weapon.notes) if weapon else None
+        if limit:
+            limits[weapon.name.lower()] = (weapon.name, *limit)
+    for abilities in (character.race_abilities, character.class_abilities):
+        for name, details in abilities.items():
+            limit = parse_rest_limit(details.get("description"))
+            if limit:
+                limits[name.lower()] = (name, *limit)
+    for name, details in character.resources.items():
+        limits[name.lower()] = (name, int(details.get("max", 1)), details.get("reset", "long"))
+    return limits
+
+def get_resource_limits(character, weapons_by_name=None):
+    if character.resource_limits is None:
+        character.resource_limits = build_resource_limits(character, weapons_by_name)
+    return character.resource_limits
+
+
+# How many uses of each resource have been spent: (character, resource) -> used,
+# both lowercase. Every change is appended to a small journal rather than
+# rewriting characters.json; the journal is compacted once it gets long.
+RESOURCE_JOURNAL = "resources.jsonl"
+RESOURCE_JOURNAL_LIMIT = 1000
+resource_usage = {}
+resource_journal_lines = 0
+
+def append_resource_journal(entry):
+    global resource_journal_lines
+    with open(resource_path(RESOURCE_JOURNAL), "a") as f:
+        f.write(json.dumps(entry) + "\n")
+    resource_journal_lines += 1
+    if resource_journal_lines > RESOURCE_JOURNAL_LIMIT:
+        compact_resource_journal()
+
+def compact_resource_journal():
+    global resource_journal_lines
+    temp_path = resource_path(RESOURCE_JOURNAL + ".tmp")
+    with open(temp_path, "w") as f:
+        for (character_name, resource), used in resource_usage.items():
+            f.write(json.dumps({"character": character_name, "resource": resource, "used": used}) + "\n")
+    os.replace(temp_path, resource_path(RESOURCE_JOURNAL))
+    resource_journal_lines = len(resource_usage)
+
+def apply_rest(kind):
+    """Clear usage of everything that comes back on this kind of rest ("long" restores everything)."""
+    for character in characters:
+        character.best_actions = {}
+    if kind == "long":
+        resource_usage.clear()
+        return
+    by_name = {character.name.lower(): character for character in characters}
+    weapons_by_name = index_weapons_by_name()
+    for key in list(resource_usage):
+        character = by_name.get(key[0])
+        limit = get_resource_limits(character, weapons_by_name).get(key[1]) if character else None
+        if limit is None or limit[2] == "short":
+            del resource_usage[key]
+
+def load_resource_usage():
+    global resource_journal_lines
+    resource_usage.clear()
+    resource_journal_lines = 0
+    try:
+        with open(resource_path(RESOURCE_JOURNAL), "r") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                entry = json.loads(line)
+                resource_journal_lines += 1
+                if "rest" in entry:
+                    apply_rest(entry["rest"])
+                elif entry["used"]:
+                    resource_usage[(entry["character"], entry["resource"])] = entry["used"]
+                else:
+                    resource_usage.pop((entry["character"], entry["resource"]), None)
+    except FileNotFoundError:
+        pass
+
+def set_resource_used(character, resource, used):
+    character.best_actions = {}
+    key = (character.name.lower(), resource.lower())
+    if used:
+        resource_usage[key] = used
+    else:
+        resource_usage.pop(key, None)
+    append_resource_journal({"character": key[0], "resource": key[1], "used": used})
+
+def restore_resource_usage(saved):
+    """Put usage back to a copy taken earlier, journalling only the entries that differ."""
+    for character in characters:
+        character.best_actions = {}
+    for key in set(resource_usage) | set(saved):
+        if resource_usage.get(key, 0) != saved.get(key, 0):
+            if saved.get(key):
+                resource_usage[key] = saved[key]
+            else:
+                resource_usage.pop(key, None)
+            append_resource_journal({"character": key[0], "resource": key[1], "used": saved.get(key, 0)})
+
+def rename_resource_usage(old, new):
+    """Move a character's usage to their new name, so a rename doesn't hand back spent uses."""
+    old, new = old.lower(), new.lower()
+    if old == new:
+        return
+    for key in [key for key in resource_usage if key[0] == old]:
+        used = resource_usage.pop(key)
+        resource_usage[(new, key[1])] = used
+        append_resource_journal({"character": old, "resource": key[1], "used": 0})
+        append_resource_journal({"character": new, "resource": key[1], "used": used})
+
+def resource_remaining(character, resource):
+    limit = get_resource_limits(character).get(resource.lower())
+    if limit is None:
+        return None
+    return limit[1] - resource_usage.get((character.name.lower(), resource.lower()), 0)
+
+def handle_use_command():
+    name = ask("Enter character's name: ")
+    character = find_character_by_name(name)
+    if not character:
+        print(f"No character named {name} found.")
+        return
+    limits = get_resource_limits(character)
+    if not limits:
+        print(f"{character.name} has no limited resources.")
+        return
+    resource = ask(f"Enter the resource to use ({', '.join(limit[0] for limit in limits.values())}): ").strip()
+    limit = limits.get(resource.lower())
+    if not limit:
+        print(f"{character.name} has no resource called {resource}.")
+        return
+    remaining = resource_remaining(character, resource)
+    if remaining <= 0:
+        print(f"{character.name} has no {limit[0]} left until a {limit[2]} rest.")
+        return
+    used = limit[1] - remaining + 1
+    set_resource_used(character, resource, used)
+    undo_history.record(f"use {limit[0]} ({character.name})",
+                        lambda: set_resource_used(character, resource, used - 1),
+                        lambda: set_resource_used(character, resource, used))
+    print(f"{character.name} uses {limit[0]}: {remaining - 1}/{limit[1]} left.")
+
+def rest(kind):
+    apply_rest(kind)
+    append_resource_journal({"rest": kind})
+
+def handle_rest_command(kind):
+    saved = dict(resource_usage)
+    rest(kind)
+    undo_history.record(f"{kind} rest", lambda: restore_resource_usage(saved), lambda: rest(kind))
+    if kind == "long":
+        print("The party takes a long rest. All charges, uses and spell slots are restored.")
+    else:
+        print("The party takes a short rest. Short-rest abilities are restored.")
+
+def handle_player_resources_command(parts):
     character_name = " ".join(parts[:-1])
     character = find_character_by_name(character_name)
     if not character:
         print(f"No character named {character_name} found.")
         return
+    limits = get_resource_limits(character)
+    if not limits:
+        print(f"{character.name} has no limited resources.")
+        return
+    print(f"{'Resource':<28}{'Left':>8}  Recharges on")
+    for key, (display_name, maximum, reset) in limits.items():
+        print(f"{display_name:<28}{resource_remaining(character, key):>4}/{maximum:<3}  {reset} rest")
+
+def handle_add_resource_command():
+    try:
+        name = ask("Enter character's name: ")
+        character = find_character_by_name(name)
+        if not character:
+            print(f"No character named {name} found.")
+            return
+        resource = ask("Enter the resource name: ").strip()
+        maximum = int(ask("Enter how many uses it has: "))
+        reset = ask("Does it come back on a short or long rest? (short/long): ").strip().lower()
+        if reset not in ("short", "long"):
+            raise ValueError("answer short or long")
+        old_resources = character.resources
+        character.resources = dict(old_resources, **{resource: {"max": maximum, "reset": reset}})
+        character.invalidate()
+        save_characters(characters)
+        record_changes(f"add resource {resource} to {character.name}", character, {"resources": old_resources}, after_characters_change)
+        print(f"{resource} added to {character.name}.")
+    except ValueError as e:
+        print(f"Error: {e}. Please try again.")
+
+def is_exhausted(character, kind, name, spell_levels):
+    """Whether a turn sheet entry should be hidden because its resource is used up."""
+    remaining = resource_remaining(character, name)
+    if remaining is not None and remaining <= 0:
+        return True
+    level = spell_levels.get(name.lower(), 0) if kind == "spell" else 0
+    if level and spell_slots(character):
+        return all((resource_remaining(character, f"slot {slot}") or 0) <= 0 for slot in range(level, 10))
+    return False
+
+ABILITY_NAMES = ("strength", "dexterity", "constitution", "intelligence", "wisdom", "charisma")
+
+derived_stats_key = None
+# No ability modifier goes above +10 (a score of 30).
+MAX_MODIFIER = 10
+
+def migrate_scores_stored_as_modifiers(characters):
+    """
+    Some sheets hold ability scores (18) in the modifier fields (+4). Any
+    value above +10 gives that away; such values move to ability_scores, so
+    the modifiers are derived from them like any other stored scores and
+    every command sees the same +4. Returns True if anything moved.
+    """
+    moved = False
+    for character in characters:
+        if not character.ability_scores and any(value > MAX_MODIFIER for value in character.ability_modifiers.values()):
+            character.ability_scores = {ability: character.ability_modifiers.get(ability, 10) for ability in ABILITY_NAMES}
+            moved = True
+    return moved
+
+def recompute_derived_stats():
+    """
+    Derive modifiers (from ability scores) and proficiency bonus (from level)
+    for every character that stores scores or a class split, in one pass.
+    Nothing is recomputed while none of those inputs have changed.
+
+    Returns:
+    list: The characters whose modifiers or proficiency bonus changed.
+    """
+    global derived_stats_key
+    import derived
+    migrate_scores_stored_as_modifiers(characters)
+    roster = [character for character in characters if character.ability_scores or character.class_levels]
+    key = tuple(
+        (id(character), tuple(character.ability_scores.get(ability, 10) for ability in ABILITY_NAMES),
+         sum(character.class_levels.values()) or character.level, bool(character.ability_scores))
+        for character in roster
+    )
+    if key == derived_stats_key:
+        return []
+    derived_stats_key = key
+    modifier_rows, bonuses = derived.derive([entry[1] for entry in key], [entry[2] for entry in key])
+    changed = []
+    for character, entry, modifiers, bonus in zip(roster, key, modifier_rows, bonuses):
+        new_modifiers = dict(zip(ABILITY_NAMES, modifiers)) if entry[3] else character.ability_modifiers
+        if new_modifiers != character.ability_modifiers or bonus != character.proficiency_bonus or entry[2] != character.level:
+            character.ability_modifiers = new_modifiers
+            character.proficiency_bonus = bonus
+            character.level = entry[2]
+            character.invalidate()
+            changed.append(character)
+    return changed
+
+def handle_level_up_command():
+    import derived
+    try:
+        name = ask("Enter character's name: ")
+        character = find_character_by_name(name)
+        if not character:
+            print(f"No character named {name} found.")
+            return
+        old_values = {field: getattr(character, field) for field in
+                      ("level", "char_class", "class_levels", "ability_scores", "ability_modifiers", "proficiency_bonus")}
+        levels = class_levels(character)
+        if not levels:
+            split = ask(f"Enter {character.name}'s levels per class (e.g. Paladin 5/Barbarian 2): ")
+            levels = derived.parse_class_levels(split, character.level)
+            if not levels:
+                raise ValueError("give a level after every class")
+        current = derived.format_class_levels(levels)
+        default = next(iter(levels))
+        gained = ask(f"Which class gains the level? (current: {current}; blank for {default.title()}): ").strip().lower() or default
+        new_class = gained not in levels
+        levels = dict(levels, **{gained: levels.get(gained, 0) + 1})
+
+        scores = dict(character.ability_scores)
+        if scores:
+            increase = ask("Ability score increases (e.g. str 2 or str 1, dex 1; blank for none): ")
+            for ability, amount in parse_ability_values(increase).items():
+                scores[ability] = min(20, scores.get(ability, 10) + amount)
+        else:
+            entered = ask("Enter ability scores to compute modifiers from them (e.g. str 16, dex 14, con 14, int 10, wis 12, cha 8; blank to keep modifiers): ")
+            scores = parse_ability_values(entered)
+            if scores and len(scores) < len(ABILITY_NAMES):
+                raise ValueError("give all six ability scores")
+
+        character.class_levels = levels
+        character.ability_scores = scores
+        if new_class:
+            character.char_class = f"{character.char_class}/{gained.title()}" if character.char_class else gained.title()
+        recompute_derived_stats()
+        save_characters(characters)
+        record_changes(f"level up {character.name}", character, old_values, after_characters_change)
+        print(f"{character.name} is now level {character.level} ({derived.format_class_levels(levels)}), "
+              f"proficiency bonus +{character.proficiency_bonus}.")
+        if scores:
+            print("Modifiers: " + ", ".join(f"{ability[:3].capitalize()} {character.ability_modifiers[ability]:+d}" for ability in ABILITY_NAMES))
+    except ValueError as e:
+        print(f"Error: {e}. Please try again.")
+SPELLCASTING_ABILITY = {
+    "wizard": "intelligence", "artificer": "intelligence",
+    "cleric": "wisdom", "druid": "wisdom", "ranger": "wisdom",
+    "bard": "charisma", "sorcerer": "charisma", "warlock": "charisma", "paladin": "charisma",
+}
+EXTRA_ATTACK_CLASSES = {"fighter", "paladin", "barbarian", "ranger", "monk"}
+DICE = re.compile(r"(\d*)d(\d+)")
+DAMAGE_IN_TEXT = re.compile(r"(\d+d\d+(?:\s*\+\s*\d+)?)(?:\s+\w+)?\s+damage")
+SAVE_IN_TEXT = re.compile(r"(strength|dexterity|constitution|intelligence|wisdom|charisma) saving throw")
+
+def average_damage(expression):
+    """Split a damage string like "2d6+4", "1d12 1d4" or "1d4 3" into (average of the dice, flat bonus)."""
+    text = str(expression or "").lower()
+    dice = sum(int(count or 1) * (int(sides) + 1) / 2 for count, sides in DICE.findall(text))
+    flat = sum(int(number.replace(" ", "")) for number in re.findall(r"[+-]?\s*\d+", DICE.sub(" ", text)))
+    return dice, flat
+
+def hit_chance(attack_bonus, ac):
+    return min(0.95, max(0.05, (21 - (ac - attack_bonus)) / 20))
+
+def expected_attack_damage(attack_bonus, dice, flat, ac):
+    """Expected damage of one attack roll; a natural 20 (5%) doubles the dice."""
+    return (hit_chance(attack_bonus, ac) - 0.05) * (dice + flat) + 0.05 * (2 * dice + flat)
+
+def failed_save_chance(dc, save_modifier):
+    return min(1.0, max(0.0, (dc - save_modifier - 1) / 20))
+
+def ability_modifier(character, ability):
+    return character.ability_modifiers.get(ability, 0)
+
+def spellcasting_modifier(character):
+    abilities = [SPELLCASTING_ABILITY[c] for c in parse_classes(character.char_class) if c in SPELLCASTING_ABILITY]
+    return max((ability_modifier(character, ability) for ability in abilities), default=0)
+
+def parse_ability_values(text):
+    """'dex 2, wis -1' -> {"dexterity": 2, "wisdom": -1}; used for save modifiers and ability scores alike."""
+    saves = {}
+    for part in text.split(","):
+        words = part.split()
+        if len(words) == 2:
+            ability = next((name for name in ABILITY_NAMES if name.startswith(words[0].lower()[:3])), None)
+            if ability:
+                saves[ability] = int(words[1])
+    return saves
+
+def damage_options(character, target):
+    """
+    Every damaging thing a character could do with their action or bonus
+    action against the target, taken from the action index and skipping
+    anything whose uses or slots are spent.
+
+    Returns:
+    list: (slot, name, spell level or None, expected damage, detail) tuples.
+    """
+    ac, saves = target[0], dict(target[1])
+    index = get_action_index(character)
+    weapons_by_name = index_weapons_by_name()
+    classes = parse_classes(character.char_class)
+    attacks = 2 if character.level >= 5 and classes & EXTRA_ATTACK_CLASSES else 1
+    casting_modifier = spellcasting_modifier(character)
+    spell_attack = character.proficiency_bonus + casting_modifier
+    spell_dc = 8 + character.proficiency_bonus + casting_modifier
+    spell_levels = {spell["name"].lower(): spell.get("level", 0) or 0 for spell in map(resolve_spell, character.spells)}
+    options = []
 
-    # Collect weapon attacks
     weapon_attacks = []
-    for weapon_name in character.weapons:
-        weapon = next((w for w in weapons if w.name.lower() == weapon_name.lower()), None)
+    for kind, name, _ in index["action"]:
+        weapon = weapons_by_name.get(name.lower()) if kind == "attack" else None
         if weapon:
-            attack_string = f"\033[3m{weapon.name}\033[0m (Attack Bonus: {weapon.attack_bonus}, Damage: {weapon.damage} {weapon.damage_type})"
-            weapon_attacks.append(attack_string)
-
-    # Collect racial abilities
-    racial_abilities = []
-    for name, details in character.race_abilities.items():
-        if details.get('time', '').lower() == 'action':
-            racial_abilities.append(f"\033[3m{name}\033[0m: {details['description']}")
-
-    # Collect class abilities
-    class_abilities = []
-    class_bonus_abilities = []
-    for name, details in character.class_abilities.items():
-        if details.get('time', '').lower() == 'action':
-            class_abilities.append(f"\033[3m{name}\033[0m: {details['description']}")
-        elif details.get('time', '').lower() == 'bonus action':
-            class_bonus_abilities.append(f"\033[3m{name}\033[0m: {details['description']}")
-
-    # Collect spells for actions and bonus actions
-    spells_action = []
-    spells_bonus_action = []
-    for spell in character.spells:
-        if 'casting_time' in spell and spell['casting_time']:
-            casting_time = spell['casting_time'].lower()
-            spell_obj = next((s for s in spells if s.spell_name.lower() == spell['name'].lower()), None)
-            if spell_obj:
-                spell_info = (
-                    f"\033[3m{spell['name']}\033[0m (Level {spell['level']}): {spell_obj.description}\n"
-                    f"Casting Time: {spell_obj.casting_time}\n"
-                    f"Range: {spell_obj.range}\n"
-                    f"Damage Dice: {spell_obj.damage_dice if spell_obj.damage_dice else 'N/A'}\n"
-                    f"Spell Type: {spell_obj.spell_type}\n"
-                    f"Spell Save: {spell_obj.spell_save if spell_obj.spell_save else 'N/A'}\n"
-                    f"Spell Save DC: {spell_obj.spell_save_dc if spell_obj.spell_save_dc else 'N/A'}"
-                )
-                if "bonus action" in casting_time:
-                    spells_bonus_action.append(spell_info)
-                else:
-                    spells_action.append(spell_info)
+            dice, flat = average_damage(weapon.damage)
+            weapon_attacks.append((weapon, dice, flat))
+            damage = attacks * expected_attack_damage(weapon.attack_bonus, dice, flat, ac)
+            options.append(("action", f"Attack with {weapon.name}" + (f" x{attacks}" if attacks > 1 else ""), None, damage,
+                            f"{hit_chance(weapon.attack_bonus, ac):.0%} to hit"))
+    best_hit = max((hit_chance(weapon.attack_bonus, ac) for weapon, _, _ in weapon_attacks), default=0)
+
+    if "two-weapon fighting" in character.proficiencies and len(weapon_attacks) > 1:
+        weapon, dice, flat = sorted(weapon_attacks, key=lambda attack: attack[1] + attack[2])[-2]
+        damage = expected_attack_damage(weapon.attack_bonus, dice, min(flat, 0), ac)
+        options.append(("bonus", f"Off-hand attack with {weapon.name}", None, damage, f"{hit_chance(weapon.attack_bonus, ac):.0%} to hit"))
+
+    for slot in ("action", "bonus"):
+        for kind, name, _ in index[slot]:
+            if kind == "attack" or is_exhausted(character, kind, name, spell_levels):
+                continue
+            if kind == "spell":
+                spell = resolve_spell(next(ref for ref in character.spells if ref["name"].lower() == name.lower()))
+                spell_obj = find_spell_by_name(name)
+                description = spell.get("description", "")
+                dice_text = (spell_obj.damage_dice if spell_obj else None) or spell.get("damage_dice")
+                save = spell_obj.spell_save if spell_obj else None
+                dc = (spell_obj.spell_save_dc if spell_obj else None) or spell_dc
+                level = spell.get("level", 0) or 0
+            else:
+                abilities = character.class_abilities if kind == "class" else character.race_abilities
+                description = abilities.get(name, {}).get("description", "")
+                dice_text, save, level = None, None, None
+                dc = 8 + character.proficiency_bonus + max((ability_modifier(character, ability) for ability in ABILITY_NAMES), default=0)
+            if not dice_text:
+                match = DAMAGE_IN_TEXT.search(description)
+                dice_text = match.group(1) if match else None
+            if not dice_text:
+                continue
+            dice, flat = average_damage(dice_text)
+            text = description.lower()
+            save_match = SAVE_IN_TEXT.search(text)
+            save = (save or (save_match.group(1) if save_match else None) or ("dexterity" if "saving throw" in text else None))
+            if "spell attack" in text:
+                damage = expected_attack_damage(spell_attack, dice, flat, ac)
+                detail = f"{hit_chance(spell_attack, ac):.0%} to hit"
+            elif "you hit" in text and best_hit:
+                damage = best_hit * (dice + flat)
+                detail = f"on your next hit ({best_hit:.0%})"
+            elif save:
+                save = save.lower()
+                fail = failed_save_chance(dc, saves.get(save, 0))
+                half = 0.5 if "half as much" in text else 0
+                damage = (fail + (1 - fail) * half) * (dice + flat)
+                detail = f"DC {dc} {save.capitalize()} save, {fail:.0%} fail"
+            else:
+                damage = dice + flat
+                detail = "no roll"
+            options.append((slot, name, level, damage, detail))
+    return options
 
-    # Collect non-spell bonus actions based on character class and abilities
-    non_spell_bonus_actions = []
+def best_action_combinations(character, target, limit=5):
+    """
+    Rank action + bonus action pairs by expected damage against the target.
 
-    if character.char_class.lower() == "fighter":
-        non_spell_bonus_actions.append("\033[3mSecond Wind\033[0m: Regain hit points equal to 1d10 + your fighter level as a bonus action.")
-    if character.char_class.lower() == "rogue":
-        non_spell_bonus_actions.append("\033[3mCunning Action\033[0m: Dash, Disengage, or Hide as a bonus action.")
-    if "two-weapon fighting" in character.proficiencies:
-        non_spell_bonus_actions.append("\033[3mTwo-Weapon Fighting\033[0m: Use a bonus action to attack with a different light melee weapon that you're holding in the other hand.")
+    Results are memoized per target on the character and cleared whenever
+    the character, their resources or the weapon list change.
+    """
+    key = (target, limit)
+    if key in character.best_actions:
+        return character.best_actions[key]
+    options = damage_options(character, target)
+    actions = [option for option in options if option[0] == "action"] or [("action", "Dodge", None, 0.0, "")]
+    bonuses = [option for option in options if option[0] == "bonus"] + [("bonus", None, None, 0.0, "")]
+    combinations = []
+    for action in actions:
+        for bonus in bonuses:
+            # Casting a bonus action spell leaves only cantrips for the action.
+            if bonus[2] is not None and action[2]:
+                continue
+            combinations.append((action[3] + bonus[3], action, bonus))
+    combinations.sort(key=lambda combination: combination[0], reverse=True)
+    character.best_actions[key] = combinations[:limit]
+    return character.best_actions[key]
+
+def prompt_target():
+    ac = int(ask("Enter the target's AC: "))
+    saves = parse_ability_values(ask("Enter the target's saving throw modifiers (e.g. dex 2, wis -1; blank for +0): "))
+    return ac, tuple(sorted(saves.items()))
+
+def describe_combination(total, action, bonus):
+    line = f"{total:5.1f}  {action[1]} ({action[3]:.1f}{', ' + action[4] if action[4] else ''})"
+    if bonus[1]:
+        line += f" + {bonus[1]} ({bonus[3]:.1f}, {bonus[4]})"
+    return line
+
+def handle_optimize_command(parts):
+    character_name = " ".join(parts[:-1])
+    character = find_character_by_name(character_name)
+    if not character:
+        print(f"No character named {character_name} found.")
+        return
+    try:
+        target = prompt_target()
+    except ValueError as e:
+        print(f"Error: {e}. Please try again.")
+        return
+    print(f"\nBest turns for {character.name} against AC {target[0]} (expected damage):")
+    for rank, combination in enumerate(best_action_combinations(character, target), 1):
+        print(f"{rank}. {describe_combination(*combination)}")
+
+def handle_party_optimize_command():
+    try:
+        target = prompt_target()
+    except ValueError as e:
+        print(f"Error: {e}. Please try again.")
+        return
+    print(f"\nBest turn per character against AC {target[0]} (expected damage):")
+    for character in characters:
+        best = best_action_combinations(character, target)
+        print(f"{character.name:<16}{describe_combination(*best[0]) if best else '-'}")
+
+def join_section(title, entries):
+    return f"\033[4m{title}\033[0m:\n" + "\n\n".join(text for _, _, text in entries) if entries else ""
+
+
+def handle_player_turn_command(parts):
+    character_name = " ".join(parts[:-1])
+    character = find_character_by_name(character_name)
+    if not character:
+        print(f"No character named {character_name} found.")
+        return
+
+    index = get_action_index(character)
+    spell_levels = {spell["name"].lower(): spell.get("level", 0) or 0 for spell in map(resolve_spell, character.spells)}
+    index = {category: [entry for entry in entries if not is_exhausted(character, entry[0], entry[1], spell_levels)]
+             for category, entries in index.items()}
+    actions = index["action"]
 
-    # Formatting the output
     actions_info = "\n\n".join(filter(None, [
-        "\033[4mAttack\033[0m:\n" + "\n\n".join(weapon_attacks) if weapon_attacks else "",
-        "\033[4mSpells\033[0m:\n" + "\n\n".join(spells_action) if spells_action else "",
-        "\033[4mClass Abilities\033[0m:\n" + "\n\n".join(class_abilities) if class_abilities else "",
-        "\033[4mRacial Abilities\033[0m:\n" + "\n\n".join(racial_abilities) if racial_abilities else ""
+        join_section("Attack", [entry for entry in actions if entry[0] == "attack"]),
+        join_section("Spells", [entry for entry in actions if entry[0] == "spell"]),
+        join_section("Class Abilities", [entry for entry in actions if entry[0] == "class"]),
+        join_section("Racial Abilities", [entry for entry in actions if entry[0] == "race"])
     ]))
 
-    bonus_actions_info = "\n\n".join(filter(None, [
-        "\033[1mBonus Actions\033[0m:\n" + "\n\n".join(non_spell_bonus_actions + class_bonus_abilities + spells_bonus_action) if spells_bonus_action or non_spell_bonus_actions or class_bonus_abilities else "",
-    ]))
+    bonus_order = {"feature": 0, "class": 1, "race": 2, "spell": 3}
+    bonus_actions_info = "\n\n".join(text for _, _, text in sorted(index["bonus"], key=lambda entry: bonus_order.get(entry[0], 4)))
+    reactions_info = "\n\n".join(text for _, _, text in index["reaction"])
 
     turn_info = f"""
 ========================================
@@ -682,18 +1966,42 @@ What can {character_name} do on their turn?
 
 \033[1mBonus Actions\033[0m:
 {bonus_actions_info}
+
+\033[1mReactions\033[0m:
+{reactions_info or "Opportunity Attack only."}
 ========================================
     """
     print(turn_info.strip())
 
 
+def handle_player_reactions_command(parts):
+    character_name = " ".join(parts[:-1])
+    character = find_character_by_name(character_name)
+    if not character:
+        print(f"No character named {character_name} found.")
+        return
+
+    index = get_action_index(character)
+    reactions = ["\033[3mOpportunity Attack\033[0m: Make one melee attack against a creature that leaves your reach."]
+    reactions += [text for _, _, text in index["reaction"]]
+    free = [text for _, _, text in index["free"]]
+
+    print(f"\n\033[1m{character.name}'s Reactions\033[0m:\n" + "\n\n".join(reactions))
+    if free:
+        print(f"\n\033[1mTriggered (no action)\033[0m:\n" + "\n\n".join(free))
+
+
 
 def display_help():
     help_text = """
   Available commands:
     - <skill> check: Check the best character for a given skill (e.g., perception check).
-    - add note: Add a note to a character.
+    - <skill> check dc N [adv|dis] [guidance] [bardic dN]: Rank everyone by their exact chance of passing the check.
+    - add note: Add a timestamped, optionally tagged note to a character.
+    - [character name] notes [page N] [tag T] [since YYYY-MM-DD] [until YYYY-MM-DD]: Show a character's notes, newest first.
     - add spell: Add a new spell.
+    - spells where [conditions] [sort field]: Search all spells, e.g. spells where level<=2 class=paladin time=bonus concentration=no sort name.
+      Fields: level (=, !=, <, <=, >, >=), class, time (action, bonus, reaction, free), type, save, concentration (yes/no), damage (yes/no).
     - add weapon: Add a new weapon.
     - add npc: Add a new NPC.
     - add guild: Add a new guild.
@@ -706,22 +2014,46 @@ def display_help():
     - list bag items: List all items in the Bag of Holding.
     - add character: Add a new character to the list.
     - [character name] turn: Display the character's actions and bonus actions for the turn.
+    - [character name] reactions: Display the character's reactions and triggered abilities.
     - [character name] info: Display information about a specific character.
     - [NPC name] info: Display information about a specific NPC.
     - [character name] wild: Trigger a wild magic surge for a character.
+    - use: Spend a charge, a per-rest use or a spell slot (e.g. slot 1) for a character.
+    - short rest / long rest: Restore short-rest abilities, or everything, for the whole party.
+    - [character name] resources: Show a character's charges, per-rest uses and spell slots.
+    - add resource: Give a character a custom limited resource.
+    - tables: List the random tables (wild magic plus any JSON files in the tables folder).
+    - roll on [table] [count]: Draw from a random table, e.g. roll on loot 3.
+    - table stats [table] [draws]: Draw many times and compare each entry's observed and expected frequency.
+    - seed [number]: Seed all random draws so they can be reproduced.
+    - [character name] optimize: Rank the character's best action + bonus action by expected damage against a target.
+    - [guild or person] allies of allies: List the guilds allied with their guilds' allies.
+    - shortest path [name] to [name]: Show the shortest chain of guild links between two guilds, characters, NPCs or towns.
+    - who reacts to [name]: List the guilds that would react to something done by or to a guild, character, NPC or town.
+    - check data: Check every weapon, spell and guild reference across the campaign and report dangling, duplicate and case-colliding names.
+    - dangling references: List guild leaders, members, allies and enemies that don't match any known name.
+    - level up: Add a level to one of a character's classes; modifiers and proficiency bonus are recomputed from stored ability scores and levels.
+    - party report: Show which skills and saves the party covers, who is best at each, and where the gaps are.
+    - party what if [character] gains|loses [skill or save]: Show how one proficiency change would move the party's best modifier.
+    - party optimize: Show the best turn for every character against a target.
+    - undo: Undo the last change (adds, edits, notes, bag changes, imports).
+    - redo: Redo the last undone change.
+    - stats: Show how long each command, load and save has taken (p50/p95/p99).
+    - profile on|off: Profile the following commands and print the hot spots when turned off.
+    - memory: Show memory used by each store and cache, top allocation sites and growth since the last run.
+    - memory off: Stop tracking allocations.
+    - record <file>|off: Log every command, answer and dice roll to a file that session.py can replay.
+    - import [spells|weapons|npcs|characters] <file>: Load a JSON Lines or CSV content pack, skipping names that already exist.
+    - export markdown|html [folder]: Write every character, NPC, guild and spell to wiki pages (default folder: export).
+    - history [name]: List the sessions in which a character, NPC or guild changed.
+    - diff [name] session-A [session-B]: Show what changed between two sessions (default: up to the latest).
+    - restore [name] session-N: Put a character, NPC or guild back the way it was at the end of a session (undoable).
+    - archive <file> [gzip|lzma]: Pack every store, the notes and the tables into one compressed file (unpack with archive.py).
     - help: Display this help message.
     - quit: Exit the program.
     """
     print(help_text)
-def handle_character_info_command(parts):
-    character_name = " ".join(parts[:-1])
-    character = find_character_by_name(character_name)
-    if character:
-        print(character.display_info())
-    else:
-        print(f"No character named {character_name} found.")
-        
-import textwrap
+
 class NPC:
     def __init__(self, name, notes):
         self.name = name
@@ -756,29 +2088,33 @@ def load_npcs():
     return load_from_file("npcs.json", NPC)
 
 def save_npcs(npcs):
+    global guild_graph
+    guild_graph = None
     save_to_file(npcs, "npcs.json")
 
-npcs = load_npcs()
 
 def handle_add_npc_command():
-    name = input("Enter NPC's name: ")
-    notes = input("Enter any notes for the NPC: ")
+    name = ask("Enter NPC's name: ")
+    notes = ask("Enter any notes for the NPC: ")
     new_npc = NPC(name, notes)
     npcs.append(new_npc)
     save_npcs(npcs)
+    record_added(f"add NPC {name}", npcs, [new_npc], lambda: save_npcs(npcs))
     print(f"{name} has been added successfully.")
 
 def handle_edit_npc_command():
-    name = input("Enter the NPC's name to edit: ")
+    name = ask("Enter the NPC's name to edit: ")
     npc = find_npc_by_name(name)
     if npc:
-        new_name = input("Enter new name (leave blank to keep current): ")
-        new_notes = input("Enter new notes (leave blank to keep current): ")
+        new_name = ask("Enter new name (leave blank to keep current): ")
+        new_notes = ask("Enter new notes (leave blank to keep current): ")
+        old_values = {"name": npc.name, "notes": npc.notes}
         if new_name:
             npc.name = new_name
         if new_notes:
             npc.notes = new_notes
         save_npcs(npcs)
+        record_changes(f"edit NPC {name}", npc, old_values, lambda: save_npcs(npcs))
         print(f"{name}'s information has been updated successfully.")
     else:
         print(f"No NPC named {name} found.")
@@ -792,37 +2128,188 @@ def handle_npc_info_command(parts):
         print(f"No NPC named {npc_name} found.")
 
 def find_npc_by_name(name):
+    """
+    Find an NPC by name.
+
+    Args:
+    name (str): The name of the NPC.
+
+    Returns:
+    NPC: The NPC object if found, None otherwise.
+    """
     return next((npc for npc in npcs if npc.name.lower() == name.lower()), None)
+
 def handle_player_spells_command(parts):
     character_name = " ".join(parts[:-1])
     character = find_character_by_name(character_name)
     if not character:
         print(f"No character named {character_name} found.")
         return
-    
-    # Retrieve the character's spell list and sort by level
-    spells = sorted(character.spells, key=lambda x: x['level'])
-    
-    # Format the character's spell list
-    formatted_spells = {}
-    for spell in spells:
-        level = spell['level']
-        if level not in formatted_spells:
-            formatted_spells[level] = []
-        
-        spell_info = f"{spell['name']}:\n{spell['description']}"
+
+    show_paged(spell_list_lines(character))
+
+def spell_list_lines(character):
+    """Yield a character's spells grouped by level, wrapped to the terminal (at most 70 columns)."""
+    import pager
+    width = min(70, pager.terminal_size()[0] - 1)
+    current_level = None
+    for spell in sorted((resolve_spell(ref) for ref in character.spells), key=lambda x: x.get('level', 0)):
+        level = spell.get('level', 0)
+        if level != current_level:
+            current_level = level
+            yield f"\nLevel {level} Spells:\n" + "="*15
+        spell_info = f"{spell['name']}: {spell.get('description', '')}"
         if spell.get('damage_dice'):
-            spell_info += f"\nDamage Dice: {spell['damage_dice']}"
-        
-        wrapped_spell_info = textwrap.fill(spell_info, width=70)
-        formatted_spells[level].append(wrapped_spell_info)
-    
-    # Display the formatted spell list
-    for level, spells in formatted_spells.items():
-        print(f"\nLevel {level} Spells:\n" + "="*15)
+            spell_info += f" Damage Dice: {spell['damage_dice']}"
+        yield from pager.wrap(spell_info, width)
+        yield "\n" + "-"*70 + "\n"
+
+class SpellIndex:
+    """
+    Secondary indexes over the spell registry for `spells where` queries.
+
+    Each queryable field maps its values to the set of registry positions
+    holding that value, so a query is a union over the matching values of
+    each condition followed by a set intersection across conditions.
+    """
+    FIELDS = ("level", "class", "time", "type", "save", "concentration", "damage")
+    SORT_KEYS = {
+        "level": lambda spell: (spell.level, spell.spell_name.lower()),
+        "name": lambda spell: spell.spell_name.lower(),
+        "class": lambda spell: (spell.spell_class.lower(), spell.spell_name.lower()),
+        "time": lambda spell: (normalize_action_time(spell.casting_time) or "~", spell.spell_name.lower()),
+    }
+
+    def __init__(self, spells):
+        self.spells = []
+        self.indexes = {field: {} for field in self.FIELDS}
         for spell in spells:
-            print(spell)
-            print("\n" + "-"*70 + "\n")
+            self.add(spell)
+
+    @staticmethod
+    def index_keys(spell):
+        yield "level", spell.level
+        for spell_class in re.split(r"[,/]", spell.spell_class or ""):
+            if spell_class.strip():
+                yield "class", spell_class.strip().lower()
+        yield "time", normalize_action_time(spell.casting_time) or " ".join(str(spell.casting_time).lower().split())
+        yield "type", (spell.spell_type or "other").lower()
+        yield "save", (spell.spell_save or "none").lower()
+        yield "concentration", "yes" if "concentration" in str(spell.duration).lower() else "no"
+        yield "damage", "yes" if spell.damage_dice else "no"
+
+    def add(self, spell):
+        position = len(self.spells)
+        self.spells.append(spell)
+        for field, key in self.index_keys(spell):
+            self.indexes[field].setdefault(key, set()).add(position)
+
+    def matching(self, field, op, value):
+        """Positions of spells whose field satisfies `op value`."""
+        index = self.indexes[field]
+        if field == "level":
+            value = int(value)
+            compare = {
+                "=": lambda key: key == value,
+                "!=": lambda key: key != value,
+                "<": lambda key: key < value,
+                "<=": lambda key: key <= value,
+                ">": lambda key: key > value,
+                ">=": lambda key: key >= value,
+            }[op]
+        else:
+            value = value.lower()
+            if value in ("true", "y"):
+                value = "yes"
+            elif value in ("false", "n"):
+                value = "no"
+            if op == "=":
+                return set(index.get(value, ()))
+            if op != "!=":
+                raise ValueError(f"'{op}' only works with level")
+            compare = lambda key: key != value
+        result = set()
+        for key, positions in index.items():
+            if compare(key):
+                result |= positions
+        return result
+
+    def query(self, conditions, sort="level", descending=False):
+        """Run (field, op, value) conditions and return the matching spells, sorted."""
+        result = None
+        for field, op, value in conditions:
+            positions = self.matching(field, op, value)
+            result = positions if result is None else result & positions
+            if not result:
+                return []
+        found = [self.spells[i] for i in (range(len(self.spells)) if result is None else result)]
+        return sorted(found, key=self.SORT_KEYS[sort], reverse=descending)
+
+
+spell_query_index = None
+
+def get_spell_query_index():
+    global spell_query_index
+    if spell_query_index is None:
+        spell_query_index = SpellIndex(spells)
+    return spell_query_index
+
+QUERY_CONDITION = re.compile(r"^([a-z_]+)\s*(<=|>=|!=|=|<|>)\s*(.+)$")
+
+def parse_spell_query(tokens):
+    """
+    Parse `spells where` tokens such as ["level<=2", "class=paladin", "sort", "name"].
+
+    Returns:
+    tuple: (conditions, sort field, descending)
+    """
+    aliases = {"spell_class": "class", "casting_time": "time", "spell_type": "type", "spell_save": "save", "damage_dice": "damage"}
+    conditions = []
+    sort, descending = "level", False
+    tokens = list(tokens)
+    while tokens:
+        token = tokens.pop(0)
+        if token.lower() == "sort":
+            if not tokens:
+                raise ValueError("sort needs a field")
+            sort = tokens.pop(0).lower()
+            if sort not in SpellIndex.SORT_KEYS:
+                raise ValueError(f"can't sort by '{sort}' (use {', '.join(SpellIndex.SORT_KEYS)})")
+            if tokens and tokens[0].lower() in ("asc", "desc"):
+                descending = tokens.pop(0).lower() == "desc"
+            continue
+        if token.lower() in ("and", "where"):
+            continue
+        match = QUERY_CONDITION.match(token)
+        if not match:
+            raise ValueError(f"don't understand '{token}'")
+        field, op, value = match.groups()
+        field = aliases.get(field.lower(), field.lower())
+        if field not in SpellIndex.FIELDS:
+            raise ValueError(f"unknown field '{field}' (use {', '.join(SpellIndex.FIELDS)})")
+        conditions.append((field, op, value))
+    return conditions, sort, descending
+
+def handle_spell_query_command(user_input):
+    try:
+        tokens = shlex.split(user_input)[2:]
+        conditions, sort, descending = parse_spell_query(tokens)
+        found = get_spell_query_index().query(conditions, sort, descending)
+    except ValueError as e:
+        print(f"Error: {e}. Example: spells where level<=2 class=paladin time=bonus sort name")
+        return
+
+    if not found:
+        print("No spells match that query.")
+        return
+    print(f"{'Lvl':<4}{'Name':<28}{'Class':<14}{'Casting Time':<16}{'Save':<14}{'Damage':<8}")
+    for spell in found:
+        print(
+            f"{spell.level:<4}{spell.spell_name[:27]:<28}{spell.spell_class[:13]:<14}"
+            f"{str(spell.casting_time)[:15]:<16}{(spell.spell_save or '-')[:13]:<14}{spell.damage_dice or '-':<8}"
+        )
+    print(f"{len(found)} spell(s).")
+
 class Guild:
     def __init__(self, name, town, headquarters, leader, members, symbols, colors, allies, enemies):
         self.name = name
@@ -882,96 +2369,512 @@ Enemies: {enemies_list}
         return info.strip()
 
 def save_guilds(guilds):
-    with open("guilds.json", "w") as f:
-        json.dump([guild.to_dict() for guild in guilds], f, indent=4)
+    global guild_graph
+    guild_graph = None
+    save_to_file(guilds, "guilds.json")
 
 def load_guilds():
-    try:
-        with open("guilds.json", "r") as f:
-            data = json.load(f)
-            return [Guild.from_dict(item) for item in data]
-    except FileNotFoundError:
-        return []
+    return load_from_file("guilds.json", Guild)
 
-guilds = load_guilds()
+SNAPSHOT_FILE = ".playassist_snapshot.pickle"
+STORE_FILES = ["spells.json", "weapons.json", "characters.json", "bag_of_holding.json", "npcs.json", "guilds.json"]
+
+def snapshot_sources():
+    return [resource_path(filename) for filename in STORE_FILES] + [os.path.abspath(__file__)]
+
+def load_campaign():
+    """
+    Load every store and build the indexes.
+
+    While none of the JSON files (or this script) have changed, the stores
+    come back from the snapshot as they were left after the last start:
+    spell references already resolved and every character's action index
+    already built. Each object's attributes are stored as plain data, so
+    the snapshot doesn't depend on how playAssist was started.
+    Set PLAYASSIST_SNAPSHOT=0 to always load from JSON.
+
+    Returns:
+    bool: True if the stores came from the snapshot.
+    """
+    global spells, weapons, characters, bag_of_holding, npcs, guilds
+    import snapshot
+    start = time.perf_counter()
+    if os.environ.get("PLAYASSIST_SNAPSHOT", "1") != "0":
+        stores = snapshot.load_snapshot(resource_path(SNAPSHOT_FILE), snapshot_sources())
+        if stores is not None:
+            spells = snapshot.restore_objects(Spell, stores["spells"])
+            index_spells(spells)
+            weapons = snapshot.restore_objects(Weapon, stores["weapons"])
+            characters = snapshot.restore_objects(Character, stores["characters"])
+            bag_of_holding = snapshot.restore_objects(BagOfHolding, [stores["bag_of_holding"]])[0]
+            npcs = snapshot.restore_objects(NPC, stores["npcs"])
+            guilds = snapshot.restore_objects(Guild, stores["guilds"])
+            record_latency("load snapshot", time.perf_counter() - start)
+            return True
+
+    spells = load_spells()
+    index_spells(spells)
+    weapons = load_weapons()
+    characters = load_characters()
+    bag_of_holding = load_bag_of_holding()
+    npcs = load_npcs()
+    guilds = load_guilds()
+    index_actions(characters)
+    return False
+
+def save_campaign_snapshot():
+    """Snapshot the stores as they stand; call it once the start-up migrations have saved their changes."""
+    if os.environ.get("PLAYASSIST_SNAPSHOT", "1") == "0":
+        return
+    import snapshot
+    index_actions([character for character in characters if character.actions is None])
+    snapshot.save_snapshot(resource_path(SNAPSHOT_FILE), snapshot_sources(), {
+        "spells": [vars(spell) for spell in spells],
+        "weapons": [vars(weapon) for weapon in weapons],
+        "characters": [vars(character) for character in characters],
+        "bag_of_holding": vars(bag_of_holding),
+        "npcs": [vars(npc) for npc in npcs],
+        "guilds": [vars(guild) for guild in guilds],
+    })
+
+from_snapshot = load_campaign()
+load_resource_usage()
+load_notes_log()
+migrated_notes = migrate_string_notes(characters)
+changed_at_start = recompute_derived_stats() or migrated_notes
+if changed_at_start:
+    save_characters(characters)
+# Written after the migrations, so the characters.json they save is the one the snapshot is keyed on.
+if changed_at_start or not from_snapshot:
+    save_campaign_snapshot()
 
 def handle_edit_character_command():
-    name = input("Enter the character's name to edit: ")
+    name = ask("Enter the character's name to edit: ")
     character = find_character_by_name(name)
     if not character:
         print(f"No character named {name} found.")
         return
 
     print("Leave the field blank to keep the current value.")
-    new_name = input(f"Enter new name (current: {character.name}): ").strip() or character.name
-    new_race = input(f"Enter new race (current: {character.race}): ").strip() or character.race
-    new_sub_race = input(f"Enter new sub-race (current: {character.sub_race}): ").strip() or character.sub_race
-    new_char_class = input(f"Enter new class (current: {character.char_class}): ").strip() or character.char_class
-    new_level = input(f"Enter new level (current: {character.level}): ").strip()
-    new_sub_class = input(f"Enter new subclass (current: {character.sub_class}): ").strip() or character.sub_class
+    new_name = ask(f"Enter new name (current: {character.name}): ").strip() or character.name
+    new_race = ask(f"Enter new race (current: {character.race}): ").strip() or character.race
+    new_sub_race = ask(f"Enter new sub-race (current: {character.sub_race}): ").strip() or character.sub_race
+    new_char_class = ask(f"Enter new class (current: {character.char_class}): ").strip() or character.char_class
+    new_level = ask(f"Enter new level (current: {character.level}): ").strip()
+    new_level = int(new_level) if new_level else character.level
+    new_sub_class = ask(f"Enter new subclass (current: {character.sub_class}): ").strip() or character.sub_class
+    import derived
+    new_class_levels = character.class_levels
+    if character.class_levels and (new_char_class, new_level) != (character.char_class, character.level):
+        # A hand-edited class or level replaces the stored split with whatever the new class field says.
+        new_class_levels = derived.parse_class_levels(new_char_class, new_level) or {}
 
     abilities = {}
+    scores = {}
     for ability in ["strength", "dexterity", "constitution", "intelligence", "wisdom", "charisma"]:
-        abilities[ability] = input(f"Enter new {ability} modifier (current: {character.ability_modifiers.get(ability, 0)}): ").strip()
+        if character.ability_scores:
+            # Modifiers follow from the scores, so ask for those instead.
+            scores[ability] = ask(f"Enter new {ability} score (current: {character.ability_scores.get(ability, 10)}): ").strip()
+            scores[ability] = int(scores[ability]) if scores[ability] else character.ability_scores.get(ability, 10)
+            abilities[ability] = character.ability_modifiers.get(ability, 0)
+            continue
+        abilities[ability] = ask(f"Enter new {ability} modifier (current: {character.ability_modifiers.get(ability, 0)}): ").strip()
         abilities[ability] = int(abilities[ability]) if abilities[ability] else character.ability_modifiers.get(ability, 0)
 
-    new_proficiencies = input(f"Enter new proficiencies (comma separated, current: {', '.join(character.proficiencies)}): ").strip()
+    new_proficiencies = ask(f"Enter new proficiencies (comma separated, current: {', '.join(character.proficiencies)}): ").strip()
     new_proficiencies = new_proficiencies.lower().split(", ") if new_proficiencies else character.proficiencies
 
-    new_saving_throws = input(f"Enter new saving throws (comma separated, current: {', '.join(character.saving_throws)}): ").strip()
+    new_saving_throws = ask(f"Enter new saving throws (comma separated, current: {', '.join(character.saving_throws)}): ").strip()
     new_saving_throws = new_saving_throws.lower().split(", ") if new_saving_throws else character.saving_throws
 
-    new_god = input(f"Enter new god (current: {character.god}): ").strip() or character.god
-    new_proficiency_bonus = input(f"Enter new proficiency bonus (current: {character.proficiency_bonus}): ").strip()
-    new_proficiency_bonus = int(new_proficiency_bonus) if new_proficiency_bonus else character.proficiency_bonus
-
-    new_notes = input(f"Enter new notes (current: {character.notes}): ").strip() or character.notes
+    new_god = ask(f"Enter new god (current: {character.god}): ").strip() or character.god
+    if character.ability_scores or new_class_levels:
+        new_proficiency_bonus = character.proficiency_bonus
+    elif character.class_levels:
+        # The split that the bonus was derived from is gone, so the old bonus may not fit the new level.
+        level_bonus = derived.proficiency_bonus(new_level)
+        new_proficiency_bonus = ask(f"Enter new proficiency bonus (blank for {level_bonus}, the bonus at level {new_level}): ").strip()
+        new_proficiency_bonus = int(new_proficiency_bonus) if new_proficiency_bonus else level_bonus
+    else:
+        new_proficiency_bonus = ask(f"Enter new proficiency bonus (current: {character.proficiency_bonus}): ").strip()
+        new_proficiency_bonus = int(new_proficiency_bonus) if new_proficiency_bonus else character.proficiency_bonus
 
+    edited_fields = ["name", "race", "sub_race", "char_class", "level", "sub_class", "ability_modifiers",
+                     "proficiencies", "saving_throws", "god", "proficiency_bonus",
+                     "ability_scores", "class_levels"]
+    old_values = {field: getattr(character, field) for field in edited_fields}
     character.name = new_name
     character.race = new_race
     character.sub_race = new_sub_race
     character.char_class = new_char_class
-    character.level = int(new_level) if new_level else character.level
+    character.level = new_level
     character.sub_class = new_sub_class
     character.ability_modifiers = abilities
     character.proficiencies = new_proficiencies
     character.saving_throws = new_saving_throws
     character.god = new_god
     character.proficiency_bonus = new_proficiency_bonus
-    character.notes = new_notes
+    if scores:
+        character.ability_scores = scores
+    character.class_levels = new_class_levels
+    character.invalidate()
+    recompute_derived_stats()
 
     save_characters(characters)
+    record_changes(f"edit character {name}", character, old_values, after_characters_change)
     print(f"{name} has been updated successfully.")
 
 
 def handle_add_guild_command():
     try:
-        name = input("Enter guild name: ")
-        town = input("Enter the town where the guild is located: ")
-        headquarters = input("Enter the headquarters of the guild: ")
-        leader = input("Enter the leader of the guild: ")
-        members = input("Enter members (comma separated): ").split(", ")
-        symbols = input("Enter symbols of the guild: ")
-        colors = input("Enter colors of the guild: ")
-        allies = input("Enter allies (comma separated): ").split(", ")
-        enemies = input("Enter enemies (comma separated): ").split(", ")
+        name = ask("Enter guild name: ")
+        town = ask("Enter the town where the guild is located: ")
+        headquarters = ask("Enter the headquarters of the guild: ")
+        leader = ask("Enter the leader of the guild: ")
+        members = ask("Enter members (comma separated): ").split(", ")
+        symbols = ask("Enter symbols of the guild: ")
+        colors = ask("Enter colors of the guild: ")
+        allies = ask("Enter allies (comma separated): ").split(", ")
+        enemies = ask("Enter enemies (comma separated): ").split(", ")
 
         new_guild = Guild(name, town, headquarters, leader, members, symbols, colors, allies, enemies)
         guilds.append(new_guild)
         save_guilds(guilds)
+        record_added(f"add guild {name}", guilds, [new_guild], lambda: save_guilds(guilds))
         print(f"Guild {name} has been added successfully.")
     except ValueError as e:
         print(f"Error: {e}. Please try again.")
 
+guild_graph = None
+
+def get_guild_graph():
+    """The guild relationship graph, rebuilt after guilds, NPCs or characters are saved."""
+    global guild_graph
+    if guild_graph is None:
+        import relations
+        guild_graph = relations.RelationGraph(guilds, [npc.name for npc in npcs], [character.name for character in characters])
+    return guild_graph
+
 def handle_town_guilds_command(parts):
     town_name = " ".join(parts[:-1])
-    town_guilds = [guild for guild in guilds if guild.town.lower() == town_name.lower()]
+    town_guilds = get_guild_graph().town_guilds(town_name)
     if town_guilds:
-        for guild in town_guilds:
-            print(guild.display_info())
+        show_paged(guild.display_info() for guild in town_guilds)
     else:
         print(f"No guilds found in {town_name}.")
 
+def handle_allies_of_allies_command(parts):
+    name = " ".join(parts[:-3])
+    graph = get_guild_graph()
+    node = graph.find(name)
+    if not node:
+        print(f"No guild, character, NPC or town named {name} found.")
+        return
+    allies = graph.allies_of_allies(node)
+    if allies:
+        print(f"Allies of {graph.names[node]}'s allies: {', '.join(allies)}")
+    else:
+        print(f"{graph.names[node]} has no allies of allies.")
+
+def handle_shortest_path_command(parts):
+    """shortest path [from] to [to]; without "to", the first split where both halves are known names is used."""
+    words = parts[2:]
+    graph = get_guild_graph()
+    if "to" in words:
+        splits = [words.index("to")]
+        words = words[:splits[0]] + words[splits[0] + 1:]
+    else:
+        splits = range(1, len(words))
+    for split in splits:
+        start, end = graph.find(" ".join(words[:split])), graph.find(" ".join(words[split:]))
+        if start and end:
+            break
+    else:
+        print("Usage: shortest path [name] to [name], using guild, character, NPC or town names.")
+        return
+    path = graph.shortest_path(start, end)
+    if path is None:
+        print(f"{graph.names[start]} and {graph.names[end]} aren't connected.")
+    else:
+        print(f"{graph.describe_path(path)} ({len(path) - 1} steps)")
+
+def handle_who_reacts_command(parts):
+    name = " ".join(parts[3:])
+    graph = get_guild_graph()
+    node = graph.find(name)
+    if not node:
+        print(f"No guild, character, NPC or town named {name} found.")
+        return
+    reactions = graph.reactions(node)
+    if not reactions["own"]:
+        print(f"{graph.names[node]} doesn't belong to any guild, so no guild would react.")
+        return
+    for label, key in (("Guilds involved", "own"), ("Allied guilds", "allied"), ("Hostile guilds", "hostile")):
+        print(f"{label}: {', '.join(reactions[key]) or 'None'}")
+
+def handle_dangling_references_command():
+    dangling = get_guild_graph().dangling
+    if not dangling:
+        print("Every guild leader, member, ally and enemy refers to a known name.")
+        return
+    print(f"{len(dangling)} guild references don't match any guild, NPC or character:")
+    for guild_name, field, name in dangling:
+        print(f"  {guild_name} ({field}): {name}")
+
+def export_entities():
+    """Yield (kind, name, data) for everything the export command writes, with spells and weapons filled in."""
+    weapons_by_name = {weapon.name.lower(): weapon for weapon in weapons}
+    for character in characters:
+        data = character.to_dict()
+        data["spells"] = [resolve_spell(ref) for ref in character.spells]
+        data["notes"] = "\n".join(format_note(entry) for entry in notes_log.get(character.name.lower(), []))
+        data["weapons"] = [
+            weapons_by_name[name.lower()].to_dict() if name.lower() in weapons_by_name else name
+            for name in character.weapons
+        ]
+        yield "character", character.name, data
+    for npc in npcs:
+        yield "npc", npc.name, npc.to_dict()
+    for guild in guilds:
+        yield "guild", guild.name, guild.to_dict()
+    for spell in spells:
+        yield "spell", spell.spell_name, spell.to_dict()
+
+def handle_export_command(parts):
+    fmt = parts[1].lower() if len(parts) > 1 else "markdown"
+    fmt = {"md": "markdown", "htm": "html"}.get(fmt, fmt)
+    folder = " ".join(parts[2:]) or resource_path("export")
+
+    import exporter
+    start = time.perf_counter()
+    try:
+        written, skipped, removed = exporter.export_campaign(export_entities(), folder, fmt)
+    except (ValueError, OSError) as e:
+        print(f"Error: {e}. Usage: export markdown|html [folder]")
+        return
+    removed = f", {removed} removed" if removed else ""
+    print(f"Exported to {folder}: {written} page(s) written, {skipped} unchanged{removed} "
+          f"({time.perf_counter() - start:.2f}s).")
+
+def handle_archive_command(parts):
+    """archive <file> [gzip|lzma]: pack the data folder into one compressed archive."""
+    if len(parts) < 2:
+        print("Usage: archive <file> [gzip|lzma]")
+        return
+    codec = "gzip"
+    if len(parts) > 2 and parts[-1].lower() in ("gzip", "lzma"):
+        codec = parts.pop().lower()
+    path = " ".join(parts[1:])
+
+    import archive
+    start = time.perf_counter()
+    try:
+        archive.pack(resource_path(""), path, codec)
+    except (ValueError, OSError) as e:
+        print(f"Error: {e}. Usage: archive <file> [gzip|lzma]")
+        return
+    print("\n".join(archive.describe(path)))
+    print(f"Packed in {time.perf_counter() - start:.2f}s. Unpack it with: python archive.py unpack {path}")
+
+def find_history(name):
+    """(store file, versions) for the first store whose history has name, or (None, [])."""
+    past = get_history()
+    for filename in past.stores_with(name):
+        return filename, past.versions(filename, name)
+    return None, []
+
+def split_sessions(parts):
+    """Split 'Old Tom session-3 session-5' into ('Old Tom', [3, 5])."""
+    import history
+    sessions = []
+    while len(parts) > 1 and history.parse_session(parts[-1]) is not None:
+        sessions.insert(0, history.parse_session(parts.pop()))
+    return " ".join(parts), sessions
+
+def describe_value(value):
+    return "(none)" if value is None else json.dumps(value) if isinstance(value, (list, dict)) else str(value)
+
+def handle_history_command(parts):
+    name = " ".join(parts[1:])
+    if not name:
+        print("Usage: history [name]")
+        return
+    filename, versions = find_history(name)
+    if not versions:
+        print(f"No history recorded for {name}.")
+        return
+    past = get_history()
+    print(f"History of {name} ({filename}):")
+    previous = None
+    for number, saved, digest in versions:
+        record = past.read_blob(digest) if digest else None
+        if previous is None and record is not None:
+            summary = "first recorded"
+        elif record is None:
+            summary = "removed"
+        else:
+            summary = "changed " + ", ".join(sorted({field.split(".")[0] for field, _, _ in history_diff(previous, record)}))
+        print(f"  session-{number:<5}{saved.replace('T', ' ')[:16]}  {summary}")
+        previous = record
+
+def history_diff(old, new):
+    import history
+    return history.diff_records(old, new)
+
+def handle_diff_command(parts):
+    name, sessions = split_sessions(parts[1:])
+    if not name or not 1 <= len(sessions) <= 2:
+        print("Usage: diff [name] session-A [session-B] (without session-B, compares with the latest)")
+        return
+    filename, versions = find_history(name)
+    if not versions:
+        print(f"No history recorded for {name}.")
+        return
+    past = get_history()
+    known = past.sessions()
+    for number in sessions:
+        if number not in known:
+            print(f"There is no session-{number} (sessions 1-{known[-1]}).")
+            return
+    old_session, new_session = sessions[0], sessions[1] if len(sessions) > 1 else known[-1]
+    changes = history_diff(past.record_at(filename, name, old_session), past.record_at(filename, name, new_session))
+    print(f"{name}: session-{old_session} -> session-{new_session}")
+    if not changes:
+        print("  No changes.")
+    for field, old, new in changes:
+        print(f"  {field}: {describe_value(old)} -> {describe_value(new)}")
+
+def handle_restore_command(parts):
+    name, sessions = split_sessions(parts[1:])
+    if not name or len(sessions) != 1:
+        print("Usage: restore [name] session-N")
+        return
+    filename, versions = find_history(name)
+    if not versions:
+        print(f"No history recorded for {name}.")
+        return
+    record = get_history().record_at(filename, name, sessions[0])
+    if record is None:
+        print(f"{name} didn't exist at the end of session-{sessions[0]}.")
+        return
+    store, cls, after = history_sources()[filename]
+    restored = cls.from_dict(record)
+    current = next((item for item in store if item.name.lower() == name.lower()), None)
+    if current is None:
+        store.append(restored)
+        after()
+        record_added(f"restore {restored.name}", store, [restored], after)
+    else:
+        fields = restored.to_dict().keys()
+        old_values = {field: getattr(current, field) for field in fields}
+        for field in fields:
+            setattr(current, field, getattr(restored, field))
+        if isinstance(current, Character):
+            current.invalidate()
+        after()
+        record_changes(f"restore {current.name}", current, old_values, after)
+    print(f"Restored {restored.name} to the end of session-{sessions[0]}.")
+
+def commit_imported_spells(batch):
+    spells.extend(batch)
+    for spell in batch:
+        spell_index[spell.spell_name.lower()] = spell
+        if spell_query_index is not None:
+            spell_query_index.add(spell)
+
+def commit_imported_weapons(batch):
+    weapons.extend(batch)
+    invalidate_action_indexes()
+
+def commit_imported_characters(batch):
+    migrate_string_notes(batch)
+    characters.extend(batch)
+
+def handle_import_command(parts):
+    import importer
+    kind = importer.KIND_ALIASES.get(parts[1].lower()) if len(parts) > 2 else None
+    path = " ".join(parts[2:] if kind else parts[1:])
+    if not path:
+        print("Usage: import [spells|weapons|npcs|characters] <file.jsonl|file.csv>")
+        return
+
+    added = {"spell": [], "weapon": [], "npc": [], "character": []}
+
+    def committer(kind, commit):
+        def commit_batch(batch):
+            commit(batch)
+            added[kind].extend(batch)
+            names_added(batch)
+        return commit_batch
+
+    targets = {
+        "spell": importer.ImportTarget(Spell.from_dict, (s.spell_name for s in spells), committer("spell", commit_imported_spells)),
+        "weapon": importer.ImportTarget(Weapon.from_dict, (w.name for w in weapons), committer("weapon", commit_imported_weapons)),
+        "npc": importer.ImportTarget(NPC.from_dict, (n.name for n in npcs), committer("npc", npcs.extend)),
+        "character": importer.ImportTarget(Character.from_dict, (c.name for c in characters), committer("character", commit_imported_characters)),
+    }
+    start = time.perf_counter()
+    first_note_id = notes_next_id
+    stores = (
+        ("spell", spells, save_spells, after_spells_change),
+        ("weapon", weapons, save_weapons, after_weapons_change),
+        ("npc", npcs, save_npcs, lambda: save_npcs(npcs)),
+        ("character", characters, save_characters, after_characters_change))
+
+    def undo():
+        for store, items, after in changed:
+            remove_items(store, items)
+            names_removed(items)
+            after()
+        # The string notes of imported characters were moved into the log as they came in.
+        remove_notes(notes)
+
+    try:
+        errors = importer.import_file(path, targets, kind)
+    except importer.ImportAborted as e:
+        # Take back the batches that already went in, so the stores end up as they were.
+        changed = [(store, list(added[store_kind]), after) for store_kind, store, _, after in stores if added[store_kind]]
+        notes = notes_logged_since(added["character"], first_note_id)
+        undo()
+        for items in added.values():
+            items.clear()
+        print(f"Nothing was imported from {path}; the file couldn't be read to the end:")
+        for error in e.errors:
+            print(f"Skipped {error}")
+        return
+    except OSError as e:
+        print(f"Error: {e}")
+        return
+    finally:
+        # Whatever made it in is saved once per store, not once per record.
+        if added["character"]:
+            # Imported scores and class levels give the modifiers and proficiency bonus, as they do at load.
+            recompute_derived_stats()
+        changed = []
+        for store_kind, store, save, after in stores:
+            if added[store_kind]:
+                save(store)
+                changed.append((store, added[store_kind], after))
+        notes = notes_logged_since(added["character"], first_note_id)
+
+        def redo():
+            for store, items, after in changed:
+                store.extend(items)
+                names_added(items)
+                after()
+            restore_notes(notes)
+
+        if changed:
+            undo_history.record(f"import {path}", undo, redo)
+
+    labels = {"spell": "Spells", "weapon": "Weapons", "npc": "NPCs", "character": "Characters"}
+    for store_kind, target in targets.items():
+        if target.added or target.duplicates:
+            print(f"{labels[store_kind]}: {target.added} added, {target.duplicates} already present.")
+    for error in errors:
+        print(f"Skipped {error}")
+    print(f"Import finished in {time.perf_counter() - start:.2f}s.")
+
 def handle_guild_info_command(parts):
     guild_name = " ".join(parts[:-1])
     guild = next((g for g in guilds if g.name.lower() == guild_name.lower()), None)
@@ -986,17 +2889,326 @@ def handle_wild_magic_command(parts):
         print(f"No character named {character_name} found.")
         return
     
-    roll = random.randint(1, len(wild_magic_table))
-    result = wild_magic_table[str(roll)]
+    try:
+        roll, result = get_random_tables().draw("wild magic", rng)
+    except KeyError:
+        print("No wild magic table found (wild_magic_table.json).")
+        return
     print(f"\n{character_name} triggers a wild magic surge!\nRoll: {roll}\nResult: {result}\n")
 
+def split_count(words, default=1):
+    """Split a trailing number off a table command: ["wild", "magic", "5"] -> ("wild magic", 5)."""
+    if len(words) > 1 and words[-1].isdigit():
+        return " ".join(words[:-1]), int(words[-1])
+    return " ".join(words), default
+
+def handle_roll_on_table_command(parts):
+    name, count = split_count(parts[2:])
+    try:
+        draws = get_random_tables().draw_many(name, count, rng)
+    except KeyError:
+        print(f"No table named {name} found. Type 'tables' to see them.")
+        return
+    except ValueError as e:
+        print(f"Error: {e}")
+        return
+    for roll, result in draws:
+        print(f"Roll: {roll if roll is not None else '-'}  Result: {result}")
+
+def handle_table_stats_command(parts):
+    name, count = split_count(parts[2:], 10000)
+    if count < 1:
+        print("Usage: table stats <table> [number of draws, at least 1]")
+        return
+    try:
+        rows = get_random_tables().frequencies(name, count, rng)
+    except KeyError:
+        print(f"No table named {name} found. Type 'tables' to see them.")
+        return
+    print(f"{count} draws from {name}:")
+    print(f"{'Entry':<10}{'Expected':>10}{'Observed':>10}{'Hits':>8}")
+    for label, expected, observed, hits in rows:
+        print(f"{label:<10}{expected:>9.2%}{observed:>10.2%}{hits:>8}")
+
+def handle_tables_command():
+    names = get_random_tables().names()
+    print("Random tables: " + (", ".join(names) if names else "none (add JSON files to the tables folder)"))
+
+def handle_seed_command(parts):
+    try:
+        rng.seed(int(parts[1]))
+    except (IndexError, ValueError):
+        print("Usage: seed <number>")
+        return
+    print(f"Random draws are now seeded with {parts[1]}.")
+
+def deep_sizeof(obj, seen):
+    """Size in bytes of obj and everything reachable from it that is not already in seen."""
+    size = 0
+    stack = [obj]
+    while stack:
+        obj = stack.pop()
+        if id(obj) in seen or isinstance(obj, type):
+            continue
+        seen.add(id(obj))
+        size += sys.getsizeof(obj)
+        if isinstance(obj, dict):
+            stack.extend(obj.keys())
+            stack.extend(obj.values())
+        elif isinstance(obj, (list, tuple, set, frozenset)):
+            stack.extend(obj)
+        elif hasattr(obj, "__dict__"):
+            stack.append(obj.__dict__)
+    return size
+
+def memory_stores():
+    """Everything the memory report measures. Caches come first so the stores they hang off don't count them."""
+    return {
+        "action index cache": [character.actions for character in characters],
+        "notes log": notes_log,
+        "party matrix": party_matrix,
+        "name trie": name_trie,
+        "guild graph": guild_graph,
+        "history manifests": history_store.manifests if history_store is not None else None,
+        "latency stats": latency_stats,
+        "characters": characters,
+        "spells": spells,
+        "spell index": spell_index,
+        "spell query index": spell_query_index,
+        "weapons": weapons,
+        "npcs": npcs,
+        "guilds": guilds,
+        "bag of holding": bag_of_holding,
+    }
+
+def format_bytes(size):
+    for unit in ("B", "KiB", "MiB"):
+        if abs(size) < 1024:
+            return f"{size:.0f} {unit}" if unit == "B" else f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.1f} GiB"
+
+memory_snapshot = None
+
+def handle_memory_command(parts):
+    global memory_snapshot
+    import tracemalloc
+
+    if parts[-1].lower() == "off":
+        tracemalloc.stop()
+        memory_snapshot = None
+        print("Allocation tracking stopped.")
+        return
+
+    seen = set()
+    print(f"{'Store':<24}{'Retained':>12}")
+    for name, store in memory_stores().items():
+        print(f"{name:<24}{format_bytes(deep_sizeof(store, seen)):>12}")
+    del seen
+
+    if not tracemalloc.is_tracing():
+        tracemalloc.start()
+        memory_snapshot = tracemalloc.take_snapshot()
+        print("\nAllocation tracking started. Run 'memory' again to see allocation sites and growth.")
+        return
+
+    snapshot = tracemalloc.take_snapshot().filter_traces([
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, "<frozen importlib._bootstrap*>"),
+    ])
+    print("\nTop allocation sites:")
+    for stat in snapshot.statistics("lineno")[:10]:
+        frame = stat.traceback[0]
+        print(f"  {os.path.basename(frame.filename)}:{frame.lineno:<6}{format_bytes(stat.size):>12} in {stat.count} blocks")
+
+    if memory_snapshot is not None:
+        print("\nGrowth since last snapshot:")
+        for stat in snapshot.compare_to(memory_snapshot, "lineno")[:10]:
+            frame = stat.traceback[0]
+            print(f"  {os.path.basename(frame.filename)}:{frame.lineno:<6}{format_bytes(stat.size_diff):>12} ({stat.count_diff:+} blocks)")
+    memory_snapshot = snapshot
+
+profiler = None
+
+def command_label(user_input):
+    """Name a command for the latency stats without the character, NPC or town in it."""
+    parts = user_input.lower().split()
+    if parts == ["check", "data"]:
+        return "check data"
+    if "check" in parts:
+        return "[skill] check"
+    if parts[:2] == ["spells", "where"]:
+        return "spells where"
+    if parts[:3] == ["party", "what", "if"]:
+        return "party what if"
+    if "notes" in parts[1:]:
+        return "[name] notes"
+    if parts[:2] == ["shortest", "path"]:
+        return "shortest path"
+    if parts[:3] == ["who", "reacts", "to"]:
+        return "who reacts to"
+    if parts[-3:] == ["allies", "of", "allies"]:
+        return "[name] allies of allies"
+    if parts and parts[0] in ("export", "import", "archive", "history", "diff", "restore", "seed", "record"):
+        return parts[0]
+    if parts[:2] in (["roll", "on"], ["table", "stats"]):
+        return " ".join(parts[:2])
+    if len(parts) > 1 and parts[-1] in ("guilds", "spells", "turn", "reactions", "resources", "optimize", "wild", "info"):
+        return f"[name] {parts[-1]}"
+    return " ".join(parts) or "(empty)"
+
 def handle_command(user_input):
+    recorder = session_recorder if not user_input.startswith("record") else None
+    if recorder is not None:
+        recorder.begin(user_input)
+    start = time.perf_counter()
+    try:
+        if profiler is not None and not user_input.startswith("profile"):
+            return profiler.runcall(dispatch_command, user_input)
+        return dispatch_command(user_input)
+    finally:
+        elapsed = time.perf_counter() - start
+        record_latency(command_label(user_input), elapsed)
+        if recorder is not None:
+            recorder.end(elapsed)
+
+def handle_stats_command():
+    if not latency_stats:
+        print("No timings recorded yet.")
+        return
+    print(f"{'Command':<32}{'Count':>7}{'Mean ms':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'Max ms':>10}")
+    for label in sorted(latency_stats):
+        histogram = latency_stats[label]
+        print(
+            f"{label:<32}{histogram.count:>7}"
+            f"{histogram.total / histogram.count * 1000:>10.2f}"
+            f"{histogram.percentile(50) * 1000:>10.2f}"
+            f"{histogram.percentile(95) * 1000:>10.2f}"
+            f"{histogram.percentile(99) * 1000:>10.2f}"
+            f"{histogram.max * 1000:>10.2f}"
+        )
+
+def handle_profile_command(parts):
+    global profiler
+    if parts[-1].lower() == "on":
+        if profiler is None:
+            import cProfile
+            profiler = cProfile.Profile()
+        print("Profiling enabled. Type 'profile off' to see the hot spots.")
+    elif parts[-1].lower() == "off":
+        if profiler is None:
+            print("Profiling is not enabled.")
+            return
+        import pstats
+        stats = pstats.Stats(profiler, stream=sys.stdout)
+        profiler = None
+        stats.strip_dirs().sort_stats("cumulative").print_stats(20)
+    else:
+        print("Usage: profile on | profile off")
+
+def handle_record_command(parts):
+    """record <file> starts a new log that session.py can replay, archiving the data it starts from; record off stops."""
+    global session_recorder, rng
+    import session
+    if len(parts) != 2:
+        print("Usage: record <file> | record off")
+    elif parts[1].lower() == "off":
+        if session_recorder is None:
+            print("Not recording.")
+            return
+        session_recorder.close()
+        print(f"Stopped recording to {session_recorder.path}.")
+        session_recorder = None
+    elif session_recorder is not None:
+        print(f"Already recording to {session_recorder.path}. Type 'record off' first.")
+    else:
+        if not isinstance(rng, session.RecordingRandom):
+            # Carry on from the current state so recording doesn't change what gets rolled.
+            recording_rng = session.RecordingRandom()
+            recording_rng.setstate(rng.getstate())
+            rng = recording_rng
+        if os.path.exists(parts[1]):
+            print(f"{parts[1]} already exists. Record each session to a new file.")
+            return
+        try:
+            session_recorder = session.SessionRecorder(parts[1], rng, resource_path(""))
+        except OSError as e:
+            print(f"Could not start recording to {parts[1]}: {e}")
+            return
+        print(f"Recording to {parts[1]}, with the data as it stands now saved to {session.data_archive_path(parts[1])}.")
+        print(f"Replay it with: python session.py replay {parts[1]}")
+
+def dispatch_command(user_input):
     parts = user_input.split()
 
     if user_input == "quit":
         return False
     elif user_input == "help":
         display_help()
+    elif user_input == "use":
+        handle_use_command()
+    elif user_input in ("short rest", "long rest"):
+        handle_rest_command(parts[0])
+    elif user_input == "add resource":
+        handle_add_resource_command()
+    elif len(parts) > 1 and parts[-1].lower() == "resources":
+        handle_player_resources_command(parts)
+    elif user_input == "tables":
+        handle_tables_command()
+    elif parts[:2] == ["roll", "on"] and len(parts) > 2:
+        handle_roll_on_table_command(parts)
+    elif parts[:2] == ["table", "stats"] and len(parts) > 2:
+        handle_table_stats_command(parts)
+    elif parts and parts[0] == "seed":
+        handle_seed_command(parts)
+    elif len(parts) > 3 and parts[-3:] == ["allies", "of", "allies"]:
+        handle_allies_of_allies_command(parts)
+    elif parts[:2] == ["shortest", "path"]:
+        handle_shortest_path_command(parts)
+    elif parts[:3] == ["who", "reacts", "to"] and len(parts) > 3:
+        handle_who_reacts_command(parts)
+    elif user_input == "dangling references":
+        handle_dangling_references_command()
+    elif len(parts) > 1 and "notes" in parts[1:]:
+        handle_player_notes_command(parts)
+    elif user_input == "level up":
+        handle_level_up_command()
+    elif user_input == "party report":
+        handle_party_report_command()
+    elif parts[:3] == ["party", "what", "if"]:
+        handle_party_what_if_command(parts)
+    elif user_input == "party optimize":
+        handle_party_optimize_command()
+    elif len(parts) > 1 and parts[-1].lower() == "optimize":
+        handle_optimize_command(parts)
+    elif user_input == "undo":
+        handle_undo_command()
+    elif user_input == "redo":
+        handle_undo_command(redo=True)
+    elif user_input == "stats":
+        handle_stats_command()
+    elif parts and parts[0] == "record":
+        handle_record_command(parts)
+    elif len(parts) == 2 and parts[0] == "profile":
+        handle_profile_command(parts)
+    elif user_input in ("memory", "memory off"):
+        handle_memory_command(parts)
+    elif parts and parts[0] == "export":
+        handle_export_command(parts)
+    elif parts and parts[0] == "import":
+        handle_import_command(parts)
+    elif parts and parts[0] == "archive":
+        handle_archive_command(parts)
+    elif parts and parts[0] == "history" and parts[1:2] != ["check"]:
+        handle_history_command(parts)
+    elif parts and parts[0] == "diff":
+        handle_diff_command(parts)
+    elif parts and parts[0] == "restore":
+        handle_restore_command(parts)
+    elif user_input == "spells" or user_input.startswith("spells where"):
+        handle_spell_query_command("spells where " + user_input[len("spells where"):])
+    elif user_input == "check data":
+        handle_check_data_command()
     elif "check" in user_input:
         handle_check_command(parts)
     elif user_input == "add note":
@@ -1027,6 +3239,8 @@ def handle_command(user_input):
         handle_player_spells_command(parts)
     elif len(parts) > 1 and parts[-1].lower() == "turn":
         handle_player_turn_command(parts)
+    elif len(parts) > 1 and parts[-1].lower() == "reactions":
+        handle_player_reactions_command(parts)
     elif len(parts) > 1 and parts[-1].lower() == "wild":
         handle_wild_magic_command(parts)
     elif len(parts) > 1 and parts[-1].lower() == "info":
@@ -1045,51 +3259,47 @@ def handle_info_command(command_subject):
     guild = next((g for g in guilds if g.name.lower() == command_subject.lower()), None)
 
     if weapon:
-        print(weapon.display_info())
+        show_paged([weapon.display_info()])
     elif character:
-        print(character.display_info())
+        show_paged(character.info_lines(recent_notes_text(character)))
     elif npc:
-        print(npc.display_info())
+        show_paged([npc.display_info()])
     elif guild:
-        print(guild.display_info())
+        show_paged([guild.display_info()])
     else:
         print(f"No weapon, character, NPC, or guild named {command_subject} found.")
 
-def handle_character_info_command(parts):
-    character_name = " ".join(parts[:-1])
-    character = find_character_by_name(character_name)
-    if character:
-        print(character.display_info())
-    else:
-        print(f"No character named {character_name} found.")
-
-def find_character_by_name(name):
-    """
-    Find a character by name.
-
-    Args:
-    name (str): The name of the character.
-
-    Returns:
-    Character: The character object if found, None otherwise.
-    """
-    return next((char for char in characters if char.name.lower() == name.lower()), None)
 
-def find_npc_by_name(name):
+COMMAND_KEYWORDS = (
+    "help", "quit", "stats", "profile on", "profile off", "memory", "memory off", "record", "record off", "spells", "spells where",
+    "export markdown", "export html", "import", "archive", "history", "diff", "restore", "use", "short rest", "long rest", "add resource", "tables",
+    "roll on", "table stats", "seed", "party report", "party what if", "party optimize", "shortest path",
+    "who reacts to", "dangling references", "check data", "undo", "redo", "add note", "add spell", "add weapon", "add guild",
+    "add character", "add npc", "level up", "edit character", "edit npc", "add item to bag", "remove item from bag",
+    "list bag items"
+)
+# What can follow a name, and the commands a name can follow.
+NAME_SUFFIXES = ("info", "notes", "turn", "spells", "reactions", "resources", "optimize", "wild", "allies of allies")
+NAME_COMMANDS = ("who reacts to", "shortest path", "party what if", "history", "diff", "restore")
+
+def setup_completion():
+    import completion
+    commands = COMMAND_KEYWORDS + tuple(f"{skill} check" for skill in SKILL_TO_ABILITY)
+    completion.install(completion.LineCompleter(commands, NAME_SUFFIXES, NAME_COMMANDS, get_name_trie))
+
+def main(argv=None):
     """
-    Find an NPC by name.
-
-    Args:
-    name (str): The name of the NPC.
-
-    Returns:
-    NPC: The NPC object if found, None otherwise.
+    With arguments, run each one as a command and exit, e.g.
+    playassist "perception check" "Willow turn"; otherwise start the prompt.
     """
-    return next((npc for npc in npcs if npc.name.lower() == name.lower()), None)
-
-
-def main():
+    commands = sys.argv[1:] if argv is None else argv
+    if commands:
+        for command in commands:
+            if handle_command(command) is False:
+                break
+        return
     print("Welcome to the D&D CLI. Type 'help' for a list of commands.")
+    setup_completion()
     running = True
     while running:
         user_input = input("> ")
@@ -0,0 +1,169 @@
+"""
+The web of guilds, their towns, members and leaders as an indexed graph.
+
+Guilds keep members, allies and enemies as plain name lists. Here every
+name is resolved once into a node (guild, npc, character or town) and
+linked through adjacency sets, so a town's guilds, a guild's allies of
+allies or the shortest chain between two people are answered with set
+lookups and breadth-first search instead of scanning every guild. Names
+that don't resolve to anything are kept as dangling references.
+"""
+from collections import deque
+
+# Edge kinds and how they read from either end.
+EDGE_LABELS = {
+    "member": ("has member", "is a member of"),
+    "leader": ("is led by", "leads"),
+    "ally": ("is allied with", "is allied with"),
+    "enemy": ("is an enemy of", "is an enemy of"),
+    "town": ("is based in", "is home to"),
+}
+
+
+class RelationGraph:
+    def __init__(self, guilds, npc_names, character_names):
+        """
+        Args:
+        guilds (list): Guild objects.
+        npc_names (iterable): Names of every NPC.
+        character_names (iterable): Names of every player character.
+        """
+        self.names = {}
+        self.adjacency = {}
+        self.town_index = {}
+        self.dangling = []
+        for kind, names in (("npc", npc_names), ("character", character_names)):
+            for name in names:
+                self.add_node(kind, name)
+        for guild in guilds:
+            self.add_node("guild", guild.name)
+        for guild in guilds:
+            node = ("guild", guild.name.lower())
+            if guild.town:
+                town = self.add_node("town", guild.town)
+                self.link(node, town, "town")
+                self.town_index.setdefault(town[1], []).append(guild)
+            for field, names, kind in (("leader", [guild.leader], "leader"), ("members", guild.members, "member")):
+                for name in names:
+                    if not name:
+                        continue
+                    person = self.find_person(name)
+                    if person:
+                        self.link(node, person, kind)
+                    else:
+                        self.dangling.append((guild.name, field, name))
+            for field, kind in (("allies", "ally"), ("enemies", "enemy")):
+                for name in getattr(guild, field):
+                    if not name:
+                        continue
+                    other = ("guild", name.lower())
+                    if other in self.names:
+                        self.link(node, other, kind)
+                    else:
+                        self.dangling.append((guild.name, field, name))
+
+    def add_node(self, kind, name):
+        node = (kind, name.lower())
+        self.names.setdefault(node, name)
+        self.adjacency.setdefault(node, {})
+        return node
+
+    def link(self, a, b, kind):
+        self.adjacency[a].setdefault(kind, set()).add(b)
+        self.adjacency[b].setdefault(kind, set()).add(a)
+
+    def find_person(self, name):
+        for kind in ("npc", "character"):
+            node = (kind, name.lower())
+            if node in self.names:
+                return node
+        return None
+
+    def find(self, name):
+        """The node for a name, trying guilds, then characters, NPCs and towns."""
+        for kind in ("guild", "character", "npc", "town"):
+            node = (kind, name.lower())
+            if node in self.names:
+                return node
+        return None
+
+    def neighbours(self, node, kinds=None):
+        edges = self.adjacency.get(node, {})
+        return set().union(*(nodes for kind, nodes in edges.items() if kinds is None or kind in kinds))
+
+    def guilds_of(self, node):
+        """A guild is its own; a town has the guilds based there; a person has the guilds they lead or belong to."""
+        if node[0] == "guild":
+            return {node}
+        if node[0] == "town":
+            return self.neighbours(node, ("town",))
+        return self.neighbours(node, ("member", "leader"))
+
+    def town_guilds(self, town):
+        return self.town_index.get(town.lower(), [])
+
+    def allies_of_allies(self, node):
+        """Guilds two alliance steps away that aren't already direct allies, found by BFS over ally edges."""
+        start = self.guilds_of(node)
+        distance = {guild: 0 for guild in start}
+        queue = deque(start)
+        while queue:
+            current = queue.popleft()
+            if distance[current] == 2:
+                continue
+            for ally in self.neighbours(current, ("ally",)):
+                if ally not in distance:
+                    distance[ally] = distance[current] + 1
+                    queue.append(ally)
+        return self.sorted_names(guild for guild, steps in distance.items() if steps == 2)
+
+    def shortest_path(self, a, b):
+        """
+        Breadth-first search over every kind of link.
+
+        Returns:
+        list: (node, edge kind that led to it) from a to b, the first edge kind None; None if unconnected.
+        """
+        previous = {a: None}
+        queue = deque([a])
+        while queue:
+            current = queue.popleft()
+            if current == b:
+                path = []
+                while current is not None:
+                    step = previous[current]
+                    path.append((current, step[1] if step else None))
+                    current = step[0] if step else None
+                return path[::-1]
+            for kind, nodes in self.adjacency.get(current, {}).items():
+                # Sorted so ties between equally short paths always resolve the same way.
+                for node in sorted(nodes):
+                    if node not in previous:
+                        previous[node] = (current, kind)
+                        queue.append(node)
+        return None
+
+    def describe_path(self, path):
+        parts = [self.names[path[0][0]]]
+        for (before, _), (node, kind) in zip(path, path[1:]):
+            forward, backward = EDGE_LABELS[kind]
+            # Labels read from the guild's side; walking out of a person or town reads them the other way.
+            label = forward if before[0] == "guild" else backward
+            parts.append(f"{label} {self.names[node]}")
+        return " ".join(parts)
+
+    def sorted_names(self, nodes):
+        return sorted((self.names[node] for node in nodes), key=str.lower)
+
+    def reactions(self, node):
+        """
+        Which guilds would react to something done by or to this guild or person.
+
+        Returns:
+        dict: "own", "allied" and "hostile" -> sorted guild names. A guild that
+        is both allied and hostile through different links shows up in both.
+        """
+        own = self.guilds_of(node)
+        allied = set().union(*(self.neighbours(guild, ("ally",)) for guild in own)) - own
+        hostile = set().union(*(self.neighbours(guild, ("enemy",)) for guild in own)) - own
+        return {"own": self.sorted_names(own), "allied": self.sorted_names(allied), "hostile": self.sorted_names(hostile)}
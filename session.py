@@ -0,0 +1,285 @@
+"""
+Record play sessions and replay them deterministically.
+
+A session log is JSON Lines: a header, then one line per command with the
+command text, every answer typed at its prompts, the random draws it made
+and how long it took:
+
+    {"session": 2, "started": "2024-05-01T19:02:11", "data": "session.data.zip"}
+    {"command": "Willow wild", "inputs": [], "draws": [[5, 17], 0.4173], "ms": 0.41}
+
+Draws are kept as the raw values the generator produced (a float for
+random(), [bits, value] for getrandbits()), so replaying hands back exactly
+the same numbers. A command that draws a lot (table stats) stores the
+generator state it started from instead, which keeps the log small.
+
+Starting a recording packs the campaign data as it stands into an archive
+next to the log (session.data.zip for session.jsonl), since the commands
+only make sense against the characters, NPCs and tables they were typed
+against. Replaying unpacks that archive into a temporary folder and runs
+every command again through playAssist there, so the originals are never
+touched; --data replays against a copy of another folder instead:
+
+    python session.py replay session.jsonl [--data folder] [--quiet] [--output results.json]
+
+It prints the same latency table as the `stats` command, which makes a
+recorded session a realistic workload for comparing versions.
+"""
+import argparse
+import contextlib
+import importlib
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+SESSION_VERSION = 2
+# Past this many draws in one command the generator state is logged instead.
+MAX_LOGGED_DRAWS = 64
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+class ReplayError(Exception):
+    pass
+
+
+class RecordingRandom(random.Random):
+    """A random.Random that reports every value it produces to a recorder while one is attached."""
+
+    recorder = None
+
+    def random(self):
+        value = super().random()
+        if self.recorder:
+            self.recorder.draw(value)
+        return value
+
+    def getrandbits(self, k):
+        value = super().getrandbits(k)
+        if self.recorder:
+            self.recorder.draw([k, value])
+        return value
+
+
+class ReplayRandom(random.Random):
+    """Hands back the draws recorded for the current command, or runs freely from a recorded state."""
+
+    queue = None
+
+    def load(self, entry):
+        if "state" in entry:
+            version, internal, gauss = entry["state"]
+            self.setstate((version, tuple(internal), gauss))
+            self.queue = None
+        else:
+            self.queue = list(reversed(entry.get("draws", [])))
+
+    def next_draw(self):
+        if not self.queue:
+            raise ReplayError("the command drew more random numbers than were recorded")
+        return self.queue.pop()
+
+    def random(self):
+        if self.queue is None:
+            return super().random()
+        value = self.next_draw()
+        if not isinstance(value, float):
+            raise ReplayError("recorded draws don't match what the command asked for")
+        return value
+
+    def getrandbits(self, k):
+        if self.queue is None:
+            return super().getrandbits(k)
+        value = self.next_draw()
+        if not isinstance(value, list) or value[0] != k:
+            raise ReplayError("recorded draws don't match what the command asked for")
+        return value[1]
+
+
+def data_archive_path(path):
+    """Where the data a session log was recorded against is kept: session.jsonl -> session.data.zip."""
+    return os.path.splitext(path)[0] + ".data.zip"
+
+
+class SessionRecorder:
+    def __init__(self, path, rng, data_folder):
+        """
+        Start a new log at path (which must not exist yet) and pack data_folder next to it.
+
+        Raises:
+        OSError: If the log or the archive can't be written.
+        """
+        import archive
+        self.path = path
+        self.rng = rng
+        # Pack first, so a log kept in the data folder isn't archived along with it.
+        archive.pack(data_folder, data_archive_path(path))
+        self.file = open(path, "x")
+        self.entry = None
+        self.state = None
+        self.file.write(json.dumps({"session": SESSION_VERSION, "started": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                                    "data": os.path.basename(data_archive_path(path))}) + "\n")
+        self.file.flush()
+        rng.recorder = self
+
+    def begin(self, command):
+        self.entry = {"command": command, "inputs": [], "draws": []}
+        self.state = self.rng.getstate()
+
+    def input(self, text):
+        if self.entry is not None:
+            self.entry["inputs"].append(text)
+
+    def draw(self, value):
+        if self.entry is not None:
+            self.entry["draws"].append(value)
+
+    def end(self, seconds):
+        if self.entry is None:
+            return
+        if len(self.entry["draws"]) > MAX_LOGGED_DRAWS:
+            version, internal, gauss = self.state
+            del self.entry["draws"]
+            self.entry["state"] = [version, list(internal), gauss]
+        self.entry["ms"] = round(seconds * 1000, 3)
+        self.file.write(json.dumps(self.entry, separators=(",", ":")) + "\n")
+        self.file.flush()
+        self.entry = None
+
+    def close(self):
+        self.rng.recorder = None
+        self.file.close()
+
+
+def read_header(path):
+    """The first line of a session log."""
+    with open(path, "r") as f:
+        return json.loads(f.readline() or "{}")
+
+
+def read_session(path):
+    """Yield the command entries of a session log, skipping headers (logs from version 1 could hold several)."""
+    with open(path, "r") as f:
+        for line in f:
+            if line.strip():
+                entry = json.loads(line)
+                if "command" in entry:
+                    yield entry
+
+
+def copy_campaign(source, destination):
+    """Copy the campaign data (JSON, JSON Lines and the tables folder) without any code or caches."""
+    for name in os.listdir(source):
+        path = os.path.join(source, name)
+        if os.path.isfile(path) and name.endswith((".json", ".jsonl")):
+            shutil.copy2(path, destination)
+    if os.path.isdir(os.path.join(source, "tables")):
+        shutil.copytree(os.path.join(source, "tables"), os.path.join(destination, "tables"))
+
+
+def replay(path, module, quiet=False):
+    """
+    Run every recorded command through module (an imported playAssist).
+
+    Returns:
+    list: (command, error message) for commands that didn't replay cleanly.
+    """
+    replay_rng = ReplayRandom()
+    module.rng = replay_rng
+    module.paging = False
+    problems = []
+    for entry in read_session(path):
+        answers = list(reversed(entry["inputs"]))
+
+        def ask(prompt):
+            if not answers:
+                raise ReplayError(f"ran out of recorded answers at the prompt '{prompt.strip()}'")
+            answer = answers.pop()
+            if not quiet:
+                print(f"{prompt}{answer}")
+            return answer
+
+        module.ask = ask
+        replay_rng.load(entry)
+        with contextlib.ExitStack() as stack:
+            if quiet:
+                stack.enter_context(contextlib.redirect_stdout(stack.enter_context(open(os.devnull, "w"))))
+            else:
+                print(f"> {entry['command']}")
+            try:
+                module.handle_command(entry["command"])
+                if answers:
+                    raise ReplayError(f"{len(answers)} recorded answer(s) were never asked for")
+                if replay_rng.queue:
+                    raise ReplayError(f"{len(replay_rng.queue)} recorded draw(s) were never used")
+            except ReplayError as e:
+                problems.append((entry["command"], str(e)))
+    return problems
+
+
+def latency_summary(histogram):
+    return {
+        "count": histogram.count,
+        "mean_ms": histogram.total / histogram.count * 1000,
+        "p50_ms": histogram.percentile(50) * 1000,
+        "p95_ms": histogram.percentile(95) * 1000,
+        "p99_ms": histogram.percentile(99) * 1000,
+        "max_ms": histogram.max * 1000
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Replay a recorded playAssist session.")
+    parser.add_argument("mode", choices=["replay"])
+    parser.add_argument("log", help="the session log written by the 'record' command")
+    parser.add_argument("--data", help="campaign folder to copy and replay against "
+                                       "(default: the data archived when the session was recorded)")
+    parser.add_argument("--quiet", action="store_true", help="don't show command output, only the timings")
+    parser.add_argument("--output", help="also write the latency table as JSON to this file")
+    args = parser.parse_args(argv)
+
+    import archive
+    header = read_header(args.log)
+    baseline = None
+    if args.data is None and header.get("data"):
+        baseline = os.path.join(os.path.dirname(os.path.abspath(args.log)), header["data"])
+        if not os.path.exists(baseline):
+            print(f"Error: {args.log} was recorded against {baseline}, which is missing. "
+                  f"Pass --data to replay against another folder.")
+            return 1
+    elif args.data is None:
+        args.data = os.environ.get("PLAYASSIST_DATA_DIR", REPO_DIR)
+        print(f"{args.log} doesn't say what data it was recorded against; replaying against {args.data}.")
+
+    with tempfile.TemporaryDirectory(prefix="playassist-replay-") as directory:
+        if baseline:
+            try:
+                archive.unpack(baseline, directory)
+            except ValueError as e:
+                print(f"Error: {e}")
+                return 1
+        else:
+            copy_campaign(args.data, directory)
+        os.environ["PLAYASSIST_DATA_DIR"] = directory
+        os.environ["PLAYASSIST_SNAPSHOT"] = "0"
+        if REPO_DIR not in sys.path:
+            sys.path.insert(0, REPO_DIR)
+        module = importlib.import_module("playAssist")
+        start = time.perf_counter()
+        problems = replay(args.log, module, args.quiet)
+        elapsed = time.perf_counter() - start
+        print(f"\nReplayed {args.log} in {elapsed:.2f}s.")
+        module.handle_stats_command()
+        if args.output:
+            with open(args.output, "w") as f:
+                json.dump({label: latency_summary(histogram) for label, histogram in module.latency_stats.items()}, f, indent=4)
+    for command, problem in problems:
+        print(f"Didn't replay cleanly: '{command}': {problem}")
+    return 1 if problems else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,105 @@
+"""
+Binary snapshot of the fully built campaign stores.
+
+A snapshot is one pickle holding every object of every store as its
+attribute dict, taken after the stores were built (spell references
+resolved, action indexes filled in), together with the mtime, size and
+SHA-256 of every file they were built from. restore_objects puts those
+dicts back into fresh instances without running from_dict or rebuilding
+any index. It holds no application classes, so it reads the same
+whichever way playAssist was started (as a script, where its classes live
+in __main__, or imported by the playassist launcher), and it is read with
+an unpickler that refuses anything but built-in types.
+
+It is used only while all of those files are unchanged. When the mtime and
+size match, the hashes are not checked. When only the mtime moved, the
+hash decides. Anything missing, stale or unreadable makes load_snapshot
+return None so the caller falls back to the JSON files.
+"""
+import hashlib
+import os
+import pickle
+
+SNAPSHOT_VERSION = 3
+PLAIN_TYPES = {"dict", "list", "tuple", "str", "int", "float", "bool", "set", "frozenset"}
+
+
+class PlainUnpickler(pickle.Unpickler):
+    def find_class(self, module, name):
+        # Anything beyond built-in containers (such as an older snapshot of live objects) means "not a snapshot we can use".
+        if module == "builtins" and name in PLAIN_TYPES:
+            return super().find_class(module, name)
+        raise pickle.UnpicklingError(f"unexpected {module}.{name} in snapshot")
+
+
+def restore_objects(cls, states):
+    """Instances of cls with exactly the attributes saved from vars(obj), skipping __init__."""
+    objects = []
+    for state in states:
+        obj = cls.__new__(cls)
+        obj.__dict__.update(state)
+        objects.append(obj)
+    return objects
+
+
+def file_hash(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def describe(path):
+    """The (mtime_ns, size, sha256) key for one source file, or None if it doesn't exist."""
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return {"mtime_ns": stat.st_mtime_ns, "size": stat.st_size, "sha256": file_hash(path)}
+
+
+def is_current(path, expected):
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return expected is None
+    if expected is None or stat.st_size != expected["size"]:
+        return False
+    if stat.st_mtime_ns == expected["mtime_ns"]:
+        return True
+    return file_hash(path) == expected["sha256"]
+
+
+def load_snapshot(snapshot_path, source_paths):
+    """Return the data saved with save_snapshot if every source file is unchanged, else None."""
+    try:
+        with open(snapshot_path, "rb") as f:
+            snapshot = PlainUnpickler(f).load()
+        if snapshot.get("version") != SNAPSHOT_VERSION or set(snapshot["files"]) != set(source_paths):
+            return None
+        if not all(is_current(path, expected) for path, expected in snapshot["files"].items()):
+            return None
+        return snapshot["data"]
+    except Exception:
+        # A snapshot is only ever a cache; any problem reading it means "rebuild from JSON".
+        return None
+
+
+def save_snapshot(snapshot_path, source_paths, data):
+    """Write data to snapshot_path keyed by the current state of source_paths. Failures are ignored."""
+    snapshot = {
+        "version": SNAPSHOT_VERSION,
+        "files": {path: describe(path) for path in source_paths},
+        "data": data
+    }
+    temp_path = snapshot_path + ".tmp"
+    try:
+        with open(temp_path, "wb") as f:
+            pickle.dump(snapshot, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temp_path, snapshot_path)
+    except (OSError, pickle.PicklingError):
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
@@ -0,0 +1,209 @@
+"""
+Random tables with weighted and ranged entries.
+
+A table file is a JSON object whose keys are die results or ranges:
+
+    {"1": "...", "2": "..."}
+    {"01-02": "...", "03-10": "...", "00": "..."}    ("00" is 100)
+
+or a list of entries with explicit weights or ranges:
+
+    [{"weight": 3, "result": "..."}, {"range": "4-6", "result": "..."}]
+
+A range weighs as much as the number of rolls it covers. Ranges may not
+overlap or leave gaps, since a die result has to name exactly one entry.
+A result can pull in a draw from another table with [[table name]].
+
+Sampling uses the alias method, so each draw is O(1) however big or
+lopsided the table is, and every draw takes an explicit random.Random so
+results can be seeded and replayed.
+"""
+import os
+import json
+import re
+
+NESTED_TABLE = re.compile(r"\[\[([^\]]+)\]\]")
+MAX_NESTING = 10
+
+
+class AliasSampler:
+    """Walker/Vose alias table: O(n) to build, O(1) to sample an index by weight."""
+
+    def __init__(self, weights):
+        count = len(weights)
+        if not count:
+            raise ValueError("a table needs at least one entry")
+        total = float(sum(weights))
+        if total <= 0:
+            raise ValueError("table weights must add up to more than zero")
+        scaled = [weight * count / total for weight in weights]
+        self.probability = [0.0] * count
+        self.alias = [0] * count
+        small = [i for i, p in enumerate(scaled) if p < 1.0]
+        large = [i for i, p in enumerate(scaled) if p >= 1.0]
+        while small and large:
+            less, more = small.pop(), large.pop()
+            self.probability[less] = scaled[less]
+            self.alias[less] = more
+            scaled[more] = scaled[more] + scaled[less] - 1.0
+            (small if scaled[more] < 1.0 else large).append(more)
+        for i in large + small:
+            self.probability[i] = 1.0
+
+    def sample(self, rng):
+        column = rng.randrange(len(self.probability))
+        return column if rng.random() < self.probability[column] else self.alias[column]
+
+
+def parse_roll(text):
+    value = int(text)
+    return 100 if value == 0 and text.strip() == "00" else value
+
+
+def parse_range(text):
+    """'01-02' -> (1, 2), '7' -> (7, 7)."""
+    low, _, high = str(text).partition("-")
+    low = parse_roll(low)
+    high = parse_roll(high) if high else low
+    if high < low:
+        raise ValueError(f"bad range '{text}'")
+    return low, high
+
+
+def check_ranges(entries):
+    """Raise ValueError if the ranged entries overlap or leave a gap between them."""
+    def label(low, high):
+        return str(low) if low == high else f"{low}-{high}"
+
+    ranges = sorted((low, high) for low, high, _, _ in entries if low is not None)
+    for (low, high), (next_low, next_high) in zip(ranges, ranges[1:]):
+        if next_low <= high:
+            raise ValueError(f"entries {label(low, high)} and {label(next_low, next_high)} overlap")
+        if next_low > high + 1:
+            raise ValueError(f"no entry covers {label(high + 1, next_low - 1)}")
+
+
+class RandomTable:
+    def __init__(self, name, entries):
+        """entries: (low, high, weight, result) tuples; low/high are None for purely weighted entries."""
+        check_ranges(entries)
+        self.name = name
+        self.entries = entries
+        self.sampler = AliasSampler([weight for _, _, weight, _ in entries])
+        self.total_weight = sum(weight for _, _, weight, _ in entries)
+
+    @classmethod
+    def from_json(cls, name, data):
+        entries = []
+        if isinstance(data, dict):
+            for key, result in data.items():
+                low, high = parse_range(key)
+                entries.append((low, high, high - low + 1, result))
+        else:
+            for entry in data:
+                if "range" in entry:
+                    low, high = parse_range(entry["range"])
+                    entries.append((low, high, entry.get("weight", high - low + 1), entry["result"]))
+                else:
+                    entries.append((None, None, entry.get("weight", 1), entry["result"]))
+        return cls(name, entries)
+
+    def label(self, index):
+        low, high, _, _ = self.entries[index]
+        if low is None:
+            return f"#{index + 1}"
+        return str(low) if low == high else f"{low}-{high}"
+
+    def roll(self, rng):
+        """Return (entry index, die result) for one draw; the die result is None for weighted entries."""
+        index = self.sampler.sample(rng)
+        low, high, _, _ = self.entries[index]
+        return index, (rng.randint(low, high) if low is not None else None)
+
+
+class TableSet:
+    """A collection of named tables whose results can refer to each other."""
+
+    def __init__(self, tables=None):
+        self.tables = {}
+        # Files that couldn't be loaded as tables, as messages.
+        self.problems = []
+        for table in tables or ():
+            self.add(table)
+
+    def add(self, table):
+        self.tables[table.name.lower()] = table
+
+    def get(self, name):
+        return self.tables.get(name.lower())
+
+    def names(self):
+        return sorted(table.name for table in self.tables.values())
+
+    def expand(self, result, rng, depth=0):
+        """Replace every [[table]] in a result with a draw from that table."""
+        if not isinstance(result, str) or "[[" not in result:
+            return result
+        if depth >= MAX_NESTING:
+            raise ValueError("table references nest too deeply (is a table referring to itself?)")
+
+        def draw_nested(match):
+            table = self.get(match.group(1).strip())
+            if table is None:
+                return match.group(0)
+            index, _ = table.roll(rng)
+            return str(self.expand(table.entries[index][3], rng, depth + 1))
+
+        return NESTED_TABLE.sub(draw_nested, result)
+
+    def draw(self, name, rng):
+        """Return (die result, expanded result) for one draw from the named table."""
+        table = self.get(name)
+        if table is None:
+            raise KeyError(name)
+        index, roll = table.roll(rng)
+        return roll, self.expand(table.entries[index][3], rng)
+
+    def draw_many(self, name, count, rng):
+        return [self.draw(name, rng) for _ in range(count)]
+
+    def frequencies(self, name, count, rng):
+        """
+        Draw `count` times and compare how often each entry came up with how often it should.
+
+        Returns:
+        list: (entry label, expected share, observed share, hits) per entry, in table order.
+        """
+        table = self.get(name)
+        if table is None:
+            raise KeyError(name)
+        hits = [0] * len(table.entries)
+        for _ in range(count):
+            hits[table.sampler.sample(rng)] += 1
+        return [
+            (table.label(i), weight / table.total_weight, hits[i] / count, hits[i])
+            for i, (_, _, weight, _) in enumerate(table.entries)
+        ]
+
+
+def load_tables(folder, extra_files=()):
+    """
+    Load every *.json file in `folder` as a table named after the file, plus
+    any (name, path) pairs in extra_files. Missing files and folders are skipped.
+    A file that isn't a valid table is skipped too, and listed in the set's problems.
+    """
+    table_set = TableSet()
+    paths = list(extra_files)
+    if os.path.isdir(folder):
+        for filename in sorted(os.listdir(folder)):
+            if filename.endswith(".json"):
+                paths.append((filename[:-5].replace("_", " "), os.path.join(folder, filename)))
+    for name, path in paths:
+        try:
+            with open(path, "r") as f:
+                table_set.add(RandomTable.from_json(name, json.load(f)))
+        except FileNotFoundError:
+            continue
+        except (ValueError, KeyError, TypeError, AttributeError) as e:
+            table_set.problems.append(f"{os.path.basename(path)}: {type(e).__name__}: {e}")
+    return table_set